@@ -0,0 +1,29 @@
+"""
+Measures the throughput of get_bulk_data against the local mock GitHub server, for several concurrency levels.
+Run from the root of the project: python benchmarks/bench_crawler.py
+"""
+import os
+import sys
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import codecompasslib.API.get_bulk_data as bulk
+from benchmarks.mock_github import MockGitHubServer
+
+
+def main(user_amount: int = 20, latency: float = 0.05) -> None:
+    with MockGitHubServer(latency=latency) as server:
+        bulk.API_URL = server.url
+        bulk.RESPONSE_CACHE = None  # Measure the requests, not the cache
+        for max_in_flight in (1, 4, 16, 32):
+            server.request_count = 0
+            start: float = perf_counter()
+            users: list = bulk.get_bulk_data(user_amount, max_in_flight=max_in_flight)
+            elapsed: float = perf_counter() - start
+            print(f"max_in_flight={max_in_flight:>3}: {len(users)} users, {server.request_count} requests in "
+                  f"{elapsed:.2f}s ({server.request_count / elapsed:.1f} req/s)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""
+Compares the size of an embedded dataset stored as CSV, Parquet and Feather, and the time taken to load it back.
+Run from the root of the project: python benchmarks/bench_dataset_formats.py
+"""
+import os
+import sys
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from pandas import DataFrame
+from codecompasslib.API.drive_operations import DATASET_FORMATS, read_dataset, write_dataset
+
+
+def embedded_dataset(repo_amount: int, dimensions: int) -> DataFrame:
+    """
+    Builds a dataset shaped like the output of generate_embedded_dataset.
+    """
+    rng: np.random.Generator = np.random.default_rng(0)
+    df: DataFrame = DataFrame(rng.standard_normal((repo_amount, dimensions), dtype=np.float32).astype(np.float16),
+                              columns=[f'embedding_{i}' for i in range(dimensions)])
+    df.insert(0, 'id', np.arange(repo_amount, dtype=np.int64))
+    df.insert(1, 'owner_user', [f'owner-{i % 5000}' for i in range(repo_amount)])
+    return df
+
+
+def main(repo_amount: int = 100000, dimensions: int = 256) -> None:
+    df: DataFrame = embedded_dataset(repo_amount, dimensions)
+    with TemporaryDirectory() as directory:
+        for file_format in DATASET_FORMATS:
+            path: str = os.path.join(directory, f'dataset.{file_format}')
+            start: float = perf_counter()
+            write_dataset(df, path, file_format)
+            write_elapsed: float = perf_counter() - start
+            start = perf_counter()
+            read_dataset(path, file_format)
+            read_elapsed: float = perf_counter() - start
+            print(f"{file_format:>8}: {os.path.getsize(path) / 2 ** 20:7.1f} MiB, write {write_elapsed:5.2f}s, "
+                  f"load {read_elapsed:5.2f}s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
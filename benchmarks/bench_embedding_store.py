@@ -0,0 +1,74 @@
+"""
+Compares loading the embedded dataset from Parquet with opening it as a memory-mapped EmbeddingStore, and gathering
+the embeddings of random repositories from a DataFrame indexed by id and from the store. Also compares merging new
+and changed embeddings into the dataset with concat and drop_duplicates with upserting them into the store.
+Run from the root of the project: python benchmarks/bench_embedding_store.py
+"""
+import os
+import sys
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from pandas import DataFrame, concat, read_parquet
+from codecompasslib.embeddings.embedding_store import EmbeddingStore
+from benchmarks.bench_dataset_formats import embedded_dataset
+
+
+def main(repo_amount: int = 200000, dimensions: int = 256, gathered: int = 10000) -> None:
+    df: DataFrame = embedded_dataset(repo_amount, dimensions)
+    wanted: np.ndarray = np.random.default_rng(1).choice(df['id'].to_numpy(), gathered)
+    with TemporaryDirectory() as directory:
+        parquet_path: str = os.path.join(directory, 'embedded.parquet')
+        df.to_parquet(parquet_path, index=False, compression='zstd')
+        EmbeddingStore.save(df, os.path.join(directory, 'store'))
+        del df
+
+        start: float = perf_counter()
+        loaded: DataFrame = read_parquet(parquet_path)
+        parquet_elapsed: float = perf_counter() - start
+        start = perf_counter()
+        store: EmbeddingStore = EmbeddingStore(os.path.join(directory, 'store'))
+        open_elapsed: float = perf_counter() - start
+        start = perf_counter()
+        store.to_dataframe()
+        dataframe_elapsed: float = perf_counter() - start
+        print(f"Load {repo_amount} repositories: Parquet {parquet_elapsed:.3f}s, EmbeddingStore open "
+              f"{open_elapsed * 1000:.2f}ms + to_dataframe {dataframe_elapsed:.3f}s", file=sys.stderr)
+
+        indexed: DataFrame = loaded.set_index('id')
+        columns: list = [f'embedding_{i}' for i in range(dimensions)]
+        start = perf_counter()
+        indexed.loc[wanted, columns].to_numpy()
+        loc_elapsed: float = perf_counter() - start
+        start = perf_counter()
+        store.gather(wanted)
+        gather_elapsed: float = perf_counter() - start
+        print(f"Gather {gathered} embeddings by id: DataFrame.loc {loc_elapsed:.3f}s, EmbeddingStore.gather "
+              f"{gather_elapsed:.3f}s", file=sys.stderr)
+
+
+def main_upsert(repo_amount: int = 200000, dimensions: int = 256, updated: int = 2000) -> None:
+    df: DataFrame = embedded_dataset(repo_amount, dimensions)
+    update: DataFrame = embedded_dataset(updated, dimensions)
+    # Half of the update changes existing repositories, the other half adds new ones
+    update['id'] = np.concatenate([df['id'].to_numpy()[:updated // 2], -np.arange(1, updated - updated // 2 + 1)])
+    with TemporaryDirectory() as directory:
+        store: EmbeddingStore = EmbeddingStore.save(df, os.path.join(directory, 'store'))
+
+        start: float = perf_counter()
+        merged: DataFrame = concat([update, df], axis=0).drop_duplicates(subset='id', keep='first')
+        merged.to_parquet(os.path.join(directory, 'embedded.parquet'), index=False, compression='zstd')
+        merge_elapsed: float = perf_counter() - start
+        start = perf_counter()
+        store.upsert(update)
+        upsert_elapsed: float = perf_counter() - start
+        print(f"Update {updated} of {repo_amount} repositories: concat + drop_duplicates + write {merge_elapsed:.3f}s, "
+              f"EmbeddingStore.upsert {upsert_elapsed:.3f}s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
+    main_upsert()
@@ -0,0 +1,51 @@
+"""
+Compares the memory used by crawled repositories kept as a list of get_repo_fields dictionaries and as a RepoBatch,
+and the time taken to convert each of them to a DataFrame.
+Run from the root of the project: python benchmarks/bench_records.py
+"""
+import os
+import sys
+import tracemalloc
+from time import perf_counter
+from typing import Callable, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pandas import DataFrame
+from codecompasslib.API.helper_functions import get_repo_fields
+from codecompasslib.API.repo_records import RepoBatch
+from benchmarks.mock_github import MockGitHubServer
+
+
+def measure(build: Callable[[], object]) -> Tuple[object, int]:
+    """
+    Builds an object and measures the memory it holds on to.
+    """
+    tracemalloc.start()
+    built: object = build()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return built, size
+
+
+def main(repo_amount: int = 200000, owners: int = 2000) -> None:
+    with MockGitHubServer() as server:
+        # Fresh dictionaries per repository, as the JSON decoder of the responses produces them
+        payloads: list = [server.repo(f'owner-{i % owners}', i) for i in range(repo_amount)]
+
+    records, records_size = measure(lambda: [get_repo_fields(payload) for payload in payloads])
+    batch, batch_size = measure(lambda: RepoBatch(get_repo_fields(payload) for payload in payloads))
+    print(f"{repo_amount} repositories: list of dicts {records_size / 2 ** 20:.1f} MiB, "
+          f"RepoBatch {batch_size / 2 ** 20:.1f} MiB ({records_size / batch_size:.1f}x smaller)", file=sys.stderr)
+
+    start: float = perf_counter()
+    DataFrame(records)
+    records_elapsed: float = perf_counter() - start
+    start = perf_counter()
+    batch.to_dataframe()
+    batch_elapsed: float = perf_counter() - start
+    print(f"To DataFrame: list of dicts {records_elapsed:.2f}s, RepoBatch {batch_elapsed:.2f}s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
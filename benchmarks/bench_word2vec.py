@@ -0,0 +1,95 @@
+"""
+Compares vectorizing repository descriptions with word2vec word by word, as vectorize_text did through
+DataFrame.apply, with the corpus vectorizer, and loading the model from the binary word2vec format with loading it
+memory-mapped from the native gensim format. The word vectors are random, with the dimensions of the Stack Overflow
+model, so the model file is not needed.
+Run from the root of the project: python benchmarks/bench_word2vec.py
+"""
+import os
+import sys
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from gensim.models.keyedvectors import KeyedVectors
+from pandas import Series
+from codecompasslib.embeddings.word2vec_vectorizer import Word2VecVectorizer, load_word2vec_model
+
+
+def word_loop(text: str, word_vect: KeyedVectors) -> np.ndarray:
+    # The previous vectorize_text
+    vector_sum = np.zeros(word_vect.vector_size)
+    count = 0
+    for word in text.split():
+        if word in word_vect.key_to_index:
+            vector_sum += word_vect[word]
+            count += 1
+    return vector_sum / count if count > 0 else vector_sum
+
+
+def descriptions(amount: int, vocabulary: list, seed: int = 0) -> Series:
+    """
+    Returns descriptions of 3 to 20 words, with about one word in ten out of the vocabulary and some repeated texts
+    """
+    rng: np.random.Generator = np.random.default_rng(seed)
+    words: np.ndarray = np.array(vocabulary + [f'unknown{i}' for i in range(len(vocabulary) // 9)])
+    texts: list = [' '.join(words[rng.integers(0, len(words), rng.integers(3, 21))]) for _ in range(amount)]
+    for i in rng.integers(0, amount, amount // 10):
+        texts[i] = texts[0]
+    return Series(texts)
+
+
+def main(amount: int = 100000, vocabulary_size: int = 200000, dimensions: int = 200) -> None:
+    rng: np.random.Generator = np.random.default_rng(1)
+    word_vect: KeyedVectors = KeyedVectors(dimensions)
+    vocabulary: list = [f'word{i}' for i in range(vocabulary_size)]
+    word_vect.add_vectors(vocabulary, rng.standard_normal((vocabulary_size, dimensions)).astype(np.float32))
+    texts: Series = descriptions(amount, vocabulary)
+
+    start: float = perf_counter()
+    expected: np.ndarray = np.stack(texts.apply(lambda text: word_loop(text, word_vect)).tolist())
+    loop_elapsed: float = perf_counter() - start
+
+    vectorizer: Word2VecVectorizer = Word2VecVectorizer(word_vect)
+    start = perf_counter()
+    vectors: np.ndarray = vectorizer.vectorize_many(texts.tolist())
+    corpus_elapsed: float = perf_counter() - start
+    start = perf_counter()
+    vectorizer.vectorize_many(texts.tolist())
+    cached_elapsed: float = perf_counter() - start
+
+    assert np.allclose(vectors, expected, atol=1e-5)
+    print(f"Vectorize {amount} descriptions: word loop {loop_elapsed:.2f}s, corpus vectorizer {corpus_elapsed:.2f}s, "
+          f"again with cached token ids {cached_elapsed:.2f}s", file=sys.stderr)
+
+
+def main_loading(vocabulary_size: int = 1000000, dimensions: int = 200) -> None:
+    rng: np.random.Generator = np.random.default_rng(1)
+    word_vect: KeyedVectors = KeyedVectors(dimensions)
+    word_vect.add_vectors([f'word{i}' for i in range(vocabulary_size)],
+                          rng.standard_normal((vocabulary_size, dimensions)).astype(np.float32))
+    with TemporaryDirectory() as directory:
+        model_path: str = os.path.join(directory, 'vectors.bin')
+        native_path: str = os.path.join(directory, 'vectors.kv')
+        word_vect.save_word2vec_format(model_path, binary=True)
+        del word_vect
+
+        start: float = perf_counter()
+        KeyedVectors.load_word2vec_format(model_path, binary=True)
+        binary_elapsed: float = perf_counter() - start
+        start = perf_counter()
+        load_word2vec_model(model_path, native_path)
+        conversion_elapsed: float = perf_counter() - start
+        start = perf_counter()
+        KeyedVectors.load(native_path, mmap='r')
+        native_elapsed: float = perf_counter() - start
+        print(f"Load {vocabulary_size} word vectors: word2vec binary {binary_elapsed:.2f}s, first load with the "
+              f"conversion {conversion_elapsed:.2f}s, memory-mapped native model {native_elapsed:.2f}s",
+              file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
+    main_loading()
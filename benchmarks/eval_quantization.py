@@ -0,0 +1,65 @@
+"""
+Evaluates the quantized embeddings against the full precision ones: memory footprint, query speed, and recall@k of
+the searches on the codes, and of the searches scored again at full precision. The embeddings are those of the
+embedded dataset written by generate_embedded_dataset.py, loaded through the configured storage, or random vectors
+when no file ID is given. Some rows are held out of the dataset and used as queries.
+Run from the root of the project: python benchmarks/eval_quantization.py [file ID of the embedded dataset]
+"""
+import os
+import sys
+from time import perf_counter
+from typing import Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from codecompasslib.API.storage import get_storage
+from codecompasslib.embeddings.embedding_store import load_embeddings
+from codecompasslib.embeddings.quantization import QuantizedEmbeddings, exact_search, recall_at_k
+
+
+def synthetic_embeddings(rows: int, dimensions: int, rank: int = 32, seed: int = 0) -> np.ndarray:
+    """
+    Returns float16 vectors close to a random low dimensional subspace, as text embeddings mostly are, standing in for
+    the embeddings of repositories
+    """
+    rng: np.random.Generator = np.random.default_rng(seed)
+    vectors: np.ndarray = rng.standard_normal((rows, rank)) @ rng.standard_normal((rank, dimensions))
+    return (vectors + 0.3 * rng.standard_normal((rows, dimensions))).astype(np.float16)
+
+
+def main(file_id: Optional[str] = None, repo_amount: int = 200000, dimensions: int = 256, queries: int = 200,
+         k: int = 10) -> None:
+    embeddings: np.ndarray = (synthetic_embeddings(repo_amount, dimensions) if file_id is None
+                              else load_embeddings(get_storage(), file_id).matrix)
+    held_out: np.ndarray = np.zeros(len(embeddings), dtype=bool)
+    held_out[np.random.default_rng(1).choice(len(embeddings), queries, replace=False)] = True
+    query_vectors: np.ndarray = np.asarray(embeddings[held_out], dtype=np.float32)
+    vectors: np.ndarray = np.asarray(embeddings[~held_out])
+
+    start: float = perf_counter()
+    exact_rows, _ = exact_search(vectors, query_vectors, k)
+    exact_elapsed: float = perf_counter() - start
+    print(f"{len(vectors)} embeddings of {vectors.shape[1]} dimensions, {queries} queries, recall@{k}", file=sys.stderr)
+    float32_size: float = vectors.shape[0] * vectors.shape[1] * 4 / 2 ** 20
+    print(f"float32 {float32_size:.1f} MiB, float16 {vectors.nbytes / 2 ** 20:.1f} MiB, exact search "
+          f"{exact_elapsed / queries * 1000:.2f}ms per query", file=sys.stderr)
+
+    for method in ('int8', 'pq'):
+        start = perf_counter()
+        quantized: QuantizedEmbeddings = QuantizedEmbeddings.build(vectors, method)
+        build_elapsed: float = perf_counter() - start
+        start = perf_counter()
+        rows, _ = quantized.search(query_vectors, k)
+        search_elapsed: float = perf_counter() - start
+        start = perf_counter()
+        reranked_rows, _ = quantized.search(query_vectors, k, vectors=vectors)
+        rerank_elapsed: float = perf_counter() - start
+        print(f"{method}: {quantized.nbytes / 2 ** 20:.1f} MiB, built in {build_elapsed:.1f}s, "
+              f"{search_elapsed / queries * 1000:.2f}ms per query with recall {recall_at_k(exact_rows, rows):.3f}, "
+              f"{rerank_elapsed / queries * 1000:.2f}ms per query with recall "
+              f"{recall_at_k(exact_rows, reranked_rows):.3f} scored again at full precision", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1] if len(sys.argv) > 1 else None)
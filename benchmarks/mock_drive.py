@@ -0,0 +1,213 @@
+"""
+A local stand-in for the parts of the Google Drive v3 API used by codecompasslib.API.drive_operations, so the Drive
+transfers can be tested and benchmarked without credentials or network access.
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from hashlib import md5
+from json import dumps, loads
+from re import match
+from threading import Lock, Thread
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+
+class MockDriveServer:
+    """
+    Serves the file listing (/drive/v3/files, paginated with nextPageToken), the file metadata
+    (/drive/v3/files/{id}) and the file contents (/drive/v3/files/{id}?alt=media, with HTTP Range support), and
+    takes resumable uploads (/upload/drive/v3/files, POST to create a file and PATCH to update one).
+    The listing only understands the name = '...' clause of the q parameter, every other clause matches every file.
+    """
+
+    def __init__(self, page_size: int = 100) -> None:
+        """
+        :param page_size: The largest page of the listing, whatever pageSize the client asks for.
+        """
+        self.page_size: int = page_size
+        self.files: Dict[str, dict] = {}  # id -> metadata, with the contents under 'content'
+        self.request_count: int = 0
+        self.range_requests: int = 0
+        self.bytes_sent: int = 0
+        self.paths: List[str] = []
+        self.uploads: Dict[str, dict] = {}  # upload_id -> session, with the bytes received under 'data'
+        self.upload_requests: int = 0
+        self.largest_upload_request: int = 0
+        self.persist_limit: Optional[int] = None  # At most this many bytes of an upload request are kept
+        self.drop_uploads: int = 0  # How many of the next upload requests are cut off half way, without an answer
+        self._lock: Lock = Lock()
+        self._server: ThreadingHTTPServer = ThreadingHTTPServer(('127.0.0.1', 0), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread: Optional[Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self) -> 'MockDriveServer':
+        self._thread = Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> 'MockDriveServer':
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def add_file(self, file_id: str, name: str, content: bytes, modified_time: str = '2024-01-01T00:00:00.000Z',
+                 mime_type: str = 'application/octet-stream') -> dict:
+        """
+        Stores a file, replacing the one with the same id if any.
+        """
+        self.files[file_id] = {
+            'id': file_id,
+            'name': name,
+            'mimeType': mime_type,
+            'md5Checksum': md5(content).hexdigest(),
+            'modifiedTime': modified_time,
+            'size': str(len(content)),  # Drive reports sizes as strings
+            'content': content,
+        }
+        return self.files[file_id]
+
+    def _handler_class(self) -> type:
+        server: 'MockDriveServer' = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args) -> None:
+                pass
+
+            def do_GET(self) -> None:
+                with server._lock:
+                    server.request_count += 1
+                    server.paths.append(self.path)
+
+                parsed = urlparse(self.path)
+                query: dict = {key: values[-1] for key, values in parse_qs(parsed.query).items()}
+                parts: List[str] = parsed.path.strip('/').split('/')
+
+                if parts == ['drive', 'v3', 'files']:
+                    self._list(query)
+                elif len(parts) == 4 and parts[:3] == ['drive', 'v3', 'files'] and parts[3] in server.files:
+                    file: dict = server.files[parts[3]]
+                    if query.get('alt') == 'media':
+                        self._media(file['content'])
+                    else:
+                        self._send_json({key: value for key, value in file.items() if key != 'content'})
+                else:
+                    self._send_json({'error': {'code': 404, 'message': 'File not found'}}, 404)
+
+            def do_POST(self) -> None:
+                self._start_upload()
+
+            def do_PATCH(self) -> None:
+                self._start_upload()
+
+            def _start_upload(self) -> None:
+                parsed = urlparse(self.path)
+                parts: List[str] = parsed.path.strip('/').split('/')
+                metadata: dict = loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                if parts[:4] != ['upload', 'drive', 'v3', 'files'] or 'uploadType=resumable' not in parsed.query:
+                    self._send_json({'error': {'code': 400, 'message': 'Only resumable uploads are supported'}}, 400)
+                    return
+                if len(parts) == 5 and parts[4] not in server.files:
+                    self._send_json({'error': {'code': 404, 'message': 'File not found'}}, 404)
+                    return
+
+                with server._lock:
+                    upload_id: str = str(len(server.uploads))
+                    file_id: str = parts[4] if len(parts) == 5 else f'uploaded-{upload_id}'
+                    previous: dict = server.files.get(file_id, {})
+                    server.uploads[upload_id] = {
+                        'file_id': file_id,
+                        'name': metadata.get('name', previous.get('name', file_id)),
+                        'mime_type': metadata.get('mimeType', previous.get('mimeType', 'application/octet-stream')),
+                        'data': bytearray(),
+                    }
+                self.send_response(200)
+                self.send_header('Location', f'{server.url}/upload/drive/v3/files?uploadType=resumable'
+                                             f'&upload_id={upload_id}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def do_PUT(self) -> None:
+                query: dict = {key: values[-1] for key, values in parse_qs(urlparse(self.path).query).items()}
+                body: bytes = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                upload: Optional[dict] = server.uploads.get(query.get('upload_id', ''))
+                content_range = match(r'bytes (\*|(\d+)-(\d+))/(\*|\d+)', self.headers.get('Content-Range', ''))
+                if upload is None or content_range is None:
+                    self._send_json({'error': {'code': 404, 'message': 'Upload session not found'}}, 404)
+                    return
+
+                with server._lock:
+                    server.upload_requests += 1
+                    server.largest_upload_request = max(server.largest_upload_request, len(body))
+                    data: bytearray = upload['data']
+                    if content_range.group(2) is not None:
+                        start: int = int(content_range.group(2))
+                        if start > len(data):
+                            self._send_json({'error': {'code': 400, 'message': 'Bytes missing'}}, 400)
+                            return
+                        body = body[len(data) - start:]  # Bytes sent again are ignored
+                        if server.drop_uploads:
+                            server.drop_uploads -= 1
+                            data += body[:len(body) // 2]
+                            self.close_connection = True
+                            return
+                        data += body[:server.persist_limit]
+                    total: Optional[int] = None if content_range.group(4) == '*' else int(content_range.group(4))
+
+                    if total is not None and len(data) == total:
+                        file: dict = server.add_file(upload['file_id'], upload['name'], bytes(data),
+                                                     mime_type=upload['mime_type'])
+                        self._send_json({'id': file['id']})
+                        return
+                self.send_response(308)
+                if data:
+                    self.send_header('Range', f'bytes=0-{len(data) - 1}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def _list(self, query: dict) -> None:
+                name: Optional[str] = None
+                name_clause = match(r".*name = '([^']*)'", query.get('q', ''))
+                if name_clause:
+                    name = name_clause.group(1)
+                files: list = [{'id': file['id'], 'name': file['name']} for file in server.files.values()
+                               if name is None or file['name'] == name]
+
+                page_size: int = min(int(query.get('pageSize', 100)), server.page_size)
+                start: int = int(query.get('pageToken', 0))
+                payload: dict = {'files': files[start:start + page_size]}
+                if start + page_size < len(files):
+                    payload['nextPageToken'] = str(start + page_size)
+                self._send_json(payload)
+
+            def _media(self, content: bytes) -> None:
+                status: int = 200
+                byte_range = match(r'bytes=(\d+)-(\d+)', self.headers.get('Range', ''))
+                if byte_range:
+                    start, end = int(byte_range.group(1)), int(byte_range.group(2))
+                    content = content[start:end + 1]
+                    status = 206
+                with server._lock:
+                    server.range_requests += status == 206
+                    server.bytes_sent += len(content)
+                self._send(status, content, 'application/octet-stream')
+
+            def _send_json(self, payload: dict, status: int = 200) -> None:
+                self._send(status, dumps(payload).encode(), 'application/json')
+
+            def _send(self, status: int, body: bytes, content_type: str) -> None:
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
@@ -0,0 +1,254 @@
+"""
+A local stand-in for the parts of the GitHub REST API used by codecompasslib.API, so the crawlers can be tested and
+benchmarked without a token or network access. The data is generated deterministically from the user names.
+"""
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from hashlib import md5
+from json import dumps
+from threading import Lock, Thread
+from time import sleep, time
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, urlencode, urlparse
+from zlib import crc32
+
+
+class MockGitHubServer:
+    """
+    Serves /search/users, /search/repositories, /users/{user}/followers, /users/{user}/following,
+    /users/{user}/repos and /users/{user}/starred with Link pagination, X-RateLimit headers and ETags (If-None-Match
+    is answered with a 304 that does not count against the quota). Users whose name contains 'missing' do not exist
+    and answer with a 404.
+    Every repository search matches the same search_results repositories, created search_per_day a day from
+    2015-01-01, and only their first 1000 can be paged through; queries containing 'missing' answer with a 422.
+    """
+
+    def __init__(self, followers_per_user: int = 250, following_per_user: int = 120, repos_per_user: int = 30,
+                 latency: float = 0.0, rate_limit: int = 5000, search_results: int = 1500,
+                 search_per_day: int = 5) -> None:
+        """
+        :param followers_per_user: How many followers every user has.
+        :param following_per_user: How many users every user follows.
+        :param repos_per_user: How many repositories every user owns and stars.
+        :param latency: Seconds every response is delayed by, to simulate the network.
+        :param rate_limit: The quota reported in the X-RateLimit headers.
+        :param search_results: How many repositories every repository search matches.
+        :param search_per_day: How many of them were created every day.
+        """
+        self.followers_per_user: int = followers_per_user
+        self.following_per_user: int = following_per_user
+        self.repos_per_user: int = repos_per_user
+        self.latency: float = latency
+        self.rate_limit: int = rate_limit
+        self.search_results: int = search_results
+        self.search_per_day: int = search_per_day
+        self.remaining: int = rate_limit
+        self.requests_by_token: Dict[str, int] = {}  # Counted requests per Authorization header
+        self.request_count: int = 0
+        self.not_modified_count: int = 0
+        self.fail_next: int = 0  # How many of the next requests answer with a 502
+        self.fail_paths: List[str] = []  # Paths (with their query) that always answer with a 502
+        self.pushes: Dict[str, Dict[int, str]] = {}  # owner -> repo index -> pushed_at overriding the default
+        self.paths: List[str] = []
+        self._lock: Lock = Lock()
+        self._server: ThreadingHTTPServer = ThreadingHTTPServer(('127.0.0.1', 0), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread: Optional[Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self) -> 'MockGitHubServer':
+        self._thread = Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> 'MockGitHubServer':
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def followers(self, user: str) -> List[str]:
+        return [f'{user}-follower-{i}' for i in range(self.followers_per_user)]
+
+    def following(self, user: str) -> List[str]:
+        return [f'{user}-following-{i}' for i in range(self.following_per_user)]
+
+    def push(self, owner: str, index: int, pushed_at: str) -> None:
+        """
+        Simulates a push to a repository, creating it if the index is past repos_per_user.
+        """
+        self.pushes.setdefault(owner, {})[index] = pushed_at
+
+    def repo(self, owner: str, index: int) -> dict:
+        """
+        Builds a repository payload with every field read by helper_functions.get_repo_fields.
+        """
+        pushed_at: str = self.pushes.get(owner, {}).get(index, f'2024-01-{index % 28 + 1:02d}T00:00:00Z')
+        return {
+            'id': crc32(f'{owner}/{index}'.encode()),
+            'name': f'{owner}-repo-{index}',
+            'owner': {'login': owner, 'type': 'User'},
+            'description': f'Repository {index} of {owner}',
+            'url': f'{self.url}/repos/{owner}/{owner}-repo-{index}',
+            'fork': False,
+            'created_at': '2020-01-01T00:00:00Z',
+            'updated_at': '2024-01-01T00:00:00Z',
+            'pushed_at': pushed_at,
+            'size': 100 + index,
+            'stargazers_count': index,
+            'watchers_count': index,
+            'language': ['Python', 'Go', 'Rust'][index % 3],
+            'has_issues': True,
+            'has_projects': False,
+            'has_downloads': True,
+            'has_wiki': False,
+            'has_pages': False,
+            'has_discussions': False,
+            'forks': index,
+            'archived': False,
+            'disabled': False,
+            'is_template': False,
+            'license': {'name': 'MIT License'} if index % 2 else None,
+            'open_issues': index % 5,
+            'topics': ['mock', f'topic-{index % 4}'],
+        }
+
+    def search_repo(self, index: int) -> dict:
+        repo: dict = self.repo('search', index)
+        created: date = date(2015, 1, 1) + timedelta(days=index // self.search_per_day)
+        return {**repo, 'created_at': f'{created.isoformat()}T00:00:00Z'}
+
+    def _search_repos(self, query: str) -> list:
+        # Only the created:A..B qualifier filters the results, the rest of the query is ignored
+        created: List[str] = [term[len('created:'):] for term in query.split() if term.startswith('created:')]
+        repos: list = [self.search_repo(i) for i in range(self.search_results)]
+        if created:
+            start, end = created[0].split('..')
+            repos = [repo for repo in repos if start <= repo['created_at'][:10] <= end]
+        return repos
+
+    def expected_users(self, seed_users: List[str]) -> set:
+        users: set = set(seed_users)
+        for user in seed_users:
+            users.update(self.followers(user))
+            users.update(self.following(user))
+        return users
+
+    def _rate_limit_headers(self, authorization: str, counted: bool = True) -> Dict[str, str]:
+        # Every token has its own quota of rate_limit requests, self.remaining tracks all of them together
+        with self._lock:
+            if counted:
+                self.remaining = max(self.remaining - 1, 0)
+                self.requests_by_token[authorization] = self.requests_by_token.get(authorization, 0) + 1
+            return {
+                'X-RateLimit-Limit': str(self.rate_limit),
+                'X-RateLimit-Remaining': str(max(self.rate_limit - self.requests_by_token.get(authorization, 0), 0)),
+                'X-RateLimit-Reset': str(int(time()) + 3600),
+            }
+
+    def _collection(self, kind: str, user: str, sort: Optional[str] = None) -> list:
+        if kind == 'followers':
+            return [{'login': login} for login in self.followers(user)]
+        if kind == 'following':
+            return [{'login': login} for login in self.following(user)]
+
+        owner: str = user if kind == 'repos' else f'{user}-starred'
+        indexes: set = set(range(self.repos_per_user)) | set(self.pushes.get(owner, {}))
+        repos: list = [self.repo(owner, i) for i in sorted(indexes)]
+        if sort == 'pushed':
+            repos.sort(key=lambda repo: repo['pushed_at'], reverse=True)
+        return repos
+
+    def _handler_class(self) -> type:
+        server: 'MockGitHubServer' = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args) -> None:
+                pass
+
+            def do_GET(self) -> None:
+                with server._lock:
+                    server.request_count += 1
+                    server.paths.append(self.path)
+                    failing: bool = server.fail_next > 0
+                    server.fail_next -= failing
+                    failing = failing or self.path in server.fail_paths
+                if server.latency:
+                    sleep(server.latency)
+
+                if failing:
+                    self._send(502, {'message': 'Server Error'})
+                    return
+
+                parsed = urlparse(self.path)
+                query: dict = {key: values[-1] for key, values in parse_qs(parsed.query).items()}
+                per_page: int = int(query.get('per_page', 30))
+                page: int = int(query.get('page', 1))
+                parts: List[str] = parsed.path.strip('/').split('/')
+
+                if parts == ['search', 'users']:
+                    items: list = [{'login': f'seed-{i}'} for i in range(per_page)]
+                    self._send(200, {'total_count': len(items), 'items': items})
+                elif parts == ['search', 'repositories']:
+                    if 'missing' in query.get('q', ''):
+                        self._send(422, {'message': 'Validation Failed'})
+                        return
+                    items = server._search_repos(query.get('q', ''))
+                    start: int = (page - 1) * per_page
+                    if start + per_page > 1000:
+                        self._send(422, {'message': 'Only the first 1000 search results are available'})
+                        return
+                    headers: Dict[str, str] = {}
+                    if start + per_page < min(len(items), 1000):
+                        next_query: dict = {**query, 'page': page + 1}
+                        headers['Link'] = f'<{server.url}{parsed.path}?{urlencode(next_query)}>; rel="next"'
+                    self._send(200, {'total_count': len(items), 'items': items[start:start + per_page]}, headers)
+                elif len(parts) == 3 and parts[0] == 'users' and parts[2] in ('followers', 'following', 'repos',
+                                                                              'starred'):
+                    if 'missing' in parts[1]:
+                        self._send(404, {'message': 'Not Found'})
+                        return
+                    items = server._collection(parts[2], parts[1], query.get('sort'))
+                    start = (page - 1) * per_page
+                    headers = {}
+                    if start + per_page < len(items):
+                        next_query = {**query, 'page': page + 1}
+                        headers['Link'] = f'<{server.url}{parsed.path}?{urlencode(next_query)}>; rel="next"'
+                    self._send(200, items[start:start + per_page], headers)
+                else:
+                    self._send(404, {'message': 'Not Found'})
+
+            def _send(self, status: int, payload, headers: Optional[Dict[str, str]] = None) -> None:
+                body: bytes = dumps(payload).encode()
+                etag: str = f'"{md5(body).hexdigest()}"'
+                if status == 200 and self.headers.get('If-None-Match') == etag:
+                    with server._lock:
+                        server.not_modified_count += 1
+                    self.send_response(304)
+                    self.send_header('ETag', etag)
+                    authorization: str = self.headers.get('Authorization', '')
+                    for key, value in server._rate_limit_headers(authorization, counted=False).items():
+                        self.send_header(key, value)
+                    self.end_headers()
+                    return
+
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                if status == 200:
+                    self.send_header('ETag', etag)
+                rate_limit_headers: dict = server._rate_limit_headers(self.headers.get('Authorization', ''))
+                for key, value in {**rate_limit_headers, **(headers or {})}.items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
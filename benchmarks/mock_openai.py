@@ -0,0 +1,128 @@
+"""
+A local stand-in for the embeddings endpoint of the OpenAI API, so the embedding jobs can be tested and benchmarked
+without an API key or network access. The embeddings are generated deterministically from the texts.
+"""
+from base64 import b64encode
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from json import dumps, loads
+from threading import Lock, Thread
+from time import sleep
+from typing import List, Optional
+from zlib import crc32
+import numpy as np
+
+
+class MockOpenAIServer:
+    """
+    Serves POST /v1/embeddings, with the embeddings as JSON lists or base64 as asked by encoding_format.
+    The next rate_limited requests answer with a 429 and a retry-after-ms header, the next failing ones with a 500.
+    """
+
+    def __init__(self, latency: float = 0.0, retry_after_ms: int = 50) -> None:
+        """
+        :param latency: Seconds every response is delayed by, to simulate the network.
+        :param retry_after_ms: The wait asked for by the 429 answers.
+        """
+        self.latency: float = latency
+        self.retry_after_ms: int = retry_after_ms
+        self.rate_limited: int = 0
+        self.failing: int = 0
+        self.request_count: int = 0
+        self.texts_embedded: int = 0
+        self.in_flight: int = 0
+        self.max_in_flight: int = 0
+        self.batches: List[List[str]] = []  # The texts of every successful request
+        self._lock: Lock = Lock()
+        self._server: ThreadingHTTPServer = ThreadingHTTPServer(('127.0.0.1', 0), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread: Optional[Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}/v1'
+
+    def start(self) -> 'MockOpenAIServer':
+        self._thread = Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> 'MockOpenAIServer':
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    @staticmethod
+    def embedding(text: str, dimensions: int) -> np.ndarray:
+        """
+        :return: The embedding the server answers for a text, a unit vector.
+        """
+        vector: np.ndarray = np.random.default_rng(crc32(text.encode())).standard_normal(dimensions)
+        return (vector / np.linalg.norm(vector)).astype(np.float32)
+
+    def _handler_class(self) -> type:
+        server: 'MockOpenAIServer' = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args) -> None:
+                pass
+
+            def do_POST(self) -> None:
+                body: dict = loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+                with server._lock:
+                    server.request_count += 1
+                    server.in_flight += 1
+                    server.max_in_flight = max(server.max_in_flight, server.in_flight)
+                    rate_limited: bool = server.rate_limited > 0
+                    server.rate_limited -= rate_limited
+                    failing: bool = not rate_limited and server.failing > 0
+                    server.failing -= failing
+                try:
+                    if server.latency:
+                        sleep(server.latency)
+                    if self.path.rstrip('/') != '/v1/embeddings':
+                        self._send_json({'error': {'message': 'Not found', 'type': 'invalid_request_error'}}, 404)
+                    elif rate_limited:
+                        self._send_json({'error': {'message': 'Rate limit reached for tokens per min (TPM)',
+                                                   'type': 'tokens', 'code': 'rate_limit_exceeded'}}, 429,
+                                        {'retry-after-ms': str(server.retry_after_ms)})
+                    elif failing:
+                        self._send_json({'error': {'message': 'The server had an error', 'type': 'server_error'}}, 500)
+                    else:
+                        self._embeddings(body)
+                finally:
+                    with server._lock:
+                        server.in_flight -= 1
+
+            def _embeddings(self, body: dict) -> None:
+                texts: List[str] = [body['input']] if isinstance(body['input'], str) else body['input']
+                dimensions: int = body.get('dimensions', 256)
+                data: list = []
+                for index, text in enumerate(texts):
+                    vector: np.ndarray = server.embedding(text, dimensions)
+                    encoded = b64encode(vector.tobytes()).decode() if body.get('encoding_format') == 'base64' \
+                        else vector.tolist()
+                    data.append({'object': 'embedding', 'index': index, 'embedding': encoded})
+                tokens: int = sum(len(text.split()) for text in texts)
+                with server._lock:
+                    server.texts_embedded += len(texts)
+                    server.batches.append(texts)
+                self._send_json({'object': 'list', 'data': data, 'model': body.get('model'),
+                                 'usage': {'prompt_tokens': tokens, 'total_tokens': tokens}})
+
+            def _send_json(self, payload: dict, status: int = 200, headers: Optional[dict] = None) -> None:
+                body: bytes = dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
@@ -0,0 +1,80 @@
+from asyncio import as_completed, gather, get_running_loop
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterator, Optional
+from codecompasslib.API.crawl_state import CrawlState
+from codecompasslib.API.metrics import METRICS
+from codecompasslib.API.paginator import DEFAULT_MAX_ITEMS, Page
+
+# Streams the pages of logins of a user's list ('followers' or 'following'), starting at the given URL if any
+PageStream = Callable[[str, str, Optional[str], Optional[int]], Iterator[Page]]
+LISTS: tuple = ('followers', 'following')
+
+
+def walk_list(state: CrawlState, stream_pages: PageStream, login: str, kind: str, depth: int,
+              max_items: Optional[int] = DEFAULT_MAX_ITEMS) -> bool:
+    """
+    Walks a followers/following list from where it stopped, recording every page in the crawl state.
+    :param state: The crawl state.
+    :param stream_pages: The function streaming the pages of the list.
+    :param login: The user whose list it is.
+    :param kind: 'followers' or 'following'.
+    :param depth: The BFS level of the user.
+    :param max_items: The maximum amount of users to read from the list, None for no limit.
+    :return: A boolean indicating if the list was read completely.
+    """
+    next_url: Optional[str] = None
+    fetched: int = 0
+    cursor = state.cursor(login, kind)
+    if cursor is not None:
+        next_url, fetched = cursor
+        if next_url == '':
+            return True
+
+    try:
+        remaining: Optional[int] = None if max_items is None else max_items - fetched
+        for page in stream_pages(login, kind, next_url, remaining):
+            fetched += len(page.records)
+            state.record_page(login, kind, depth + 1, page.records, page.next_url, fetched)
+        return True
+    except Exception as err:
+        print(f"An error occurred with user: {login} {kind}: {err}")
+        return False
+
+
+async def crawl_users(state: CrawlState, stream_pages: PageStream, max_depth: int = 1, max_in_flight: int = 8,
+                      max_items: Optional[int] = DEFAULT_MAX_ITEMS) -> set:
+    """
+    Expands the users of the crawl state breadth first with their followers and following, up to max_depth hops from
+    the seed users, keeping at most max_in_flight requests in flight.
+    The lists are walked by blocking functions, running in a thread pool so the event loop can keep scheduling the
+    other users while a page is being downloaded. Everything is recorded in the crawl state, so a crawl interrupted
+    at any point resumes from the last committed pages, and users whose lists failed are retried.
+    :param state: The crawl state, with the seed users at depth 0.
+    :param stream_pages: The function streaming the pages of a list.
+    :param max_depth: How many hops to expand from the seed users (1: only their direct followers/following).
+    :param max_in_flight: The maximum amount of requests sent at the same time.
+    :param max_items: The maximum amount of users to read from every list, None for no limit.
+    :return: Every user discovered by the crawl.
+    """
+    loop = get_running_loop()
+    count: int = 1
+
+    with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        async def expand(login: str, depth: int) -> bool:
+            flags: list = await gather(*(
+                loop.run_in_executor(executor, walk_list, state, stream_pages, login, kind, depth, max_items)
+                for kind in LISTS
+            ))
+            if all(flags):
+                state.mark_expanded(login)
+            return all(flags)
+
+        for depth in range(max_depth):
+            for task in as_completed([expand(login, depth) for login in state.frontier(depth)]):
+                if await task:
+                    METRICS.increment('users_expanded')
+                    print("Count: ", count)
+                    count += 1
+            state.flush()
+
+    return state.users()
@@ -0,0 +1,145 @@
+from os import makedirs
+from os.path import dirname
+from sqlite3 import Connection, connect
+from threading import Lock
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+class CrawlState:
+    """
+    The state of a user crawl, persisted in a SQLite database so an interrupted crawl can resume where it stopped:
+    every discovered user with its BFS depth, which users are fully expanded, and where the pagination of each
+    followers/following list stopped.
+    Writes are buffered and committed in batches of batch_size pages. A page and the cursor pointing after it are
+    always committed in the same transaction, so a crash loses at most the last batch, never consistency.
+    """
+
+    def __init__(self, path: str = ':memory:', batch_size: int = 20) -> None:
+        """
+        :param path: The path of the SQLite database, ':memory:' for a crawl that is not persisted.
+        :param batch_size: How many pages are buffered before they are committed.
+        """
+        if path != ':memory:':
+            makedirs(dirname(path) or '.', exist_ok=True)
+        self.path: str = path
+        self.batch_size: int = batch_size
+        self._connection: Connection = connect(path, check_same_thread=False)
+        self._connection.executescript('''
+            CREATE TABLE IF NOT EXISTS users (
+                login TEXT PRIMARY KEY,
+                depth INTEGER NOT NULL,
+                expanded INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS users_frontier ON users (depth, expanded);
+            CREATE TABLE IF NOT EXISTS cursors (
+                login TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                next_url TEXT NOT NULL,  -- '' once the list is complete
+                fetched INTEGER NOT NULL,
+                PRIMARY KEY (login, kind)
+            );
+        ''')
+        self._pending_users: List[Tuple[str, int]] = []
+        self._pending_cursors: Dict[Tuple[str, str], Tuple[str, int]] = {}
+        self._pending_expanded: List[str] = []
+        self._pending_pages: int = 0
+        self._lock: Lock = Lock()
+
+    def is_empty(self) -> bool:
+        with self._lock:
+            return self._connection.execute('SELECT 1 FROM users LIMIT 1').fetchone() is None
+
+    def add_seeds(self, logins: Iterable[str]) -> None:
+        """
+        Adds the users the crawl starts from, at depth 0.
+        :param logins: The seed users.
+        :return: Does not return anything.
+        """
+        with self._lock:
+            self._connection.executemany('INSERT OR IGNORE INTO users (login, depth) VALUES (?, 0)',
+                                         [(login,) for login in logins])
+            self._connection.commit()
+
+    def frontier(self, depth: int) -> List[str]:
+        """
+        Gets the users of a BFS level that still have to be expanded.
+        :param depth: The BFS level.
+        :return: A list of users.
+        """
+        self.flush()
+        with self._lock:
+            rows = self._connection.execute('SELECT login FROM users WHERE depth = ? AND expanded = 0 ORDER BY login',
+                                            (depth,)).fetchall()
+        return [row[0] for row in rows]
+
+    def cursor(self, login: str, kind: str) -> Optional[Tuple[str, int]]:
+        """
+        Gets where the pagination of a list stopped.
+        :param login: The user.
+        :param kind: The list, 'followers' or 'following'.
+        :return: None if the list was never started, else the URL of the next page ('' if the list is complete)
+        and how many records were already fetched.
+        """
+        with self._lock:
+            if (login, kind) in self._pending_cursors:
+                return self._pending_cursors[(login, kind)]
+            row = self._connection.execute('SELECT next_url, fetched FROM cursors WHERE login = ? AND kind = ?',
+                                           (login, kind)).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def record_page(self, login: str, kind: str, depth: int, logins: List[str], next_url: str, fetched: int) -> None:
+        """
+        Buffers a page of a list: the users found in it and the cursor of the list after it.
+        :param login: The user whose list it is.
+        :param kind: The list, 'followers' or 'following'.
+        :param depth: The BFS level of the users found.
+        :param logins: The users found.
+        :param next_url: The URL of the next page, '' on the last page.
+        :param fetched: How many records of the list were fetched so far.
+        :return: Does not return anything.
+        """
+        with self._lock:
+            self._pending_users.extend((found, depth) for found in logins)
+            self._pending_cursors[(login, kind)] = (next_url, fetched)
+            self._pending_pages += 1
+            if self._pending_pages >= self.batch_size:
+                self._flush()
+
+    def mark_expanded(self, login: str) -> None:
+        with self._lock:
+            self._pending_expanded.append(login)
+
+    def users(self) -> set:
+        """
+        :return: Every user discovered so far.
+        """
+        self.flush()
+        with self._lock:
+            return {row[0] for row in self._connection.execute('SELECT login FROM users')}
+
+    def flush(self) -> None:
+        """
+        Commits the buffered writes in a single transaction.
+        :return: Does not return anything.
+        """
+        with self._lock:
+            self._flush()
+
+    def _flush(self) -> None:
+        with self._connection:
+            self._connection.executemany('INSERT OR IGNORE INTO users (login, depth) VALUES (?, ?)',
+                                         self._pending_users)
+            self._connection.executemany('INSERT OR REPLACE INTO cursors VALUES (?, ?, ?, ?)',
+                                         [(login, kind, next_url, fetched) for (login, kind), (next_url, fetched)
+                                          in self._pending_cursors.items()])
+            self._connection.executemany('UPDATE users SET expanded = 1 WHERE login = ?',
+                                         [(login,) for login in self._pending_expanded])
+        self._pending_users = []
+        self._pending_cursors = {}
+        self._pending_expanded = []
+        self._pending_pages = 0
+
+    def close(self) -> None:
+        self.flush()
+        with self._lock:
+            self._connection.close()
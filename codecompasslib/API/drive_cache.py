@@ -0,0 +1,162 @@
+"""
+A local, content-addressed cache of the files downloaded from Google Drive. The files are stored under their MD5
+checksum and indexed by Drive file id, so a download is skipped when the md5Checksum and modifiedTime reported by Drive
+still match the local copy. The least recently used files are evicted once the cache grows past max_bytes.
+"""
+from hashlib import md5
+from os import close, makedirs, remove, replace
+from os.path import exists, getsize, join
+from sqlite3 import Connection, connect
+from tempfile import mkstemp
+from threading import Lock
+from time import time
+from typing import Optional
+from codecompasslib.API.helper_functions import OUTER_PATH
+
+DRIVE_CACHE_DIR: str = OUTER_PATH + '/.cache/drive'
+
+
+def file_md5(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """
+    This function computes the MD5 checksum of a file, as reported by Drive in md5Checksum.
+    :param path: The path of the file.
+    :param chunk_size: How many bytes are read at a time.
+    :return: The hexadecimal checksum.
+    """
+    digest = md5()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class DriveCache:
+    """
+    A cache of Drive files on the local disk. Two Drive files with the same content share a single local copy.
+    It is thread safe.
+    """
+
+    def __init__(self, root: str = DRIVE_CACHE_DIR, max_bytes: int = 4 * 1024 ** 3) -> None:
+        """
+        :param root: The directory of the cache, created if it does not exist.
+        :param max_bytes: The maximum size of the cached files.
+        """
+        self.root: str = root
+        self.max_bytes: int = max_bytes
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+        self._size: int = 0
+        self._connection: Optional[Connection] = None
+        self._lock: Lock = Lock()
+
+    def _connect(self) -> Connection:
+        # The index is only opened on first use, so importing drive_operations does not touch the disk
+        if self._connection is None:
+            makedirs(join(self.root, 'blobs'), exist_ok=True)
+            self._connection = connect(join(self.root, 'index.sqlite'), check_same_thread=False)
+            self._connection.execute('CREATE TABLE IF NOT EXISTS files (file_id TEXT PRIMARY KEY, md5 TEXT, '
+                                     'modified_time TEXT, size INTEGER, last_used REAL)')
+            self._size = self._connection.execute(
+                'SELECT COALESCE(SUM(size), 0) FROM (SELECT DISTINCT md5, size FROM files)').fetchone()[0]
+        return self._connection
+
+    def path(self, checksum: str) -> str:
+        """
+        :param checksum: The MD5 checksum of a file.
+        :return: The path the file is stored at.
+        """
+        return join(self.root, 'blobs', checksum)
+
+    def lookup(self, file_id: str, metadata: dict) -> Optional[str]:
+        """
+        Gets the local copy of a Drive file, if it is still up to date, marking it as recently used.
+        :param file_id: The ID of the file.
+        :param metadata: The md5Checksum and modifiedTime of the file, as reported by Drive.
+        :return: The path of the local copy, or None if there is no up-to-date one.
+        """
+        with self._lock:
+            connection: Connection = self._connect()
+            row = connection.execute('SELECT md5, modified_time FROM files WHERE file_id = ?', (file_id,)).fetchone()
+            if row is None or row != (metadata.get('md5Checksum'), metadata.get('modifiedTime')) \
+                    or not exists(self.path(row[0])):
+                return None
+            connection.execute('UPDATE files SET last_used = ? WHERE file_id = ?', (time(), file_id))
+            connection.commit()
+            self.hits += 1
+            return self.path(row[0])
+
+    def staging_path(self) -> str:
+        """
+        Creates an empty file in the cache directory to download a file to, so it can be moved in place atomically.
+        :return: The path of the file.
+        """
+        makedirs(self.root, exist_ok=True)
+        descriptor, path = mkstemp(dir=self.root, suffix='.part')
+        close(descriptor)
+        return path
+
+    def store(self, file_id: str, metadata: dict, downloaded_path: str) -> bool:
+        """
+        Moves a downloaded file into the cache, evicting the least recently used files if the cache is full.
+        Every download counts as a miss, whether it can be stored or not.
+        :param file_id: The ID of the file.
+        :param metadata: The md5Checksum and modifiedTime of the file, as reported by Drive.
+        :param downloaded_path: The path of the downloaded file, see staging_path.
+        :return: A boolean indicating if the file was stored, at path(md5Checksum). If not, the downloaded file is
+        left where it is.
+        """
+        with self._lock:
+            self.misses += 1
+        checksum: Optional[str] = metadata.get('md5Checksum')
+        size: int = getsize(downloaded_path)
+        # Files exported from Google Docs have no checksum, and a corrupted download must not be cached
+        if not checksum or size > self.max_bytes or file_md5(downloaded_path) != checksum:
+            return False
+
+        with self._lock:
+            connection: Connection = self._connect()
+            known: bool = connection.execute('SELECT 1 FROM files WHERE md5 = ?', (checksum,)).fetchone() is not None
+            previous = connection.execute('SELECT md5, size FROM files WHERE file_id = ?', (file_id,)).fetchone()
+            replace(downloaded_path, self.path(checksum))
+            connection.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)',
+                               (file_id, checksum, metadata.get('modifiedTime'), size, time()))
+            if not known:
+                self._size += size
+            if previous and previous[0] != checksum:
+                self._release(connection, previous[0], previous[1])
+
+            while self._size > self.max_bytes:
+                oldest_id, oldest_md5, oldest_size = connection.execute(
+                    'SELECT file_id, md5, size FROM files ORDER BY last_used LIMIT 1').fetchone()
+                connection.execute('DELETE FROM files WHERE file_id = ?', (oldest_id,))
+                self._release(connection, oldest_md5, oldest_size)
+                self.evictions += 1
+            connection.commit()
+        return True
+
+    def _release(self, connection: Connection, checksum: str, size: int) -> None:
+        # A local copy is only deleted once no Drive file refers to it anymore
+        if connection.execute('SELECT 1 FROM files WHERE md5 = ?', (checksum,)).fetchone() is None:
+            if exists(self.path(checksum)):
+                remove(self.path(checksum))
+            self._size -= size
+
+    def stats(self) -> dict:
+        """
+        :return: The hit/miss counters and the current size of the cache.
+        """
+        downloads: int = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / downloads if downloads else 0.0,
+            'evictions': self.evictions,
+            'size_bytes': self._size,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
@@ -1,39 +1,129 @@
 from codecompasslib.API.helper_functions import OUTER_PATH
-from pandas import DataFrame, read_csv
-from io import BytesIO
+from pandas import DataFrame, read_csv, read_feather, read_parquet
+from io import BytesIO, IOBase
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.http import MediaFileUpload, MediaIoBaseDownload, MediaDownloadProgress
-from googleapiclient.discovery import build
-from os.path import join
-from tempfile import gettempdir
+from googleapiclient.discovery import Resource, build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+from datetime import datetime, timedelta
+from json import loads
+from threading import Lock, local
+from concurrent.futures import ThreadPoolExecutor
+from requests import Response
+from requests.exceptions import ConnectionError, Timeout
+from os import remove
+from os.path import exists
+from typing import Iterable, Iterator, List, Optional
+import pyarrow as pa
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+from codecompasslib.API.drive_cache import DriveCache
+from codecompasslib.API.http_session import get_http_client
 
 
 # If modifying these scopes, delete the file token.json.
 SCOPES: list = ['https://www.googleapis.com/auth/drive']
 DRIVE_ID: str = "0AL1DtB4TdEWdUk9PVA"
 DATA_FOLDER: str = "13JitBJQLNgMvFwx4QJcvrmDwKOYAShVx"
+EMBEDDED_DATASET_ID: str = "139wi78iRzhwGZwxmI5WALoYocR-Rk9By"  # The embedded dataset the frontend serves
+# Set to None to always download the files in full
+DRIVE_CACHE: Optional[DriveCache] = DriveCache()
+DRIVE_API_URL: str = "https://www.googleapis.com"
+DOWNLOAD_CHUNK_SIZE: int = 16 * 1024 * 1024  # Files larger than this are downloaded in parallel Range requests
+DOWNLOAD_WORKERS: int = 8
+LIST_PAGE_SIZE: int = 1000  # The largest page files().list accepts
+UPLOAD_CHUNK_SIZE: int = 8 * 1024 * 1024  # Must be a multiple of 256 KiB, the unit Drive persists uploads in
+UPLOAD_ROWS_PER_BATCH: int = 50000  # How many rows of a DataFrame are serialized at a time when uploading
+UPLOAD_RESUMES: int = 5  # How many times an interrupted chunk is resumed before the upload is given up
+# The dataset formats, by file extension, with their MIME type
+DATASET_FORMATS: dict = {
+    'csv': 'text/csv',
+    'parquet': 'application/vnd.apache.parquet',
+    'feather': 'application/vnd.apache.arrow.file',
+}
+REFRESH_MARGIN: timedelta = timedelta(minutes=5)  # Credentials are refreshed this long before they expire
+
+_creds: Optional[Credentials] = None
+_discovery_document: Optional[dict] = None
+_services: local = local()
+_drive_lock: Lock = Lock()
+
+
+def creds_expire_soon(creds: Credentials) -> bool:
+    """
+    Check whether the credentials expire within REFRESH_MARGIN, so they can be refreshed before a request fails
+    :param creds: Credentials object
+    :return: A boolean indicating whether the credentials must be refreshed
+    """
+    if not creds.valid:
+        return True
+    return creds.expiry is not None and creds.expiry - datetime.utcnow() < REFRESH_MARGIN
 
 
 def get_creds_drive() -> Credentials:
     """
-    Get the credentials for the Google Drive API
-    :return: None
+    Get the credentials for the Google Drive API. They are read from token.json once per process, and refreshed
+    ahead of their expiry on the next call.
+    :return: Credentials object
     """
-    creds: Credentials = Credentials.from_authorized_user_file(OUTER_PATH + "/secrets/token.json", SCOPES)
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-        else:
-            flow: InstalledAppFlow = InstalledAppFlow.from_client_secrets_file(OUTER_PATH + "/secrets/credentials.json",
-                                                                               SCOPES)
-            creds = flow.run_local_server(port=0)
-        with open(OUTER_PATH + "/secrets/token.json", "w") as token:
-            token.write(creds.to_json())
-    return creds
-
-    
+    global _creds
+    with _drive_lock:
+        if _creds is None:
+            _creds = Credentials.from_authorized_user_file(OUTER_PATH + "/secrets/token.json", SCOPES)
+        if creds_expire_soon(_creds):
+            if _creds.refresh_token:
+                _creds.refresh(Request())
+            else:
+                flow: InstalledAppFlow = InstalledAppFlow.from_client_secrets_file(
+                    OUTER_PATH + "/secrets/credentials.json", SCOPES)
+                _creds = flow.run_local_server(port=0)
+            with open(OUTER_PATH + "/secrets/token.json", "w") as token:
+                token.write(_creds.to_json())
+        return _creds
+
+
+def get_drive_service(creds: Credentials) -> Resource:
+    """
+    Get a Google Drive API service. The discovery document is parsed once per process, and the service is built once
+    per thread (its HTTP transport cannot be shared between threads), so back-to-back operations do not pay the setup
+    cost again.
+    :param creds: Credentials object
+    :return: A Google Drive API service
+    """
+    global _discovery_document
+    with _drive_lock:
+        if _discovery_document is None:
+            _discovery_document = loads(get_static_doc("drive", "v3"))
+
+    endpoint: str = f'{DRIVE_API_URL}/drive/v3/'
+    cached: Optional[tuple] = getattr(_services, 'drive', None)
+    if cached is None or cached[0] is not creds or cached[1] != endpoint:
+        service: Resource = build_from_document(_discovery_document, credentials=creds,
+                                                client_options={'api_endpoint': endpoint})
+        _services.drive = (creds, endpoint, service)
+    return _services.drive[2]
+
+
+def iter_drive_files(service: Resource, **list_parameters) -> Iterator[dict]:
+    """
+    Lists files on Google Drive, following nextPageToken so no page of the results is left out.
+    :param service: A Google Drive API service
+    :param list_parameters: The parameters of files().list, the fields must include nextPageToken
+    :return: An iterator over the files
+    """
+    page_token: Optional[str] = None
+    while True:
+        page_parameters: dict = {'pageSize': LIST_PAGE_SIZE, **list_parameters}
+        if page_token:
+            page_parameters['pageToken'] = page_token
+        response: dict = service.files().list(**page_parameters).execute()
+        yield from response.get('files', [])
+        page_token = response.get('nextPageToken')
+        if not page_token:
+            return
+
+
 def list_shared_drive_contents(creds: Credentials, folder_id: str, drive_id: str) -> bool:
     """
     List the contents of a folder within a Shared Drive.
@@ -42,18 +132,18 @@ def list_shared_drive_contents(creds: Credentials, folder_id: str, drive_id: str
     :param drive_id: The ID of the Shared Drive
     :return: A boolean indicating whether the operation was successful
     """
-    service: build = build("drive", "v3", credentials=creds)
+    service: Resource = get_drive_service(creds)
     try:
-        response: dict = service.files().list(     # List files in the specified folder of the Shared Drive
+        items: list = list(iter_drive_files(     # List files in the specified folder of the Shared Drive
+            service,
             q=f"'{folder_id}' in parents",
             supportsAllDrives=True,
             includeItemsFromAllDrives=True,
             driveId=drive_id,
             corpora='drive',    # Ensure to set corpora to 'drive' when using driveId
             fields="nextPageToken, files(id, name)"
-        ).execute()
+        ))
 
-        items: list = response.get('files', [])
         if not items:
             print("No files found in the folder.")
         else:
@@ -66,85 +156,348 @@ def list_shared_drive_contents(creds: Credentials, folder_id: str, drive_id: str
         return False
             
 
+def dataset_format(filename: str, mime_type: Optional[str] = None) -> str:
+    """
+    Detects the format of a dataset file from its Drive metadata: its MIME type if it is a known one, else the
+    extension of its name. Files with neither are read as CSV, the format the datasets used to be stored in.
+    :param filename: The name of the file
+    :param mime_type: The MIME type of the file
+    :return: 'csv', 'parquet' or 'feather'
+    """
+    for file_format, format_mime_type in DATASET_FORMATS.items():
+        if mime_type == format_mime_type:
+            return file_format
+    extension: str = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    extension = 'feather' if extension == 'arrow' else extension
+    return extension if extension in DATASET_FORMATS else 'csv'
+
+
+def read_dataset(source, file_format: str, memory_map: bool = False) -> DataFrame:
+    """
+    Reads a dataset file.
+    :param source: A path or a binary file object
+    :param file_format: 'csv', 'parquet' or 'feather'
+    :param memory_map: Whether a path is memory-mapped instead of read into memory first
+    :return: A Pandas DataFrame with the contents of the file
+    """
+    if file_format == 'parquet':
+        return pq.read_table(source, memory_map=memory_map).to_pandas() if memory_map else read_parquet(source)
+    if file_format == 'feather':
+        return feather.read_table(source, memory_map=memory_map).to_pandas() if memory_map else read_feather(source)
+    return read_csv(source, memory_map=memory_map)
+
+
+def write_dataset(df: DataFrame, target, file_format: str) -> None:
+    """
+    Writes a dataset file. Parquet and Feather files are compressed with zstd.
+    :param df: A Pandas DataFrame
+    :param target: A path or a binary file object
+    :param file_format: 'csv', 'parquet' or 'feather'
+    :return: None
+    """
+    if file_format == 'parquet':
+        df.to_parquet(target, index=False, compression='zstd')
+    elif file_format == 'feather':
+        df.reset_index(drop=True).to_feather(target, compression='zstd')  # Feather cannot store an index
+    else:
+        df.to_csv(target, index=False)
+
+
+class _StreamSink:
+    """
+    A write-only file object whose contents are taken out as soon as they are written, so the pyarrow writers can
+    serialize a dataset without holding all of it. tell() keeps counting from the start of the file, as the writers
+    use it for the offsets in the file footer.
+    """
+
+    def __init__(self) -> None:
+        self._buffer: bytearray = bytearray()
+        self._position: int = 0
+        self.closed: bool = False
+
+    def write(self, data) -> int:
+        self._buffer += data
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data: bytes = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+
+def iter_dataset_bytes(df: DataFrame, file_format: str, rows_per_batch: int = UPLOAD_ROWS_PER_BATCH) -> Iterator[bytes]:
+    """
+    Serializes a dataset a batch of rows at a time, so it can be streamed without writing it to disk first. The bytes
+    are the same file as written by write_dataset: Parquet row groups and Feather record batches are compressed
+    with zstd as they are written.
+    :param df: A Pandas DataFrame
+    :param file_format: 'csv', 'parquet' or 'feather'
+    :param rows_per_batch: How many rows are serialized at a time
+    :return: An iterator over the consecutive parts of the file
+    """
+    starts: range = range(0, len(df), rows_per_batch)
+    if file_format == 'csv':
+        if not len(df):
+            yield df.to_csv(index=False).encode()
+        for start in starts:
+            yield df.iloc[start:start + rows_per_batch].to_csv(index=False, header=start == 0).encode()
+        return
+
+    sink: _StreamSink = _StreamSink()
+    schema: pa.Schema = pa.Schema.from_pandas(df, preserve_index=False)
+    if file_format == 'parquet':
+        writer = pq.ParquetWriter(pa.PythonFile(sink, mode='w'), schema, compression='zstd')
+    else:
+        writer = pa.ipc.new_file(pa.PythonFile(sink, mode='w'), schema,
+                                 options=pa.ipc.IpcWriteOptions(compression='zstd'))
+    with writer:
+        for start in starts:
+            writer.write_table(pa.Table.from_pandas(df.iloc[start:start + rows_per_batch], schema=schema,
+                                                    preserve_index=False))
+            yield sink.drain()
+    yield sink.drain()  # The footer
+
+
+def download_file(creds: Credentials, file_id: str, size: int, fh: IOBase, chunk_size: int = DOWNLOAD_CHUNK_SIZE,
+                  max_workers: int = DOWNLOAD_WORKERS) -> None:
+    """
+    Downloads a file from Google Drive. Files larger than chunk_size are split in HTTP Range requests that are sent
+    in parallel, so at most chunk_size * max_workers bytes are held in memory.
+    :param creds: A Google Drive API credentials object
+    :param file_id: The ID of the file to download
+    :param size: The size of the file, in bytes
+    :param fh: A seekable binary file object to write the contents of the file to
+    :param chunk_size: The size of a Range request, in bytes
+    :param max_workers: How many Range requests are sent at the same time
+    :return: None
+    """
+    url: str = f'{DRIVE_API_URL}/drive/v3/files/{file_id}'
+    headers: dict = {}
+    creds.apply(headers)
+    lock: Lock = Lock()
+    downloaded: list = [0]
+
+    def download_chunk(start: int) -> None:
+        end: int = min(start + chunk_size, size) - 1
+        response: Response = get_http_client().get(url, params={'alt': 'media', 'supportsAllDrives': 'true'},
+                                                   headers={**headers, 'Range': f'bytes={start}-{end}'})
+        response.raise_for_status()
+        # A server ignoring the Range header sends the whole file, which is only right for the first chunk
+        if len(response.content) != end - start + 1 and not (start == 0 and len(response.content) == size):
+            raise IOError(f"Incomplete chunk {start}-{end} of file {file_id}")
+
+        with lock:
+            fh.seek(start)
+            fh.write(response.content)
+            downloaded[0] += len(response.content)
+            print("\nDownload %d%%." % int(downloaded[0] / size * 100))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        list(executor.map(download_chunk, range(0, size, chunk_size)))
+    fh.truncate(size)
+
+
+def download_pd_dataframe(creds: Credentials, file_id: str) -> DataFrame:
+    """
+    Downloads a dataset file (CSV, Parquet or Feather, see dataset_format) from Google Drive and returns it as a
+    Pandas DataFrame.
+    The file is kept in DRIVE_CACHE, and only downloaded again once its checksum or modification time on Drive change.
+    :param creds: A Google Drive API credentials object
+    :param file_id: The ID of the file to download
+    :return: A Pandas DataFrame with the contents of the file
+    """
+    service: Resource = get_drive_service(creds)
+    metadata: dict = service.files().get(fileId=file_id, fields="name, mimeType, md5Checksum, modifiedTime, size",
+                                         supportsAllDrives=True).execute()
+    size: int = int(metadata.get('size', 0))
+    file_format: str = dataset_format(metadata.get('name', ''), metadata.get('mimeType'))
+
+    if DRIVE_CACHE is None:
+        fh: BytesIO = BytesIO()
+        download_file(creds, file_id, size, fh, DOWNLOAD_CHUNK_SIZE, DOWNLOAD_WORKERS)
+        fh.seek(0)  # The file's contents are now in fh, which we can use to create a Pandas DataFrame
+        return read_dataset(fh, file_format)
+
+    cached_path: Optional[str] = DRIVE_CACHE.lookup(file_id, metadata)
+    if cached_path is not None:
+        print("\nLoaded from the local cache.")
+        return read_dataset(cached_path, file_format)
+
+    downloaded_path: str = DRIVE_CACHE.staging_path()
+    try:
+        with open(downloaded_path, 'wb') as fh:
+            download_file(creds, file_id, size, fh, DOWNLOAD_CHUNK_SIZE, DOWNLOAD_WORKERS)
+        if DRIVE_CACHE.store(file_id, metadata, downloaded_path):
+            return read_dataset(DRIVE_CACHE.path(metadata['md5Checksum']), file_format)
+        return read_dataset(downloaded_path, file_format)
+    finally:
+        if exists(downloaded_path):
+            remove(downloaded_path)
+
+
 def download_csv_as_pd_dataframe(creds: Credentials, file_id: str) -> DataFrame:
     """
     Downloads a CSV file from Google Drive and returns it as a Pandas DataFrame.
+    Files in the other dataset formats are read too, see download_pd_dataframe.
     :param creds: A Google Drive API credentials object
     :param file_id: The ID of the file to download
     :return: A Pandas DataFrame with the contents of the CSV file
     """
-    service: build = build("drive", "v3", credentials=creds)
-    request: dict = service.files().get_media(fileId=file_id)
-    fh: BytesIO = BytesIO()
-    downloader: MediaIoBaseDownload = MediaIoBaseDownload(fh, request)
-    done: bool = False
+    return download_pd_dataframe(creds, file_id)
 
-    while not done:
-        status: MediaDownloadProgress
-        status, done = downloader.next_chunk()
-        print("\nDownload %d%%." % int(status.progress() * 100))
 
-    fh.seek(0)  # The file's contents are now in fh, which we can use to create a Pandas DataFrame
-    return read_csv(fh)
+def download_pd_dataframes(creds: Credentials, file_ids: List[str], max_workers: int = 4) -> List[DataFrame]:
+    """
+    Downloads several dataset files from Google Drive at the same time, see download_pd_dataframe.
+    :param creds: A Google Drive API credentials object
+    :param file_ids: The IDs of the files to download
+    :param max_workers: How many files are downloaded at the same time
+    :return: A Pandas DataFrame per file, in the order of file_ids
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(lambda file_id: download_pd_dataframe(creds, file_id), file_ids))
 
 
-def upload_df_to_drive_as_csv(creds: Credentials, df: DataFrame, filename: str, folder_id: str) -> bool:
+def upload_stream(creds: Credentials, chunks: Iterable[bytes], metadata: dict, file_id: Optional[str] = None,
+                  chunk_size: int = UPLOAD_CHUNK_SIZE) -> dict:
     """
-    Uploads a Pandas DataFrame to Google Drive as a CSV file.
+    Uploads a stream of bytes of unknown length to Google Drive with the resumable upload protocol. At most
+    chunk_size bytes are sent per request and held in memory, on top of the part of the stream being read. An
+    interrupted chunk is resumed from the last byte Drive acknowledged.
+    :param creds: A Google Drive API credentials object
+    :param chunks: The consecutive parts of the file
+    :param metadata: The metadata of the file, with its mimeType
+    :param file_id: The ID of the file to replace the contents of, a new file is created by default
+    :param chunk_size: The size of an upload request, in bytes
+    :return: The uploaded file, with its id
+    """
+    headers: dict = {}
+    creds.apply(headers)
+    url: str = f'{DRIVE_API_URL}/upload/drive/v3/files' + (f'/{file_id}' if file_id else '')
+    response: Response = get_http_client().request(
+        'PATCH' if file_id else 'POST', url, json=metadata,
+        params={'uploadType': 'resumable', 'supportsAllDrives': 'true', 'fields': 'id'},
+        headers={**headers, 'X-Upload-Content-Type': metadata['mimeType']})
+    response.raise_for_status()
+    session_url: str = response.headers['Location']
+
+    buffer: bytearray = bytearray()  # The bytes not acknowledged by Drive yet
+    offset: int = 0  # The position of the start of the buffer in the file
+
+    def send(size: int, total: Optional[int]) -> Optional[dict]:
+        # Sends the first size bytes of the buffer, and the end of the file if its total size is given
+        nonlocal offset
+        resumes: int = 0
+        while size > 0 or total is not None:
+            end: str = f'{offset}-{offset + size - 1}' if size else '*'
+            content_range: str = f'bytes {end}/{"*" if total is None else total}'
+            try:
+                response: Optional[Response] = get_http_client().request(
+                    'PUT', session_url, data=bytes(buffer[:size]), headers={**headers, 'Content-Range': content_range})
+            except (ConnectionError, Timeout):
+                response = None
+
+            if response is None or response.status_code not in (200, 201, 308):
+                # Ask Drive how much of the file it has received before sending the rest
+                response = get_http_client().request('PUT', session_url, headers={
+                    **headers, 'Content-Range': f'bytes */{"*" if total is None else total}'})
+                if response.status_code not in (200, 201, 308):
+                    raise IOError(f"Upload session lost at byte {offset}: {response.status_code}")
+
+            if response.status_code in (200, 201):
+                return response.json()
+            # Drive may persist less than it was sent, the Range header tells up to which byte
+            byte_range: Optional[str] = response.headers.get('Range')
+            acknowledged: int = int(byte_range.rsplit('-', 1)[1]) + 1 if byte_range else 0
+            if acknowledged < offset:
+                # The bytes before offset are no longer in the buffer, they cannot be sent again
+                raise IOError(f"Upload lost bytes {acknowledged}-{offset - 1}, Drive acknowledged them before")
+            if acknowledged == offset:
+                resumes += 1
+                if resumes > UPLOAD_RESUMES:
+                    raise IOError(f"Upload interrupted at byte {offset}")
+            del buffer[:acknowledged - offset]
+            size -= acknowledged - offset
+            offset = acknowledged
+        return None
+
+    for data in chunks:
+        buffer += data
+        # The last chunk is held back until the end of the stream, when the total size is known
+        while len(buffer) > chunk_size:
+            send(chunk_size, None)
+    return send(len(buffer), offset + len(buffer))
+
+
+def upload_df_to_drive(creds: Credentials, df: DataFrame, filename: str, folder_id: str,
+                       file_format: Optional[str] = None) -> bool:
+    """
+    Uploads a Pandas DataFrame to Google Drive as a dataset file, replacing the file with the same name if any.
+    The DataFrame is serialized as it is uploaded, without going through a local file.
     :param creds: A Google Drive API credentials object
     :param df: A Pandas DataFrame to upload
-    :param filename: A name for the CSV file
+    :param filename: A name for the file
     :param folder_id: A folder ID in Google Drive to upload the file to
-    :return: None
+    :param file_format: 'csv', 'parquet' or 'feather', detected from the extension of filename by default
+    :return: A boolean indicating whether the upload was successful
     """
-    temp_dir: str = gettempdir()
-    csv_file_path: str = join(temp_dir, filename)
-    df.to_csv(csv_file_path, index=False)
+    file_format = file_format or dataset_format(filename)
     try:
         # Create Drive API client
-        service: build = build("drive", "v3", credentials=creds)
+        service: Resource = get_drive_service(creds)
 
         # Search for existing file with the same name in the specified folder
-        response: dict = service.files().list(
+        files: list = list(iter_drive_files(
+            service,
             q=f"'{folder_id}' in parents and name = '{filename}'",
             spaces='drive',
             supportsAllDrives=True,
             includeItemsFromAllDrives=True,
-            fields='files(id, name)'
-        ).execute()
+            fields='nextPageToken, files(id, name)'
+        ))
 
-        files: response = response.get('files', [])
-
-        # Define file metadata and media
+        # Define file metadata
         file_metadata: dict = {
             "name": filename,
+            "mimeType": DATASET_FORMATS[file_format],
             "parents": [folder_id]
         }
 
-        media: MediaFileUpload = MediaFileUpload(csv_file_path, mimetype='text/csv', resumable=True)
-
         if files:
             # File exists, so update it
             for file in files:
-                file_id: str = file.get('id')
-                file = service.files().update(
-                    fileId=file_id,
-                    media_body=media,
-                    fields='id',
-                    supportsAllDrives=True,
-                ).execute()
+                file = upload_stream(creds, iter_dataset_bytes(df, file_format, UPLOAD_ROWS_PER_BATCH),
+                                     {"mimeType": DATASET_FORMATS[file_format]}, file.get('id'), UPLOAD_CHUNK_SIZE)
                 print(f'\nFile updated. File ID: {file.get("id")}')
         else:
             # File does not exist, so create it
-            file: dict = service.files().create(
-                body=file_metadata,
-                media_body=media,
-                fields='id',
-                supportsAllDrives=True
-            ).execute()
+            file: dict = upload_stream(creds, iter_dataset_bytes(df, file_format, UPLOAD_ROWS_PER_BATCH),
+                                       file_metadata, chunk_size=UPLOAD_CHUNK_SIZE)
             print(f'\nFile uploaded. File ID: {file.get("id")}')
         return True
 
     except Exception as error:
         print(f"An error occurred: {error}")
         return False
+
+
+def upload_df_to_drive_as_csv(creds: Credentials, df: DataFrame, filename: str, folder_id: str) -> bool:
+    """
+    Uploads a Pandas DataFrame to Google Drive as a CSV file.
+    :param creds: A Google Drive API credentials object
+    :param df: A Pandas DataFrame to upload
+    :param filename: A name for the CSV file
+    :param folder_id: A folder ID in Google Drive to upload the file to
+    :return: A boolean indicating whether the upload was successful
+    """
+    return upload_df_to_drive(creds, df, filename, folder_id, 'csv')
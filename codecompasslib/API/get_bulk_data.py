@@ -1,16 +1,66 @@
-from requests import Response, get
+from requests import Response
 from requests.exceptions import HTTPError
-from re import search
-from time import sleep
-from codecompasslib.API.helper_functions import load_secret, get_repo_fields
-
-
-TOKEN: str = load_secret()
-HEADER: dict = {
-    'Authorization': f'token {TOKEN}',
+from asyncio import run
+from concurrent.futures import ALL_COMPLETED, FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Iterable, Iterator, Optional
+from pandas import Timestamp, to_datetime
+from codecompasslib.API.helper_functions import load_secrets, get_repo_fields
+from codecompasslib.API.token_pool import TokenPool
+from codecompasslib.API.http_session import get_http_client
+from codecompasslib.API.metrics import METRICS, endpoint_of
+from codecompasslib.API.http_cache import CachedResponse, ResponseCache, cache_key
+from codecompasslib.API.async_crawler import crawl_users
+from codecompasslib.API.paginator import DEFAULT_MAX_ITEMS, Page, iter_pages, paginate
+from codecompasslib.API.crawl_state import CrawlState
+from codecompasslib.API.parquet_sink import ParquetSink
+from codecompasslib.API.repo_records import RepoBatch
+from codecompasslib.API.search_harvester import SEARCH_MAX_RESULTS, harvest_search
+
+
+TOKENS: list = load_secrets()
+HEADER: dict = {  # The Authorization header is added per request, with a token of the pool
     'Accept': 'application/vnd.github.v3+json',
     'User-Agent': 'CodeCompass/v1.0.0'
 }
+API_URL: str = 'https://api.github.com'
+# Every request is sent with the token that has the most quota left, see TOKEN_POOL.metrics() for their usage
+TOKEN_POOL: TokenPool = TokenPool(TOKENS)
+# Set to None to always download the full responses
+RESPONSE_CACHE: Optional[ResponseCache] = ResponseCache()
+
+
+def fetch_github(url: str, query_parameters: dict = None) -> Response:
+    """
+    This function sends a GET request to the GitHub API with the token that has the most quota left, waiting first if
+    every token exhausted the rate limit of the endpoint.
+    If the response is in the cache, the request is conditional and a 304 answer is served from the cache.
+    The pages and cache hits are counted in METRICS, see METRICS.to_json() or METRICS.to_prometheus().
+    :param url: The URL to request.
+    :param query_parameters: The query parameters.
+    :return: The response of the API.
+    """
+    # The search API has its own, much smaller, quota than the rest of the API
+    resource: str = 'search' if url.startswith(API_URL + '/search/') else 'core'
+    key: str = cache_key(url, query_parameters)
+    cached: Optional[CachedResponse] = RESPONSE_CACHE.lookup(key) if RESPONSE_CACHE else None
+
+    token: str = TOKEN_POOL.acquire(resource)
+    headers: dict = {**HEADER, 'Authorization': f'token {token}'}
+    if cached:
+        headers['If-None-Match'] = cached.etag
+
+    response: Response = get_http_client().get(url, headers=headers, params=query_parameters, allow_redirects=False)
+    TOKEN_POOL.update(token, resource, response.headers)
+
+    if cached and response.status_code == 304:
+        METRICS.increment('cache_hits', endpoint_of(url))
+        response = RESPONSE_CACHE.revalidate(cached, response)
+    elif RESPONSE_CACHE and response.ok:
+        RESPONSE_CACHE.store(key, response)
+
+    if response.ok:
+        METRICS.increment('pages', endpoint_of(url))
+    return response
 
 
 def get_users(user_amount: int = 100) -> (list, bool):
@@ -19,14 +69,14 @@ def get_users(user_amount: int = 100) -> (list, bool):
     These are them having at least 1000 followers and 1000 repos.
     :return: A list of users and a boolean indicating if the request was successful.
     """
-    url: str = 'https://api.github.com/search/users'
+    url: str = f'{API_URL}/search/users'
     query_parameters: dict = {
         'q': 'repos:>1000 followers:>1000',
         'per_page': user_amount,
     }
 
     try:
-        response: Response = get(url, headers=HEADER, params=query_parameters, allow_redirects=False)
+        response: Response = fetch_github(url, query_parameters)
         response.raise_for_status()
 
         users_data: list = []
@@ -44,176 +94,186 @@ def get_users(user_amount: int = 100) -> (list, bool):
         return [], False
 
 
-def get_followers(username: str) -> (list, bool):
+def collect(records: Iterator) -> (list, bool):
     """
-    This function gets the followers of a user.
-    :param username: The username of the user.
-    :return: A list of followers and a boolean indicating if the request was successful.
+    This function consumes a stream of records, such as the ones returned by the iter_* functions, into a list.
+    It stops at the first error, keeping the records received before it.
+    :param records: The stream of records.
+    :return: A list of records and a boolean indicating if the request was successful.
     """
-    url: str = f'https://api.github.com/users/{username}/followers'
-    query_parameters: dict = {
-        'per_page': 100,
-    }
-    followers: list = []
+    collected: list = []
+    try:
+        for record in records:
+            collected.append(record)
+        return collected, True
+
+    except HTTPError as err:
+        print(f"HTTP error occurred: {err}")
+        return collected, False
+    except Exception as err:
+        print(f"An error occurred: {err}")
+        return collected, False
 
-    while url != '':
-        if len(followers) > 1900:
-            break
-        try:
-            response: Response = get(url, headers=HEADER, params=query_parameters, allow_redirects=False)
-            response.raise_for_status()
 
-            for follower in response.json():
-                followers.append(follower['login'])
+def iter_followers(username: str, max_items: int = DEFAULT_MAX_ITEMS) -> Iterator[str]:
+    """
+    This function streams the followers of a user, page by page. Errors are raised to the caller.
+    :param username: The username of the user.
+    :param max_items: The maximum amount of followers to return.
+    :return: An iterator over the followers.
+    """
+    url: str = f'{API_URL}/users/{username}/followers'
+    for follower in paginate(fetch_github, url, {'per_page': 100}, max_items):
+        yield follower['login']
 
-            # Check if there is a next page
-            link_header = response.headers.get('Link')
-            if link_header:
-                match = search(r'<(https://api.github.com/[^>]*)>; rel="next"', link_header)
-                url = match.group(1) if match else "None"
-            else:
-                url = ''
 
-        except HTTPError as err:
-            print(f"HTTP error occurred: {err}")
-            return followers, False
-        except Exception as err:
-            print(f"An error occurred: {err}")
-            return followers, False
+def iter_following(username: str, max_items: int = DEFAULT_MAX_ITEMS) -> Iterator[str]:
+    """
+    This function streams the users followed by a user, page by page. Errors are raised to the caller.
+    :param username: The username of the user.
+    :param max_items: The maximum amount of users to return.
+    :return: An iterator over the following.
+    """
+    url: str = f'{API_URL}/users/{username}/following'
+    for follow in paginate(fetch_github, url, {'per_page': 100}, max_items):
+        yield follow['login']
 
-    return followers, True
 
+def iter_stared_repos(username: str, max_items: int = DEFAULT_MAX_ITEMS) -> Iterator[dict]:
+    """
+    This function streams the repositories starred by a user, page by page. Errors are raised to the caller.
+    :param username: The username of the user.
+    :param max_items: The maximum amount of repositories to return.
+    :return: An iterator over the repositories.
+    """
+    url: str = f'{API_URL}/users/{username}/starred'
+    for starred_repo in paginate(fetch_github, url, {'per_page': 100}, max_items):
+        yield get_repo_fields(starred_repo)
 
-def get_following(username: str) -> (list, bool):
+
+def iter_user_repos(username: str, max_items: int = DEFAULT_MAX_ITEMS) -> Iterator[dict]:
     """
-    This function gets the following of a user.
+    This function streams the repositories of a user, page by page. Errors are raised to the caller.
     :param username: The username of the user.
-    :return: A list of following and a boolean indicating if the request was successful.
+    :param max_items: The maximum amount of repositories to return.
+    :return: An iterator over the repositories.
     """
-    url: str = f'https://api.github.com/users/{username}/following'
-    query_parameters: dict = {
-        'per_page': 100,
-    }
-    following: list = []
-
-    while url != '':
-        if len(following) > 1900:
-            break
-        try:
-            response: Response = get(url, headers=HEADER, params=query_parameters, allow_redirects=False)
-            response.raise_for_status()
-
-            for follow in response.json():
-                following.append(follow['login'])
-
-            # If following < 100, then there is no next page
-            if len(following) < 100:
-                url = ''
-            else:
-                # Check if there is a next page
-                link_header = response.headers.get('Link')
-                if link_header:
-                    match = search(r'<(https://api.github.com/[^>]*)>; rel="next"', link_header)
-                    url = match.group(1) if match else "None"
-                else:
-                    url = ''
-
-        except HTTPError as err:
-            print(f"HTTP error occurred: {err}")
-            return following, False
-        except Exception as err:
-            print(f"An error occurred: {err}")
-            return following, False
-
-    return following, True
-
-
-def get_stared_repos(username: str) -> (list, bool):
+    url: str = f'{API_URL}/users/{username}/repos'
+    for repo in paginate(fetch_github, url, {'per_page': 100}, max_items):
+        yield get_repo_fields(repo)
+
+
+def iter_repos_pushed_since(username: str, since: Optional[str] = None,
+                            max_items: int = DEFAULT_MAX_ITEMS) -> Iterator[dict]:
     """
-    This function gets the repositories starred by a user.
+    This function streams the repositories of a user pushed after a date, most recently pushed first.
+    The repositories are requested sorted by push date, so the stream stops at the first one that was not pushed
+    since, and no page after it is requested. Errors are raised to the caller.
     :param username: The username of the user.
-    :return: A list of repositories and a boolean indicating if the request was successful.
+    :param since: An ISO 8601 date (as in the date_pushed field), None to stream every repository.
+    :param max_items: The maximum amount of repositories to return.
+    :return: An iterator over the repositories.
     """
-    url: str = f'https://api.github.com/users/{username}/starred'
+    url: str = f'{API_URL}/users/{username}/repos'
     query_parameters: dict = {
         'per_page': 100,
+        'sort': 'pushed',
+        'direction': 'desc',
     }
-    starred_repos: list = []
-
-    while url != '':
-        if len(starred_repos) > 1900:
-            break
-        try:
-            response: Response = get(url, headers=HEADER, params=query_parameters, allow_redirects=False)
-            response.raise_for_status()
+    # Parsed, as the date of a dataset read from Parquet is not formatted like those of the API
+    since_date: Optional[Timestamp] = to_datetime(since, utc=True) if since else None
+    for page in iter_pages(fetch_github, url, query_parameters, max_items, prefetch=False):
+        for repo in page.records:
+            if since_date is not None and repo['pushed_at'] and to_datetime(repo['pushed_at'], utc=True) <= since_date:
+                return
+            yield get_repo_fields(repo)
 
-            for starred_repo in response.json():
-                starred_repos.append(get_repo_fields(starred_repo))
 
-            # Check if there is a next page
-            link_header = response.headers.get('Link')
-            if link_header:
-                match = search(r'<(https://api.github.com/[^>]*)>; rel="next"', link_header)
-                url = match.group(1) if match else ""
-            else:
-                url = ''
+def get_followers(username: str, max_items: int = DEFAULT_MAX_ITEMS) -> (list, bool):
+    """
+    This function gets the followers of a user.
+    :param username: The username of the user.
+    :param max_items: The maximum amount of followers to return.
+    :return: A list of followers and a boolean indicating if the request was successful.
+    """
+    return collect(iter_followers(username, max_items))
 
-        except HTTPError as err:
-            print(f"HTTP error occurred: {err}")
-            return starred_repos, False
-        except Exception as err:
-            print(f"An error occurred: {err}")
-            return starred_repos, False
 
-    return starred_repos, True
+def get_following(username: str, max_items: int = DEFAULT_MAX_ITEMS) -> (list, bool):
+    """
+    This function gets the following of a user.
+    :param username: The username of the user.
+    :param max_items: The maximum amount of users to return.
+    :return: A list of following and a boolean indicating if the request was successful.
+    """
+    return collect(iter_following(username, max_items))
 
 
-def get_user_repos(username: str) -> (list, bool):
+def get_stared_repos(username: str, max_items: int = DEFAULT_MAX_ITEMS) -> (list, bool):
     """
-    This function gets the repositories of a user.
+    This function gets the repositories starred by a user.
     :param username: The username of the user.
+    :param max_items: The maximum amount of repositories to return.
     :return: A list of repositories and a boolean indicating if the request was successful.
     """
-    url: str = f'https://api.github.com/users/{username}/repos'
-    query_parameters: dict = {
-        'per_page': 100,
-    }
-    repos: list = []
-
-    while url != '':
-        if len(repos) > 1900:
-            break
-        try:
-            response: Response = get(url, headers=HEADER, params=query_parameters, allow_redirects=False)
-            response.raise_for_status()
+    return collect(iter_stared_repos(username, max_items))
 
-            for repo in response.json():
-                repos.append(get_repo_fields(repo))
 
-            # Check if there is a next page
-            link_header = response.headers.get('Link')
-            if link_header:
-                match = search(r'<(https://api.github.com/[^>]*)>; rel="next"', link_header)
-                url = match.group(1) if match else "None"
-            else:
-                url = ''
-
-        except HTTPError as err:
-            print(f"HTTP error occurred: {err}")
-            return repos, False
-        except Exception as err:
-            print(f"An error occurred: {err}")
-            return repos, False
-
-    return repos, True
+def get_user_repos(username: str, max_items: int = DEFAULT_MAX_ITEMS) -> (list, bool):
+    """
+    This function gets the repositories of a user.
+    :param username: The username of the user.
+    :param max_items: The maximum amount of repositories to return.
+    :return: A list of repositories and a boolean indicating if the request was successful.
+    """
+    return collect(iter_user_repos(username, max_items))
 
 
-def get_misc_data(query_parameters: list = None) -> list:
+def write_user_repos(users: Iterable[str], sink: ParquetSink, max_in_flight: int = 8) -> int:
     """
-    This function gets the repositories from the GitHub API based on the query parameters returns a list of information.
+    This function streams the repositories of many users into a Parquet sink, fetching several users at the same
+    time. Only the repositories of the users in flight are held in memory.
+    :param users: The usernames.
+    :param sink: The sink the repositories are written to.
+    :param max_in_flight: The maximum amount of users fetched at the same time.
+    :return: How many users could not be fetched completely.
+    """
+    failed: int = 0
+    pending: set = set()
+
+    def drain(return_when: str) -> set:
+        nonlocal failed
+        done, not_done = wait(pending, return_when=return_when)
+        for future in done:
+            repos, flag = future.result()
+            sink.write_many(repos)
+            failed += not flag
+        return not_done
+
+    with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        for user in users:
+            pending.add(executor.submit(get_user_repos, user))
+            if len(pending) >= max_in_flight:
+                pending = drain(FIRST_COMPLETED)
+        drain(ALL_COMPLETED)
+
+    sink.flush()
+    return failed
+
+
+def get_misc_batch(query_parameters: list = None, max_in_flight: int = 4,
+                   max_results: Optional[int] = SEARCH_MAX_RESULTS) -> RepoBatch:
+    """
+    This function gets the repositories from the GitHub API based on the query parameters, as get_misc_data does.
+    The queries run concurrently, and the first max_results repositories of every query are read. With max_results
+    None, every query is read in full: queries with more than the 1000 results the search API returns are split by
+    creation date, which takes thousands of requests for a broad query. Every repository is returned once, in a
+    compact columnar batch that is iterated like a list of records and converts to a DataFrame with to_dataframe().
     :param query_parameters: The query parameters. Accepted fields are 'language', 'in:name', 'in:description',
     'in:readme'.
-    :return: A list with the fetched data.
+    :param max_in_flight: The maximum amount of requests sent at the same time.
+    :param max_results: The maximum amount of repositories read per query, None to read all of them.
+    :return: A batch with the fetched data.
     """
     ACCEPTED_FIELDS: list = ['language', 'in:name', 'in:description', 'in:readme']
 
@@ -222,9 +282,9 @@ def get_misc_data(query_parameters: list = None) -> list:
 
     if not all(item in ACCEPTED_FIELDS for item in query_parameters):
         print("Invalid query parameters.")
-        return []
+        return RepoBatch()
 
-    url: str = 'https://api.github.com/search/repositories'
+    url: str = f'{API_URL}/search/repositories'
     LANGUAGE_LIST: list = ['Python', 'Java', 'Go', 'JavaScript', 'C++', 'TypeScript', 'PHP', 'C', 'Ruby', "C#", 'Nix',
                            'Shell', 'Rust', 'Scala', 'Kotlin', 'Swift']
     QUERY_TOPICS: list = ['machine-learning', 'deep-learning', 'data-science', 'artificial-intelligence',
@@ -235,86 +295,82 @@ def get_misc_data(query_parameters: list = None) -> list:
     for parameter in query_parameters:
         if parameter == 'language':
             for language in LANGUAGE_LIST:
-                query_list.append({
-                    'q': f'{parameter}:{language}',
-                    'per_page': 100,
-                })
+                query_list.append(f'{parameter}:{language}')
         else:
             for topic in QUERY_TOPICS:
-                query_list.append({
-                    'q': f'{topic} {parameter}',
-                    'per_page': 100,
-                })
+                query_list.append(f'{topic} {parameter}')
 
-    data_list: list = []
-    for query in query_list:
-        try:
-            response: Response = get(url, headers=HEADER, params=query, allow_redirects=False)
-            response.raise_for_status()
+    return RepoBatch(get_repo_fields(repo) for repo in harvest_search(fetch_github, url, query_list, max_in_flight,
+                                                                          max_results=max_results))
 
-            repos_data: list = []
 
-            for repo in response.json()['items']:
-                repo_info = get_repo_fields(repo)
-                repos_data.append(repo_info)
+def get_misc_data(query_parameters: list = None, max_in_flight: int = 4,
+                  max_results: Optional[int] = SEARCH_MAX_RESULTS) -> list:
+    """
+    This function gets the repositories from the GitHub API based on the query parameters returns a list of information.
+    See get_misc_batch to keep them in a compact columnar batch instead.
+    :param query_parameters: The query parameters. Accepted fields are 'language', 'in:name', 'in:description',
+    'in:readme'.
+    :param max_in_flight: The maximum amount of requests sent at the same time.
+    :param max_results: The maximum amount of repositories read per query, None to read all of them.
+    :return: A list with the fetched data.
+    """
+    return list(get_misc_batch(query_parameters, max_in_flight, max_results))
 
-            data_list.append(repos_data)
-        except HTTPError as err:
-            print(f"HTTP error occurred: {err}")
-            break
-        except Exception as err:
-            print(f"An error occurred: {err}")
-            break
 
-    data_list = [item for sublist in data_list for item in sublist]
-    return data_list
+def iter_connection_pages(username: str, kind: str, resume_url: Optional[str] = None,
+                          max_items: Optional[int] = DEFAULT_MAX_ITEMS) -> Iterator[Page]:
+    """
+    This function streams the followers or the following of a user page by page, as pages of usernames.
+    Errors are raised to the caller.
+    :param username: The username of the user.
+    :param kind: 'followers' or 'following'.
+    :param resume_url: The URL of the page to start from, to resume an interrupted pagination.
+    :param max_items: The maximum amount of users to return, None for no limit.
+    :return: An iterator over the pages.
+    """
+    url: str = resume_url or f'{API_URL}/users/{username}/{kind}'
+    query_parameters: Optional[dict] = None if resume_url else {'per_page': 100}
+    for page in iter_pages(fetch_github, url, query_parameters, max_items):
+        yield Page([user['login'] for user in page.records], page.next_url)
 
 
-def get_bulk_data(user_amount: int = 100) -> list:
+def get_bulk_data(user_amount: int = 100, max_in_flight: int = 8, max_depth: int = 1,
+                  state_path: str = ':memory:', sink: Optional[ParquetSink] = None) -> list:
     """
-    This function gets the repositories of the users.
+    This function gets the users around the most popular users: the users themselves, their followers and their
+    following, and with max_depth > 1 the followers and following of those too. The users are crawled concurrently,
+    pacing the requests with the rate limit headers of the API.
+    With a state_path, the crawl is checkpointed to a SQLite database, and calling the function again with the same
+    path resumes the crawl where it stopped instead of starting over.
+    With a sink, the repositories of the users are then streamed to it, see write_user_repos.
     :param user_amount: How many users to get.
+    :param max_in_flight: The maximum amount of requests sent at the same time.
+    :param max_depth: How many hops to expand from the most popular users.
+    :param state_path: The path of the crawl database, ':memory:' for a crawl that is not persisted.
+    :param sink: The Parquet sink the repositories of the users are written to, None to only get the users.
     :return: Returns a list with the fetched data.
     """
+    state: CrawlState = CrawlState(state_path)
+    try:
+        if state.is_empty():
+            users_list: list
+            users_flag: bool
+
+            users_list, users_flag = get_users(user_amount)
+            if not users_flag:
+                print("An error occurred with getting users.")
+                return []
+            state.add_seeds(users_list)
+        else:
+            print(f"Resuming crawl from {state_path}")
 
-    count: int = 1
-    users: set = set()
-    users_list: list
-    users_flag: bool
-
-    users_list, users_flag = get_users(user_amount)
-    if users_flag:
-        for user in users_list:
-            users.add(user)
-
-            followers_list: list
-            followers_flag: bool
-
-            followers_list, followers_flag = get_followers(user)
-            if followers_flag:
-                users.update(followers_list)
-            else:
-                print(f"An error occurred with user: {user} followers")
-                continue
-
-            following_list: list
-            following_flag: bool
-
-            following_list, following_flag = get_following(user)
-            if following_flag:
-                users.update(following_list)
-            else:
-                print(f"An error occurred with user: {user} following")
-                continue
-
-            if user_amount != 1:
-                sleep(60)
-            print("Count: ", count)
-            count += 1
-
-    else:
-        print("An error occurred with getting users.")
-        return []
+        users: set = run(crawl_users(state, iter_connection_pages, max_depth, max_in_flight))
+    finally:
+        state.close()
 
     print("Amount of users: ", len(users))
+    if sink is not None:
+        failed: int = write_user_repos(users, sink, max_in_flight)
+        print(f"Repositories written: {sink.written}, users that could not be fetched: {failed}")
     return list(users)
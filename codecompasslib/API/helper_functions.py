@@ -1,7 +1,9 @@
 from json import load
+from glob import glob
 from pandas import DataFrame
 from os.path import dirname
 from pathlib import Path
+from codecompasslib.API.repo_records import RepoBatch
 
 PARENT_PATH: str = dirname(dirname(__file__))  # Get the parent directory of the current directory (codecompasslib)
 OUTER_PATH: str = dirname(dirname(dirname(__file__)))  # Get the most outer directory of the project
@@ -10,11 +12,11 @@ OUTER_PATH: str = dirname(dirname(dirname(__file__)))  # Get the most outer dire
 def save_to_csv(data: any, filename: str) -> None:
     """
     This function saves the data to a csv file.
-    :param data: The data to be saved.
+    :param data: The data to be saved, a RepoBatch is converted column by column.
     :param filename: The name of the file.
     :return: Does not return anything.
     """
-    df: DataFrame = DataFrame(data)
+    df: DataFrame = data.to_dataframe() if isinstance(data, RepoBatch) else DataFrame(data)
     df.to_csv(Path(PARENT_PATH + '/Data/' + filename), index=False)
 
 
@@ -78,14 +80,29 @@ def get_repo_fields(repo: dict) -> dict:
 
 def load_secret() -> str:
     """
-    This function loads the secret token.
-    :return: The secret token.
+    This function loads the secret token, the first of those load_secrets finds.
+    :return: The secret token, empty if none was found.
     """
-    try:
-        with open(OUTER_PATH + '/secrets/pat.json') as f:
-            TOKEN: str = load(f)['token']
-            print("Token loaded successfully.")
-            return TOKEN
-    except FileNotFoundError:
+    return load_secrets()[0]
+
+
+def load_secrets() -> list:
+    """
+    This function loads every secret token, to crawl with a pool of tokens.
+    The tokens are read from the secrets/pat*.json files (e.g. pat.json, pat_2.json), each holding either a 'token'
+    or a list of 'tokens'.
+    :return: A list with the secret tokens, with an empty token if none was found.
+    """
+    tokens: list = []
+    for path in sorted(glob(OUTER_PATH + '/secrets/pat*.json')):
+        with open(path) as f:
+            secret: dict = load(f)
+        for token in secret.get('tokens', []) + ([secret['token']] if 'token' in secret else []):
+            if token and token not in tokens:
+                tokens.append(token)
+
+    if not tokens:
         print("Secret file not found.")
-        return ""
+        return [""]
+    print(f"{len(tokens)} tokens loaded successfully.")
+    return tokens
@@ -0,0 +1,165 @@
+from json import dumps, loads
+from os import makedirs
+from os.path import dirname
+from sqlite3 import Connection, connect
+from threading import Lock
+from time import time
+from typing import Dict, NamedTuple, Optional
+from urllib.parse import urlencode
+from requests import Response
+from requests.structures import CaseInsensitiveDict
+from codecompasslib.API.helper_functions import OUTER_PATH
+
+CACHE_PATH: str = OUTER_PATH + '/.cache/github_responses.sqlite'
+CACHED_HEADERS: list = ['Content-Type', 'ETag', 'Last-Modified', 'Link']
+TOUCH_FLUSH_SIZE: int = 1000  # Cache hits whose last use is kept in memory before it is written to the database
+
+
+class CachedResponse(NamedTuple):
+    """
+    A response stored in the cache, with the validators needed to revalidate it.
+    """
+    etag: str
+    headers: dict
+    body: bytes
+
+
+def cache_key(url: str, query_parameters: Optional[dict] = None) -> str:
+    """
+    This function builds the cache key of a request from its URL and its query parameters.
+    :param url: The URL of the request.
+    :param query_parameters: The query parameters of the request.
+    :return: The cache key.
+    """
+    if not query_parameters:
+        return url
+    return url + ('&' if '?' in url else '?') + urlencode(sorted(query_parameters.items()))
+
+
+class ResponseCache:
+    """
+    A persistent, SQLite backed, cache of GitHub API responses. The responses are stored with their ETag, so they can
+    be revalidated with a conditional request: a 304 answer is served from disk and does not count against the rate
+    limit. The least recently used responses are evicted once the cache grows past max_bytes. The last use of the
+    responses is written on the next store, so a cache hit does not wait on a commit.
+    """
+
+    def __init__(self, path: str = CACHE_PATH, max_bytes: int = 512 * 1024 * 1024) -> None:
+        """
+        :param path: The path of the SQLite database, created if it does not exist.
+        :param max_bytes: The maximum size of the stored bodies.
+        """
+        self.path: str = path
+        self.max_bytes: int = max_bytes
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+        self._size: int = 0
+        self._connection: Optional[Connection] = None
+        self._touched: Dict[str, float] = {}  # Key -> last use, not written to the database yet
+        self._lock: Lock = Lock()
+
+    def _connect(self) -> Connection:
+        # The database is only opened on first use, so importing the crawler does not touch the disk
+        if self._connection is None:
+            makedirs(dirname(self.path) or '.', exist_ok=True)
+            self._connection = connect(self.path, check_same_thread=False)
+            # A commit does not wait for the disk, the database stays consistent if the process crashes
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute('PRAGMA synchronous=NORMAL')
+            self._connection.execute('CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, etag TEXT, '
+                                     'headers TEXT, body BLOB, size INTEGER, last_used REAL)')
+            self._connection.execute('CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)')
+            self._size = self._connection.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        return self._connection
+
+    def _flush_touched(self, connection: Connection) -> None:
+        # Called with the lock held, the caller commits
+        connection.executemany('UPDATE responses SET last_used = ? WHERE key = ?',
+                               [(last_used, key) for key, last_used in self._touched.items()])
+        self._touched.clear()
+
+    def lookup(self, key: str) -> Optional[CachedResponse]:
+        """
+        Gets a stored response, marking it as recently used.
+        :param key: The cache key of the request.
+        :return: The stored response, or None if there is none.
+        """
+        with self._lock:
+            connection: Connection = self._connect()
+            row = connection.execute('SELECT etag, headers, body FROM responses WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            self._touched[key] = time()
+            if len(self._touched) >= TOUCH_FLUSH_SIZE:
+                self._flush_touched(connection)
+                connection.commit()
+            return CachedResponse(row[0], loads(row[1]), row[2])
+
+    def store(self, key: str, response: Response) -> None:
+        """
+        Stores a response that carries an ETag, evicting the least recently used responses if the cache is full.
+        Every full response counts as a miss, whether it can be stored or not.
+        :param key: The cache key of the request.
+        :param response: The response to store.
+        :return: Does not return anything.
+        """
+        with self._lock:
+            self.misses += 1
+        etag: Optional[str] = response.headers.get('ETag')
+        if not etag or len(response.content) > self.max_bytes:
+            return
+        headers: dict = {name: response.headers[name] for name in CACHED_HEADERS if name in response.headers}
+
+        with self._lock:
+            connection: Connection = self._connect()
+            self._flush_touched(connection)
+            previous = connection.execute('SELECT size FROM responses WHERE key = ?', (key,)).fetchone()
+            connection.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)',
+                               (key, etag, dumps(headers), response.content, len(response.content), time()))
+            self._size += len(response.content) - (previous[0] if previous else 0)
+
+            while self._size > self.max_bytes:
+                oldest_key, oldest_size = connection.execute(
+                    'SELECT key, size FROM responses ORDER BY last_used LIMIT 1').fetchone()
+                connection.execute('DELETE FROM responses WHERE key = ?', (oldest_key,))
+                self._size -= oldest_size
+                self.evictions += 1
+            connection.commit()
+
+    def revalidate(self, cached: CachedResponse, response: Response) -> Response:
+        """
+        Turns a 304 Not Modified answer into the stored response, keeping the fresh headers of the 304
+        (e.g. the rate limit ones).
+        :param cached: The stored response.
+        :param response: The 304 response.
+        :return: A 200 response with the stored body.
+        """
+        with self._lock:
+            self.hits += 1
+        response.status_code = 200
+        response.reason = 'OK'
+        response.headers = CaseInsensitiveDict({**response.headers, **cached.headers})
+        response._content = cached.body
+        return response
+
+    def stats(self) -> dict:
+        """
+        :return: The hit/miss counters and the current size of the cache.
+        """
+        requests: int = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / requests if requests else 0.0,
+            'evictions': self.evictions,
+            'size_bytes': self._size,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            if self._connection is not None:
+                self._flush_touched(self._connection)
+                self._connection.commit()
+                self._connection.close()
+                self._connection = None
@@ -0,0 +1,161 @@
+"""
+The HTTP transport shared by the GitHub crawler and the chatbot tools: a pooled keep-alive session with retries on
+transient errors and a limit of concurrent requests per host.
+"""
+from random import uniform
+from threading import BoundedSemaphore, Lock
+from time import perf_counter, sleep
+from typing import Dict, Optional
+from urllib.parse import urlparse
+from requests import Response, Session
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError, Timeout
+from codecompasslib.API.metrics import METRICS, endpoint_of
+
+RETRY_STATUSES: set = {500, 502, 503, 504}
+
+
+class HttpClient:
+    """
+    A thread safe HTTP client. Connections are pooled and kept alive between requests, 5xx answers, connection
+    errors and GitHub secondary rate limits are retried with jittered exponential backoff, and at most max_per_host
+    requests are sent to the same host at the same time. Every attempt is reported to METRICS.
+    """
+
+    def __init__(self, pool_size: int = 32, max_per_host: int = 16, max_retries: int = 5, backoff_base: float = 1.0,
+                 backoff_max: float = 60.0, timeout: float = 30.0) -> None:
+        """
+        :param pool_size: How many connections are kept alive per host.
+        :param max_per_host: How many requests can be sent to the same host at the same time.
+        :param max_retries: How many times a failed request is retried.
+        :param backoff_base: The base of the exponential backoff, in seconds.
+        :param backoff_max: The maximum wait between two attempts, in seconds.
+        :param timeout: The default timeout of a request, in seconds.
+        """
+        self.max_per_host: int = max_per_host
+        self.max_retries: int = max_retries
+        self.backoff_base: float = backoff_base
+        self.backoff_max: float = backoff_max
+        self.timeout: float = timeout
+        self.retries: int = 0
+
+        self.session: Session = Session()
+        adapter: HTTPAdapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self._host_limits: Dict[str, BoundedSemaphore] = {}
+        self._lock: Lock = Lock()
+
+    def _host_limit(self, url: str) -> BoundedSemaphore:
+        host: str = urlparse(url).netloc
+        with self._lock:
+            if host not in self._host_limits:
+                self._host_limits[host] = BoundedSemaphore(self.max_per_host)
+            return self._host_limits[host]
+
+    def backoff(self, attempt: int) -> float:
+        """
+        Computes the wait before a retry, with full jitter so concurrent workers do not retry in lockstep.
+        :param attempt: How many attempts already failed, minus one.
+        :return: The wait in seconds.
+        """
+        return uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def retry_delay(self, response: Response, attempt: int) -> Optional[float]:
+        """
+        Decides whether a response must be retried.
+        :param response: The response.
+        :param attempt: How many attempts already failed, minus one.
+        :return: The wait in seconds before retrying, or None if the response is final.
+        """
+        if response.status_code in RETRY_STATUSES:
+            return self.backoff(attempt)
+
+        if response.status_code in (403, 429):
+            retry_after: Optional[str] = response.headers.get('Retry-After')
+            if retry_after is not None and retry_after.isdigit():
+                return float(retry_after)
+            if 'secondary rate limit' in response.text.lower():
+                # GitHub asks to wait at least a minute when no Retry-After is given
+                return max(60.0, self.backoff(attempt))
+
+        return None
+
+    def request(self, method: str, url: str, **kwargs) -> Response:
+        """
+        Sends a request, retrying it on transient errors.
+        :param method: The HTTP method.
+        :param url: The URL to request.
+        :param kwargs: The arguments of requests.Session.request.
+        :return: The final response. Connection errors are raised once the retries are exhausted.
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        endpoint: str = endpoint_of(url)
+        attempt: int = 0
+
+        while True:
+            try:
+                with self._host_limit(url):
+                    start: float = perf_counter()
+                    response: Response = self.session.request(method, url, **kwargs)
+                    elapsed: float = perf_counter() - start
+                # Streamed bodies are not read here, their size is taken from the headers
+                size: int = int(response.headers.get('Content-Length', 0)) if kwargs.get('stream') \
+                    else len(response.content)
+                METRICS.observe_request(endpoint, response.status_code, elapsed, size)
+                delay: Optional[float] = self.retry_delay(response, attempt)
+            except (ConnectionError, Timeout):
+                METRICS.increment('connection_errors', endpoint)
+                if attempt >= self.max_retries:
+                    raise
+                delay = self.backoff(attempt)
+            else:
+                if delay is None or attempt >= self.max_retries:
+                    return response
+                response.close()  # Give the connection back to the pool
+
+            attempt += 1
+            with self._lock:
+                self.retries += 1
+            METRICS.increment('retries', endpoint)
+            sleep(delay)
+
+    def get(self, url: str, **kwargs) -> Response:
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> Response:
+        return self.request('POST', url, **kwargs)
+
+    def close(self) -> None:
+        self.session.close()
+
+
+_client: Optional[HttpClient] = None
+_client_lock: Lock = Lock()
+
+
+def get_http_client() -> HttpClient:
+    """
+    This function gets the process wide HTTP client, creating it on first use.
+    :return: The shared HttpClient.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = HttpClient()
+        return _client
+
+
+def configure_http_client(**kwargs) -> HttpClient:
+    """
+    This function replaces the process wide HTTP client with one built with the given settings.
+    :param kwargs: The arguments of HttpClient.
+    :return: The new shared HttpClient.
+    """
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+        _client = HttpClient(**kwargs)
+        return _client
@@ -0,0 +1,102 @@
+"""
+Incremental refresh of the repository dataset: instead of crawling every owner again, only the repositories pushed
+since the last snapshot are fetched, and they are upserted into the stored dataset by id.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from pandas import DataFrame, DatetimeTZDtype, concat, isna, to_datetime
+from codecompasslib.API.storage import Storage, get_storage
+from codecompasslib.API.get_bulk_data import collect, iter_repos_pushed_since
+
+
+def last_pushed_by_owner(df: DataFrame) -> Dict[str, Optional[str]]:
+    """
+    This function gets, for every owner of the dataset, the date of their most recent push.
+    :param df: The repository dataset, with the owner_user and date_pushed columns.
+    :return: A dictionary from owner to ISO 8601 date, None if the owner has no known push.
+    """
+    # Parsed, as the dates are strings in a CSV dataset and timestamps in a Parquet one
+    last_pushed = to_datetime(df['date_pushed'], utc=True).groupby(df['owner_user']).max()
+    return {owner: None if isna(date) else date.strftime('%Y-%m-%dT%H:%M:%SZ') for owner, date in last_pushed.items()}
+
+
+def fetch_changed_repos(last_pushed: Dict[str, Optional[str]], max_in_flight: int = 8) -> Tuple[list, list]:
+    """
+    This function gets the repositories pushed since the given dates, checking several owners at the same time.
+    Owners without changes cost a single request (and nothing against the quota when the response cache answers
+    with a 304).
+    :param last_pushed: A dictionary from owner to the date of their last known push.
+    :param max_in_flight: The maximum amount of requests sent at the same time.
+    :return: The changed repositories, and the owners that could not be checked.
+    """
+    def fetch(owner: str) -> Tuple[list, bool]:
+        return collect(iter_repos_pushed_since(owner, last_pushed[owner]))
+
+    changed: list = []
+    failed: List[str] = []
+    with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        for owner, (repos, flag) in zip(last_pushed, executor.map(fetch, last_pushed)):
+            if flag:
+                changed.extend(repos)
+            else:
+                # A partial result would move the owner's last push forward and hide the older changes
+                failed.append(owner)
+    return changed, failed
+
+
+def upsert_repos(df: DataFrame, records: list) -> DataFrame:
+    """
+    This function inserts or replaces repositories in the dataset, matching them by id.
+    Only the columns of the dataset are kept from the records.
+    :param df: The repository dataset.
+    :param records: The repositories, as returned by get_repo_fields.
+    :return: The updated dataset.
+    """
+    if not records:
+        return df
+
+    updates: DataFrame = DataFrame(records).drop_duplicates(subset='id', keep='first').set_index('id')
+    updates = updates[[column for column in df.columns if column in updates.columns]]
+    df = df.set_index('id')
+    # The records have ISO 8601 strings for dates, which would turn timestamp columns into object columns
+    for column in updates.columns:
+        values = updates[column]
+        if isinstance(df[column].dtype, DatetimeTZDtype):
+            values = to_datetime(values, utc=True)
+        updates[column] = values.astype(df[column].dtype)
+
+    existing = updates.index.isin(df.index)
+    df.loc[updates.index[existing], updates.columns] = updates[existing]
+    df = concat([df, updates[~existing]])
+    return df.rename_axis('id').reset_index()
+
+
+def refresh_dataset(df: DataFrame, max_in_flight: int = 8) -> DataFrame:
+    """
+    This function brings a repository dataset up to date by fetching only the repositories pushed since it was built.
+    :param df: The repository dataset.
+    :param max_in_flight: The maximum amount of requests sent at the same time.
+    :return: The updated dataset.
+    """
+    last_pushed: Dict[str, Optional[str]] = last_pushed_by_owner(df)
+    changed, failed = fetch_changed_repos(last_pushed, max_in_flight)
+
+    print(f"Owners checked: {len(last_pushed)}, repositories changed: {len(changed)}")
+    if failed:
+        print(f"An error occurred with {len(failed)} owners, they will be checked again on the next refresh")
+    return upsert_repos(df, changed)
+
+
+def refresh_drive_dataset(file_id: str, filename: str, folder_id: str, max_in_flight: int = 8) -> bool:
+    """
+    This function refreshes the repository dataset stored on Google Drive, or in the configured storage.
+    :param file_id: The ID of the dataset file.
+    :param filename: The name the refreshed dataset is uploaded as, its extension sets the format (e.g. .parquet).
+    :param folder_id: The folder ID in Google Drive to upload the dataset to.
+    :param max_in_flight: The maximum amount of requests sent at the same time.
+    :return: A boolean indicating if the upload was successful.
+    """
+    storage: Storage = get_storage()
+    df: DataFrame = storage.load(file_id)
+    df = refresh_dataset(df, max_in_flight)
+    return storage.save(df, filename, folder_id)
@@ -0,0 +1,171 @@
+"""
+The metrics of the crawler: request latency histograms, bytes transferred, pages, retries and cache hits per endpoint,
+and the quota left of every token. Every fetcher reports to the process wide METRICS, which can be exported as JSON
+or in the Prometheus text format to see where the crawl time goes.
+"""
+from json import dumps
+from threading import Lock
+from typing import Dict, List, Tuple
+from urllib.parse import urlparse
+
+LATENCY_BUCKETS: Tuple[float, ...] = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)  # Seconds
+PREFIX: str = 'codecompass'
+
+
+def endpoint_of(url: str) -> str:
+    """
+    This function gets the endpoint of a URL, with the user and repository names replaced by placeholders so all the
+    requests to the same endpoint are grouped together.
+    :param url: The URL of a request.
+    :return: The endpoint, e.g. /users/{user}/followers.
+    """
+    parts: List[str] = urlparse(url).path.strip('/').split('/')
+    if len(parts) >= 2 and parts[0] == 'users':
+        parts[1] = '{user}'
+    elif len(parts) >= 3 and parts[0] == 'repos':
+        parts[1:3] = ['{owner}', '{repo}']
+    return '/' + '/'.join(parts)
+
+
+class Histogram:
+    """
+    A latency histogram with cumulative buckets, as in Prometheus.
+    """
+
+    def __init__(self) -> None:
+        self.buckets: List[int] = [0] * len(LATENCY_BUCKETS)
+        self.count: int = 0
+        self.sum: float = 0.0
+
+    def observe(self, value: float) -> None:
+        for index, bound in enumerate(LATENCY_BUCKETS):
+            if value <= bound:
+                self.buckets[index] += 1
+        self.count += 1
+        self.sum += value
+
+    def to_dict(self) -> dict:
+        return {
+            'buckets': {str(bound): count for bound, count in zip(LATENCY_BUCKETS, self.buckets)},
+            'count': self.count,
+            'sum': self.sum,
+        }
+
+
+class Metrics:
+    """
+    A thread safe registry of the crawl metrics.
+    """
+
+    def __init__(self) -> None:
+        self._lock: Lock = Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        """
+        Forgets every metric recorded so far.
+        :return: Does not return anything.
+        """
+        with self._lock:
+            self._latency: Dict[str, Histogram] = {}
+            self._requests: Dict[Tuple[str, int], int] = {}  # (endpoint, status) -> count
+            self._counters: Dict[str, Dict[str, int]] = {}  # counter -> endpoint -> count
+            self._quota: Dict[Tuple[str, str], Tuple[int, float]] = {}  # (token, resource) -> (remaining, reset_at)
+
+    def observe_request(self, endpoint: str, status: int, seconds: float, size: int) -> None:
+        """
+        Records a request that got a response.
+        :param endpoint: The endpoint, see endpoint_of.
+        :param status: The status code of the response.
+        :param seconds: How long the request took.
+        :param size: The size of the response body, in bytes.
+        :return: Does not return anything.
+        """
+        with self._lock:
+            self._latency.setdefault(endpoint, Histogram()).observe(seconds)
+            self._requests[(endpoint, status)] = self._requests.get((endpoint, status), 0) + 1
+            bytes_received: Dict[str, int] = self._counters.setdefault('response_bytes', {})
+            bytes_received[endpoint] = bytes_received.get(endpoint, 0) + size
+
+    def increment(self, counter: str, endpoint: str = '', amount: int = 1) -> None:
+        """
+        Increments a counter, such as 'pages', 'retries' or 'cache_hits'.
+        :param counter: The name of the counter.
+        :param endpoint: The endpoint it is counted for, if any.
+        :param amount: How much to add.
+        :return: Does not return anything.
+        """
+        with self._lock:
+            counts: Dict[str, int] = self._counters.setdefault(counter, {})
+            counts[endpoint] = counts.get(endpoint, 0) + amount
+
+    def set_quota(self, token: str, resource: str, remaining: int, reset_at: float) -> None:
+        """
+        Records the quota left of a token.
+        :param token: The token id (never the token itself).
+        :param resource: The quota, 'core' or 'search'.
+        :param remaining: How many requests are left.
+        :param reset_at: Epoch seconds at which the quota resets.
+        :return: Does not return anything.
+        """
+        with self._lock:
+            self._quota[(token, resource)] = (remaining, reset_at)
+
+    def snapshot(self) -> dict:
+        """
+        Gets every metric recorded so far.
+        :return: A dictionary of the metrics.
+        """
+        with self._lock:
+            return {
+                'latency_seconds': {endpoint: histogram.to_dict() for endpoint, histogram in self._latency.items()},
+                'requests': {f'{endpoint} {status}': count for (endpoint, status), count in self._requests.items()},
+                'counters': {counter: dict(counts) for counter, counts in self._counters.items()},
+                'quota': {f'{token} {resource}': {'remaining': remaining, 'reset_at': reset_at}
+                          for (token, resource), (remaining, reset_at) in self._quota.items()},
+            }
+
+    def to_json(self) -> str:
+        """
+        Exports the metrics as JSON.
+        :return: The JSON document.
+        """
+        return dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self) -> str:
+        """
+        Exports the metrics in the Prometheus text exposition format.
+        :return: The metrics, one sample per line.
+        """
+        lines: List[str] = []
+        with self._lock:
+            name: str = f'{PREFIX}_http_request_duration_seconds'
+            lines.append(f'# TYPE {name} histogram')
+            for endpoint, histogram in sorted(self._latency.items()):
+                for bound, count in zip(LATENCY_BUCKETS, histogram.buckets):
+                    lines.append(f'{name}_bucket{{endpoint="{endpoint}",le="{bound}"}} {count}')
+                lines.append(f'{name}_bucket{{endpoint="{endpoint}",le="+Inf"}} {histogram.count}')
+                lines.append(f'{name}_sum{{endpoint="{endpoint}"}} {histogram.sum}')
+                lines.append(f'{name}_count{{endpoint="{endpoint}"}} {histogram.count}')
+
+            name = f'{PREFIX}_http_requests_total'
+            lines.append(f'# TYPE {name} counter')
+            for (endpoint, status), count in sorted(self._requests.items()):
+                lines.append(f'{name}{{endpoint="{endpoint}",status="{status}"}} {count}')
+
+            for counter, counts in sorted(self._counters.items()):
+                name = f'{PREFIX}_{counter}_total'
+                lines.append(f'# TYPE {name} counter')
+                for endpoint, count in sorted(counts.items()):
+                    labels: str = f'{{endpoint="{endpoint}"}}' if endpoint else ''
+                    lines.append(f'{name}{labels} {count}')
+
+            for metric, position in (('rate_limit_remaining', 0), ('rate_limit_reset_timestamp_seconds', 1)):
+                name = f'{PREFIX}_{metric}'
+                lines.append(f'# TYPE {name} gauge')
+                for (token, resource), quota in sorted(self._quota.items()):
+                    lines.append(f'{name}{{token="{token}",resource="{resource}"}} {quota[position]}')
+        return '\n'.join(lines) + '\n'
+
+
+METRICS: Metrics = Metrics()
@@ -0,0 +1,83 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from re import search
+from typing import Callable, Iterator, NamedTuple, Optional
+from requests import Response
+
+DEFAULT_MAX_ITEMS: int = 2000  # GitHub lists are capped so a single very popular user cannot stall a crawl
+
+PageFetcher = Callable[[str, Optional[dict]], Response]
+
+
+class Page(NamedTuple):
+    """
+    A page of records, with the URL of the page after it ('' on the last page).
+    """
+    records: list
+    next_url: str
+
+
+def next_page_url(link_header: Optional[str]) -> str:
+    """
+    This function gets the URL of the next page from the Link header of a paginated response.
+    :param link_header: The value of the Link header, if any.
+    :return: The URL of the next page, or an empty string if this is the last page.
+    """
+    if not link_header:
+        return ''
+    match = search(r'<([^>]+)>;\s*rel="next"', link_header)
+    return match.group(1) if match else ''
+
+
+def iter_pages(fetch_page: PageFetcher, url: str, query_parameters: Optional[dict] = None,
+               max_items: Optional[int] = DEFAULT_MAX_ITEMS, prefetch: bool = True,
+               items_key: Optional[str] = None) -> Iterator[Page]:
+    """
+    This function walks a paginated endpoint of the GitHub API, following the Link headers.
+    Page N+1 is requested in a background thread while the caller is consuming page N, and no page is requested
+    past max_items. HTTP errors are raised to the caller.
+    :param fetch_page: A function sending the request, taking the URL and the query parameters.
+    :param url: The URL of the first page.
+    :param query_parameters: The query parameters of the first page, the next URLs already carry them.
+    :param max_items: The maximum amount of records to return, None for no limit.
+    :param prefetch: Whether to request the next page in advance. Disable it when the caller usually stops early,
+    so no request is wasted.
+    :param items_key: The key of the records in the response, for endpoints answering with an object (such as
+    'items' for the search API) instead of a list.
+    :return: An iterator over the pages.
+    """
+    fetched: int = 0
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        future: Optional[Future] = executor.submit(fetch_page, url, query_parameters)
+
+        while future is not None:
+            response: Response = future.result()
+            response.raise_for_status()
+
+            records: list = response.json()[items_key] if items_key else response.json()
+            if max_items is not None:
+                records = records[:max_items - fetched]
+            fetched += len(records)
+
+            next_url: str = next_page_url(response.headers.get('Link'))
+            if not (max_items is None or fetched < max_items):
+                next_url = ''
+
+            future = executor.submit(fetch_page, next_url, None) if next_url and prefetch else None
+            yield Page(records, next_url)
+            if next_url and not prefetch:
+                future = executor.submit(fetch_page, next_url, None)
+
+
+def paginate(fetch_page: PageFetcher, url: str, query_parameters: Optional[dict] = None,
+             max_items: Optional[int] = DEFAULT_MAX_ITEMS) -> Iterator:
+    """
+    This function streams the records of a paginated endpoint of the GitHub API one by one, see iter_pages.
+    :param fetch_page: A function sending the request, taking the URL and the query parameters.
+    :param url: The URL of the first page.
+    :param query_parameters: The query parameters of the first page.
+    :param max_items: The maximum amount of records to return, None for no limit.
+    :return: An iterator over the records.
+    """
+    for page in iter_pages(fetch_page, url, query_parameters, max_items):
+        yield from page.records
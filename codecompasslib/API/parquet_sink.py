@@ -0,0 +1,91 @@
+"""
+Streams crawled repositories to a Parquet dataset, in fixed-size batches, so the memory used by a crawl stays flat
+however many repositories are collected. The dataset is partitioned by crawl date and language, and every column has
+an explicit type (booleans, integers, UTC timestamps, and topics as a list of strings).
+"""
+from datetime import datetime, timezone
+from os import makedirs
+from threading import Lock
+from typing import Iterable, List, Optional
+from uuid import uuid4
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pandas import DataFrame, read_parquet
+from codecompasslib.API.repo_records import RepoBatch
+
+PARTITION_COLUMNS: List[str] = ['crawl_date', 'language']
+
+
+class ParquetSink:
+    """
+    Buffers repository records in a columnar RepoBatch and writes them to a partitioned Parquet dataset every batch_size
+    records. It is thread safe, and can be used as a context manager to flush the last batch on exit.
+    """
+
+    def __init__(self, root: str, batch_size: int = 10000, crawl_date: Optional[str] = None) -> None:
+        """
+        :param root: The directory of the Parquet dataset.
+        :param batch_size: How many records are buffered before they are written.
+        :param crawl_date: The crawl_date partition of the records, today (UTC) by default.
+        """
+        self.root: str = root
+        self.batch_size: int = batch_size
+        self.crawl_date: str = crawl_date or datetime.now(timezone.utc).strftime('%Y-%m-%d')
+        self.written: int = 0
+        self.files: int = 0  # One per partition of every flush
+        self._batch: RepoBatch = RepoBatch()
+        self._lock: Lock = Lock()
+        makedirs(root, exist_ok=True)
+
+    def write(self, record: dict) -> None:
+        """
+        Buffers a record, writing the batch if it is full.
+        :param record: A repository, as returned by get_repo_fields.
+        :return: Does not return anything.
+        """
+        with self._lock:
+            self._batch.append(record)
+            if len(self._batch) >= self.batch_size:
+                self._flush()
+
+    def write_many(self, records: Iterable[dict]) -> None:
+        for record in records:
+            self.write(record)
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush()
+
+    def _flush(self) -> None:
+        if not len(self._batch):
+            return
+
+        table: pa.Table = self._batch.to_arrow()
+        table = table.append_column('crawl_date', pa.array([self.crawl_date] * len(table), pa.string()))
+
+        pq.write_to_dataset(table, self.root, partition_cols=PARTITION_COLUMNS, compression='zstd',
+                            basename_template=f'part-{uuid4().hex}-{{i}}.parquet', file_visitor=self._count_file)
+        self.written += len(self._batch)
+        self._batch = RepoBatch()
+
+    def _count_file(self, written_file) -> None:
+        self.files += 1
+
+    def close(self) -> None:
+        self.flush()
+
+    def __enter__(self) -> 'ParquetSink':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def read_repos_parquet(root: str, columns: Optional[List[str]] = None) -> DataFrame:
+    """
+    This function reads a Parquet dataset written by a ParquetSink.
+    :param root: The directory of the Parquet dataset.
+    :param columns: The columns to read, all of them by default.
+    :return: A DataFrame with the repositories.
+    """
+    return read_parquet(root, columns=columns)
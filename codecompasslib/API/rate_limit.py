@@ -0,0 +1,125 @@
+from threading import Lock
+from time import monotonic, sleep, time
+from typing import Mapping, Optional
+
+
+class RateLimiter:
+    """
+    Paces requests against a GitHub API quota using the X-RateLimit-Remaining and X-RateLimit-Reset headers
+    of the responses, instead of sleeping for a fixed amount of time. It is thread safe, so it can be shared by all
+    the workers of a concurrent crawl.
+    """
+
+    def __init__(self, reserve: int = 0) -> None:
+        """
+        :param reserve: How many requests of the quota to leave untouched before waiting for the reset.
+        """
+        self.reserve: int = reserve
+        self.remaining: Optional[int] = None  # None until the first response tells us the quota
+        self.reset_at: float = 0.0  # Epoch seconds at which the quota resets
+        self._lock: Lock = Lock()
+
+    def try_acquire(self) -> float:
+        """
+        Reserves a request if the quota allows it, without blocking.
+        :return: 0 if the request was reserved, else how many seconds are left until the quota resets.
+        """
+        with self._lock:
+            if self.remaining is not None and self.remaining <= self.reserve:
+                delay: float = self.reset_at - time()
+                if delay > 0:
+                    return delay
+                # The window rolled over, the next response will tell us the new quota
+                self.remaining = None
+
+            if self.remaining is not None:
+                self.remaining -= 1
+            return 0.0
+
+    def acquire(self) -> None:
+        """
+        Blocks until a request can be sent without exceeding the quota, and reserves it.
+        :return: Does not return anything.
+        """
+        delay: float = self.try_acquire()
+        while delay > 0:
+            print(f"Rate limit reached, waiting {delay:.0f} seconds for the reset.")
+            sleep(delay + 1)  # One extra second to absorb clock skew with the API
+            delay = self.try_acquire()
+
+    def update(self, headers: Mapping[str, str]) -> None:
+        """
+        Updates the known quota from the headers of a response.
+        :param headers: The response headers.
+        :return: Does not return anything.
+        """
+        remaining: Optional[str] = headers.get('X-RateLimit-Remaining')
+        reset: Optional[str] = headers.get('X-RateLimit-Reset')
+        if remaining is None or reset is None:
+            return
+
+        with self._lock:
+            if self.remaining is None or float(reset) > self.reset_at:
+                self.remaining = int(remaining)
+                self.reset_at = float(reset)
+            else:
+                # Responses of concurrent requests can arrive out of order, the lowest value is the freshest one
+                self.remaining = min(self.remaining, int(remaining))
+
+
+class TokenBucket:
+    """
+    Paces requests against a per-minute budget, e.g. the tokens-per-minute limit of the OpenAI API: the budget refills
+    continuously, and a request waits until the budget covers its cost. It is thread safe, and pause() makes every
+    worker wait, for when the API answers that the limit was hit anyway.
+    """
+
+    def __init__(self, per_minute: float) -> None:
+        """
+        :param per_minute: The budget per minute, also the largest burst.
+        """
+        self.capacity: float = per_minute
+        self.available: float = per_minute
+        self.paused_until: float = 0.0
+        self._updated_at: float = monotonic()
+        self._lock: Lock = Lock()
+
+    def try_acquire(self, cost: float) -> float:
+        """
+        Takes cost out of the budget if it allows it, without blocking.
+        :param cost: The cost of the request, capped to the capacity so a large request can still go through.
+        :return: 0 if the budget was taken, else how many seconds to wait before trying again.
+        """
+        cost = min(cost, self.capacity)
+        with self._lock:
+            now: float = monotonic()
+            if now < self.paused_until:
+                return self.paused_until - now
+            self.available = min(self.capacity, self.available + (now - self._updated_at) * self.capacity / 60)
+            self._updated_at = now
+            if self.available < cost:
+                return (cost - self.available) * 60 / self.capacity
+            self.available -= cost
+            return 0.0
+
+    def acquire(self, cost: float) -> None:
+        """
+        Blocks until the budget covers the cost of a request, and takes it.
+        :param cost: The cost of the request.
+        :return: Does not return anything.
+        """
+        delay: float = self.try_acquire(cost)
+        while delay > 0:
+            sleep(delay)
+            delay = self.try_acquire(cost)
+
+    def pause(self, seconds: float) -> None:
+        """
+        Stops every request for a while, and empties the budget so it resumes slowly.
+        :param seconds: How long to wait.
+        :return: Does not return anything.
+        """
+        with self._lock:
+            self.paused_until = max(self.paused_until, monotonic() + seconds)
+            self.available = 0.0
+            self._updated_at = self.paused_until
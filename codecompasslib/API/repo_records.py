@@ -0,0 +1,185 @@
+"""
+A compact, columnar representation of crawled repositories. Instead of one 28-key dictionary per repository, a
+RepoBatch keeps one typed column per field: integers and booleans in packed arrays, timestamps as epoch seconds, and
+the strings repeated across repositories (owner, language, license, ...) interned so they are stored once.
+The batch converts to Arrow and pandas column by column, without going through a list of dictionaries.
+"""
+from array import array
+from datetime import datetime, timezone
+from sys import intern
+from typing import Dict, Iterable, Iterator, List, Optional
+import numpy as np
+import pyarrow as pa
+from pandas import DataFrame
+
+TIMESTAMP: pa.DataType = pa.timestamp('s', tz='UTC')
+
+# The fields of helper_functions.get_repo_fields, with their types
+REPO_SCHEMA: pa.Schema = pa.schema([
+    ('id', pa.int64()),
+    ('name', pa.string()),
+    ('owner_user', pa.string()),
+    ('owner_type', pa.string()),
+    ('description', pa.string()),
+    ('url', pa.string()),
+    ('is_fork', pa.bool_()),
+    ('date_created', TIMESTAMP),
+    ('date_updated', TIMESTAMP),
+    ('date_pushed', TIMESTAMP),
+    ('size', pa.int64()),
+    ('stars', pa.int64()),
+    ('watchers', pa.int64()),
+    ('updated_at', TIMESTAMP),
+    ('language', pa.string()),
+    ('has_issues', pa.bool_()),
+    ('has_projects', pa.bool_()),
+    ('has_downloads', pa.bool_()),
+    ('has_wiki', pa.bool_()),
+    ('has_pages', pa.bool_()),
+    ('has _discussions', pa.bool_()),
+    ('num_forks', pa.int64()),
+    ('is_archived', pa.bool_()),
+    ('is_disabled', pa.bool_()),
+    ('is_template', pa.bool_()),
+    ('license', pa.string()),
+    ('open_issues', pa.int64()),
+    ('topics', pa.list_(pa.string())),
+])
+TIMESTAMP_COLUMNS: tuple = tuple(field.name for field in REPO_SCHEMA if field.type == TIMESTAMP)
+INTERNED_COLUMNS: tuple = ('owner_user', 'owner_type', 'language', 'license')
+NULL_INT: int = -2 ** 63  # Stands for a missing integer or timestamp in the packed columns
+NULL_BOOL: int = 2  # Stands for a missing boolean in the packed columns
+
+
+def parse_timestamp(value: Optional[str]) -> int:
+    """
+    This function parses an ISO 8601 date of the GitHub API (e.g. 2024-01-31T12:00:00Z) into epoch seconds.
+    :param value: The date, if any.
+    :return: The epoch seconds, NULL_INT if there is no date.
+    """
+    if not value:
+        return NULL_INT
+    return int(datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp())
+
+
+def format_timestamp(value: int) -> Optional[str]:
+    """
+    This function formats epoch seconds as an ISO 8601 date, as returned by the GitHub API.
+    :param value: The epoch seconds, NULL_INT if there is no date.
+    :return: The date, None if there is no date.
+    """
+    if value == NULL_INT:
+        return None
+    return datetime.fromtimestamp(value, timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+class RepoBatch:
+    """
+    A growing batch of repositories, stored column by column. Records are appended as returned by get_repo_fields,
+    and read back the same way when the batch is iterated or indexed.
+    """
+    __slots__ = ('_ints', '_bools', '_strings', '_topics', '_length')
+
+    def __init__(self, records: Iterable[dict] = ()) -> None:
+        """
+        :param records: Repositories to start the batch with, as returned by get_repo_fields.
+        """
+        self._ints: Dict[str, array] = {}  # Integers and timestamps, as signed 64-bit integers
+        self._bools: Dict[str, bytearray] = {}
+        self._strings: Dict[str, list] = {}
+        self._topics: List[tuple] = []
+        for field in REPO_SCHEMA:
+            if pa.types.is_integer(field.type) or field.type == TIMESTAMP:
+                self._ints[field.name] = array('q')
+            elif pa.types.is_boolean(field.type):
+                self._bools[field.name] = bytearray()
+            elif pa.types.is_string(field.type):
+                self._strings[field.name] = []
+        self._length: int = 0
+        self.extend(records)
+
+    def append(self, record: dict) -> None:
+        """
+        Adds a repository to the batch.
+        :param record: A repository, as returned by get_repo_fields.
+        :return: Does not return anything.
+        """
+        for name, column in self._ints.items():
+            value = record.get(name)
+            if name in TIMESTAMP_COLUMNS:
+                column.append(parse_timestamp(value))
+            else:
+                column.append(NULL_INT if value is None else value)
+        for name, column in self._bools.items():
+            value = record.get(name)
+            column.append(NULL_BOOL if value is None else bool(value))
+        for name, column in self._strings.items():
+            value = record.get(name)
+            column.append(intern(value) if name in INTERNED_COLUMNS and value is not None else value)
+        self._topics.append(tuple(intern(topic) for topic in record.get('topics') or ()))
+        self._length += 1
+
+    def extend(self, records: Iterable[dict]) -> None:
+        for record in records:
+            self.append(record)
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __getitem__(self, index: int) -> dict:
+        """
+        Rebuilds a repository as returned by get_repo_fields.
+        :param index: The position of the repository in the batch.
+        :return: The repository.
+        """
+        if not -self._length <= index < self._length:
+            raise IndexError("RepoBatch index out of range")
+        record: dict = {}
+        for field in REPO_SCHEMA:
+            name: str = field.name
+            if name in self._ints:
+                value = self._ints[name][index]
+                if name in TIMESTAMP_COLUMNS:
+                    record[name] = format_timestamp(value)
+                else:
+                    record[name] = None if value == NULL_INT else value
+            elif name in self._bools:
+                value = self._bools[name][index]
+                record[name] = None if value == NULL_BOOL else bool(value)
+            elif name in self._strings:
+                record[name] = self._strings[name][index]
+            else:
+                record[name] = list(self._topics[index])
+        return record
+
+    def __iter__(self) -> Iterator[dict]:
+        for index in range(self._length):
+            yield self[index]
+
+    def to_arrow(self) -> pa.Table:
+        """
+        Converts the batch to an Arrow table with REPO_SCHEMA. The packed columns are handed over to Arrow without
+        going through Python objects.
+        :return: The table.
+        """
+        arrays: list = []
+        for field in REPO_SCHEMA:
+            name: str = field.name
+            if name in self._ints:
+                values: np.ndarray = np.frombuffer(self._ints[name], dtype=np.int64)
+                arrays.append(pa.array(values, field.type, mask=values == NULL_INT))
+            elif name in self._bools:
+                flags: np.ndarray = np.frombuffer(self._bools[name], dtype=np.uint8)
+                arrays.append(pa.array(flags == 1, field.type, mask=flags == NULL_BOOL))
+            elif name in self._strings:
+                arrays.append(pa.array(self._strings[name], field.type))
+            else:
+                arrays.append(pa.array(self._topics, field.type))
+        return pa.Table.from_arrays(arrays, schema=REPO_SCHEMA)
+
+    def to_dataframe(self) -> DataFrame:
+        """
+        Converts the batch to a DataFrame, with typed columns (integers, booleans and UTC timestamps).
+        :return: The DataFrame.
+        """
+        return self.to_arrow().to_pandas()
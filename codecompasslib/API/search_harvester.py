@@ -0,0 +1,102 @@
+"""
+Harvests the repository search API: the queries run concurrently, and the results are deduplicated by repository id
+as they come in. By default only the first results of every query are read. Read in full, a query matching more than
+the 1000 repositories the API returns is split into creation date ranges (created:A..B) until every range fits under
+the cap, which can take thousands of requests for a broad query.
+"""
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from requests import Response
+from requests.exceptions import HTTPError
+from codecompasslib.API.paginator import PageFetcher, iter_pages, next_page_url
+
+SEARCH_RESULT_CAP: int = 1000  # The search API never returns more results than this for a query
+SEARCH_START: date = date(2007, 10, 1)  # No repository was created before GitHub existed
+SEARCH_MAX_RESULTS: int = 100  # Results read per query by default, a single request
+
+DateRange = Tuple[date, date]
+
+
+def search_slice(fetch_page: PageFetcher, url: str, query: str, start: date, end: date,
+                 max_items: Optional[int] = None) -> Tuple[list, List[DateRange]]:
+    """
+    Gets the repositories matching a query created between two dates (both included), or, if there are more than
+    the API can return and max_items is None, the two halves of the range to search instead.
+    HTTP errors are raised to the caller.
+    :param fetch_page: A function sending the request, taking the URL and the query parameters.
+    :param url: The URL of the search endpoint.
+    :param query: The search query, without the created qualifier.
+    :param start: The first creation date.
+    :param end: The last creation date.
+    :param max_items: The maximum amount of repositories to return, None to return all of them.
+    :return: The repositories, and the date ranges to search instead of this one.
+    """
+    limit: int = SEARCH_RESULT_CAP if max_items is None else min(max_items, SEARCH_RESULT_CAP)
+    query_parameters: dict = {
+        'q': f'{query} created:{start.isoformat()}..{end.isoformat()}',
+        'per_page': min(limit, 100),
+    }
+    response: Response = fetch_page(url, query_parameters)
+    response.raise_for_status()
+    body: dict = response.json()
+
+    if max_items is None and body['total_count'] > SEARCH_RESULT_CAP:
+        if start < end:
+            middle: date = start + (end - start) // 2
+            return [], [(start, middle), (middle + timedelta(days=1), end)]
+        print(f"More than {SEARCH_RESULT_CAP} repositories were created on {start} for query: {query}, "
+              f"only the first {SEARCH_RESULT_CAP} are kept.")
+
+    items: list = list(body['items'])[:limit]
+    next_url: str = next_page_url(response.headers.get('Link'))
+    if next_url and len(items) < limit:
+        for page in iter_pages(fetch_page, next_url, None, limit - len(items), items_key='items'):
+            items.extend(page.records)
+    return items, []
+
+
+def harvest_search(fetch_page: PageFetcher, url: str, queries: Iterable[str], max_in_flight: int = 4,
+                   start: date = SEARCH_START, end: Optional[date] = None,
+                   max_results: Optional[int] = SEARCH_MAX_RESULTS) -> Iterator[dict]:
+    """
+    Streams the repositories matching any of the queries, each of them once.
+    The queries and their date ranges are searched at most max_in_flight at a time, and the pacing against the search
+    quota is left to fetch_page. A failing query (or date range of a query) is reported and skipped, the other ones
+    carry on.
+    :param fetch_page: A function sending the request, taking the URL and the query parameters.
+    :param url: The URL of the search endpoint.
+    :param queries: The search queries.
+    :param max_in_flight: The maximum amount of requests sent at the same time.
+    :param start: The first creation date to search.
+    :param end: The last creation date to search, today (UTC) by default.
+    :param max_results: The maximum amount of repositories read per query, None to read every matching repository by
+    splitting the queries by creation date.
+    :return: An iterator over the repositories, as returned by the API.
+    """
+    end = end or datetime.now(timezone.utc).date()
+    seen: set = set()
+
+    with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        pending: Dict[Future, str] = {
+            executor.submit(search_slice, fetch_page, url, query, start, end, max_results): query for query in queries
+        }
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                query: str = pending.pop(future)
+                try:
+                    items, ranges = future.result()
+                except HTTPError as err:
+                    print(f"HTTP error occurred with query: {query}: {err}")
+                    continue
+                except Exception as err:
+                    print(f"An error occurred with query: {query}: {err}")
+                    continue
+
+                for range_start, range_end in ranges:
+                    pending[executor.submit(search_slice, fetch_page, url, query, range_start, range_end)] = query
+                for item in items:
+                    if item['id'] not in seen:
+                        seen.add(item['id'])
+                        yield item
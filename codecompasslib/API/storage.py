@@ -0,0 +1,198 @@
+"""
+Where the datasets are stored. The loaders and uploaders of the models go through a Storage instead of calling Google
+Drive directly, so the whole pipeline can also run on a local directory, e.g. to benchmark it or to deploy it without
+network access. The backend is chosen by the CODECOMPASS_STORAGE environment variable ('drive', the default, or
+'local'); the local directory is CODECOMPASS_DATA_DIR, codecompasslib/Data by default.
+"""
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from os import environ, makedirs, remove, replace, stat
+from os.path import abspath, exists, join
+from tempfile import mkstemp
+from threading import Lock
+from typing import List, Optional
+from urllib.parse import quote
+from pandas import DataFrame
+from google.oauth2.credentials import Credentials
+from codecompasslib.API.drive_operations import (DATASET_FORMATS, dataset_format, download_pd_dataframe,
+                                                 get_creds_drive, get_drive_service, read_dataset,
+                                                 upload_df_to_drive, write_dataset)
+from codecompasslib.API.helper_functions import PARENT_PATH
+
+STORAGE_BACKENDS: tuple = ('drive', 'local')
+DATA_DIR: str = PARENT_PATH + '/Data'
+
+
+class Storage(ABC):
+    """
+    A place datasets are loaded from and saved to. Files are identified by an ID and saved by name in a folder.
+    """
+
+    @abstractmethod
+    def load(self, file_id: str) -> DataFrame:
+        """
+        Loads a dataset.
+        :param file_id: The ID of the file.
+        :return: A Pandas DataFrame with the contents of the file.
+        """
+
+    def load_many(self, file_ids: List[str], max_workers: int = 4) -> List[DataFrame]:
+        """
+        Loads several datasets at the same time.
+        :param file_ids: The IDs of the files.
+        :param max_workers: How many files are loaded at the same time.
+        :return: A Pandas DataFrame per file, in the order of file_ids.
+        """
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(self.load, file_ids))
+
+    @abstractmethod
+    def save(self, df: DataFrame, filename: str, folder_id: str) -> bool:
+        """
+        Saves a dataset, replacing the file with the same name in the folder if any.
+        :param df: A Pandas DataFrame.
+        :param filename: The name of the file, its extension sets the format (see dataset_format).
+        :param folder_id: The folder to save the file in.
+        :return: A boolean indicating if the dataset was saved.
+        """
+
+    @abstractmethod
+    def version(self, file_id: str) -> str:
+        """
+        Identifies the current contents of a file, without loading it.
+        :param file_id: The ID of the file.
+        :return: A string that changes whenever the file changes.
+        """
+
+    def store_name(self, file_id: str) -> str:
+        """
+        :param file_id: The ID of a file.
+        :return: The name of the directory its EmbeddingStore is kept in, see embedding_store.load_embeddings.
+        """
+        return quote(file_id, safe='')
+
+
+class DriveStorage(Storage):
+    """
+    Datasets stored on Google Drive, identified by their Drive file ID.
+    """
+
+    def __init__(self, creds: Optional[Credentials] = None) -> None:
+        """
+        :param creds: The Google Drive API credentials, loaded with get_creds_drive when first needed by default.
+        """
+        self._creds: Optional[Credentials] = creds
+
+    @property
+    def creds(self) -> Credentials:
+        return self._creds or get_creds_drive()
+
+    def load(self, file_id: str) -> DataFrame:
+        return download_pd_dataframe(self.creds, file_id)
+
+    def save(self, df: DataFrame, filename: str, folder_id: str) -> bool:
+        return upload_df_to_drive(self.creds, df, filename, folder_id)
+
+    def version(self, file_id: str) -> str:
+        metadata: dict = get_drive_service(self.creds).files().get(
+            fileId=file_id, fields='md5Checksum, modifiedTime', supportsAllDrives=True).execute()
+        return f"{metadata.get('md5Checksum')}:{metadata.get('modifiedTime')}"
+
+
+class LocalStorage(Storage):
+    """
+    Datasets stored in a local directory. A file ID is the path of the file relative to the directory, with or without
+    its extension, so a directory of files named after their Drive file ID can stand in for Drive. Folders are
+    subdirectories. Parquet and Feather files are memory-mapped rather than read into memory first.
+    """
+
+    def __init__(self, root: str = DATA_DIR) -> None:
+        """
+        :param root: The directory of the datasets.
+        """
+        self.root: str = root
+
+    def path(self, file_id: str) -> str:
+        """
+        :param file_id: The ID of a file.
+        :return: The path of the file.
+        """
+        for path in [join(self.root, file_id)] + [join(self.root, f'{file_id}.{extension}')
+                                                   for extension in DATASET_FORMATS]:
+            if exists(path):
+                return path
+        raise FileNotFoundError(f"No dataset {file_id} in {self.root}")
+
+    def load(self, file_id: str) -> DataFrame:
+        path: str = self.path(file_id)
+        return read_dataset(path, dataset_format(path), memory_map=True)
+
+    def version(self, file_id: str) -> str:
+        status = stat(self.path(file_id))
+        return f'{status.st_mtime_ns}:{status.st_size}'
+
+    def store_name(self, file_id: str) -> str:
+        # Two local directories can hold files with the same ID
+        return quote(abspath(self.path(file_id)), safe='')
+
+    def save(self, df: DataFrame, filename: str, folder_id: str) -> bool:
+        folder: str = join(self.root, folder_id)
+        temp_path: Optional[str] = None
+        try:
+            makedirs(folder, exist_ok=True)
+            # Written next to the final file and moved in place, so a reader never sees half a dataset
+            descriptor, temp_path = mkstemp(dir=folder, suffix='.part')
+            with open(descriptor, 'wb') as file:
+                write_dataset(df, file, dataset_format(filename))
+            replace(temp_path, join(folder, filename))
+            print(f'\nFile saved to {join(folder, filename)}')
+            return True
+        except OSError as error:
+            print(f"An error occurred: {error}")
+            if temp_path is not None and exists(temp_path):
+                remove(temp_path)
+            return False
+
+
+_storage: Optional[Storage] = None
+_storage_lock: Lock = Lock()
+
+
+def create_storage(backend: str, **kwargs) -> Storage:
+    """
+    This function creates a storage backend.
+    :param backend: 'drive' or 'local'.
+    :param kwargs: The arguments of the backend class.
+    :return: The new Storage.
+    """
+    if backend not in STORAGE_BACKENDS:
+        raise ValueError(f"Unknown storage backend {backend}, expected one of {', '.join(STORAGE_BACKENDS)}")
+    return DriveStorage(**kwargs) if backend == 'drive' else LocalStorage(**kwargs)
+
+
+def get_storage() -> Storage:
+    """
+    This function gets the process wide storage, created on first use from the CODECOMPASS_STORAGE and
+    CODECOMPASS_DATA_DIR environment variables.
+    :return: The shared Storage.
+    """
+    global _storage
+    with _storage_lock:
+        if _storage is None:
+            backend: str = environ.get('CODECOMPASS_STORAGE', 'drive')
+            kwargs: dict = {'root': environ.get('CODECOMPASS_DATA_DIR', DATA_DIR)} if backend == 'local' else {}
+            _storage = create_storage(backend, **kwargs)
+        return _storage
+
+
+def configure_storage(backend: str, **kwargs) -> Storage:
+    """
+    This function replaces the process wide storage.
+    :param backend: 'drive' or 'local'.
+    :param kwargs: The arguments of the backend class, e.g. root for 'local'.
+    :return: The new shared Storage.
+    """
+    global _storage
+    with _storage_lock:
+        _storage = create_storage(backend, **kwargs)
+        return _storage
@@ -0,0 +1,82 @@
+from threading import Lock
+from time import sleep
+from typing import Dict, List, Mapping
+from codecompasslib.API.metrics import METRICS
+from codecompasslib.API.rate_limit import RateLimiter
+
+RESOURCES: tuple = ('core', 'search')  # The GitHub API quotas, every token has one of each
+
+
+class TokenPool:
+    """
+    A pool of GitHub tokens: every request is sent with the token that has the most quota left, and exhausted tokens
+    are parked until their quota resets, so the crawl throughput is the sum of the quotas of all the tokens.
+    """
+
+    def __init__(self, tokens: List[str], reserve: int = 0) -> None:
+        """
+        :param tokens: The GitHub tokens.
+        :param reserve: How many requests of each quota to leave untouched.
+        """
+        if not tokens:
+            raise ValueError("The token pool needs at least one token.")
+        self.tokens: List[str] = list(tokens)
+        # Tokens are identified by their position and last 4 characters, never in full
+        self._ids: Dict[str, str] = {token: f'{index}:...{token[-4:]}' for index, token in enumerate(self.tokens)}
+        self._limiters: Dict[str, Dict[str, RateLimiter]] = {
+            token: {resource: RateLimiter(reserve) for resource in RESOURCES} for token in self.tokens
+        }
+        self._requests: Dict[str, int] = {token: 0 for token in self.tokens}
+        self._lock: Lock = Lock()
+
+    def acquire(self, resource: str = 'core') -> str:
+        """
+        Picks the token with the most quota left for a request, blocking while every token is exhausted.
+        :param resource: The quota the request counts against, 'core' or 'search'.
+        :return: The token to send the request with.
+        """
+        def quota_left(token: str) -> float:
+            remaining = self._limiters[token][resource].remaining
+            return float('inf') if remaining is None else remaining  # Tokens never used yet have a full quota
+
+        while True:
+            with self._lock:
+                ranked: List[str] = sorted(self.tokens, key=quota_left, reverse=True)
+                delays: List[float] = []
+                for token in ranked:
+                    delay: float = self._limiters[token][resource].try_acquire()
+                    if delay == 0:
+                        self._requests[token] += 1
+                        return token
+                    delays.append(delay)
+
+            print(f"Every token reached its {resource} rate limit, waiting {min(delays):.0f} seconds for a reset.")
+            sleep(min(delays) + 1)  # One extra second to absorb clock skew with the API
+
+    def update(self, token: str, resource: str, headers: Mapping[str, str]) -> None:
+        """
+        Updates the known quota of a token from the headers of a response sent with it, and reports it to METRICS.
+        :param token: The token the request was sent with.
+        :param resource: The quota the request counted against.
+        :param headers: The response headers.
+        :return: Does not return anything.
+        """
+        limiter: RateLimiter = self._limiters[token][resource]
+        limiter.update(headers)
+        if limiter.remaining is not None:
+            METRICS.set_quota(self._ids[token], resource, limiter.remaining, limiter.reset_at)
+
+    def metrics(self) -> dict:
+        """
+        Gets the usage of every token.
+        :return: A dictionary from token id to its request count and quotas.
+        """
+        with self._lock:
+            return {
+                self._ids[token]: {
+                    'requests': self._requests[token],
+                    **{resource: {'remaining': limiter.remaining, 'reset_at': limiter.reset_at}
+                       for resource, limiter in self._limiters[token].items()},
+                }
+                for token in self.tokens
+            }
@@ -1,8 +1,8 @@
 """
 Includes utility functions for making API requests and preprocessing responses.
 """
-import requests
 from typing import Dict, Any, Union
+from codecompasslib.API.http_session import get_http_client
 from codecompasslib.chatbot.secrets_manager import load_github_token
 
 
@@ -26,6 +26,7 @@ def make_api_request(endpoint_url: str, params: Dict[str, Any]) -> Union[Dict[st
     """
     Makes a POST request to the specified API endpoint with given parameters and returns the processed JSON response.
     Removes the 'usefulUrls' field from the response if it exists. In case of an error, returns an error message.
+    The request goes through the shared HTTP client, so connections are reused and transient errors are retried.
 
     :param endpoint_url: The URL of the API endpoint to which the request is made.
     :param params: A dictionary of parameters to be sent in the request.
@@ -39,7 +40,7 @@ def make_api_request(endpoint_url: str, params: Dict[str, Any]) -> Union[Dict[st
         "Content-Type": "application/json"
     }
 
-    response = requests.post(endpoint_url, json=params, headers=headers)
+    response = get_http_client().post(endpoint_url, json=params, headers=headers)
 
     if response.status_code == 200:
         response_json = response.json()
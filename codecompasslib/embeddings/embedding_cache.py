@@ -0,0 +1,144 @@
+"""
+A persistent cache of text embeddings, so regenerating the embedded dataset only sends the descriptions that changed
+since the last run to the embedding provider. The embeddings are keyed by model, dimensions and a hash of the
+normalized text, and stored as float16 vectors in SQLite.
+"""
+from hashlib import blake2b
+from os import makedirs
+from os.path import dirname
+from sqlite3 import Connection, connect
+from threading import Lock
+from typing import Callable, Dict, List, Optional
+from unicodedata import normalize
+import numpy as np
+from codecompasslib.API.helper_functions import OUTER_PATH
+
+EMBEDDING_CACHE_PATH: str = OUTER_PATH + '/.cache/embeddings/cache.sqlite'
+LOOKUP_CHUNK: int = 500  # Hashes looked up per query, below the SQLite limit of bound parameters
+
+
+def normalize_text(text: str) -> str:
+    """
+    This function normalizes a text before it is hashed, so texts that only differ in their Unicode composition or
+    whitespace share an embedding.
+    :param text: The text.
+    :return: The normalized text.
+    """
+    return ' '.join(normalize('NFC', text).split())
+
+
+def text_hash(text: str) -> bytes:
+    """
+    This function hashes a normalized text into the key of its embedding.
+    :param text: The text.
+    :return: A 16-byte digest.
+    """
+    return blake2b(normalize_text(text).encode(), digest_size=16).digest()
+
+
+class EmbeddingCache:
+    """
+    A cache of embeddings on the local disk. It is thread safe.
+    """
+
+    def __init__(self, path: str = EMBEDDING_CACHE_PATH) -> None:
+        """
+        :param path: The path of the SQLite database, created if it does not exist.
+        """
+        self.path: str = path
+        self.hits: int = 0
+        self.misses: int = 0
+        self._connection: Optional[Connection] = None
+        self._lock: Lock = Lock()
+
+    def _connect(self) -> Connection:
+        # The database is only opened on first use, so importing the embedding modules does not touch the disk
+        if self._connection is None:
+            makedirs(dirname(self.path) or '.', exist_ok=True)
+            self._connection = connect(self.path, check_same_thread=False)
+            self._connection.execute('CREATE TABLE IF NOT EXISTS embeddings (model TEXT NOT NULL, '
+                                     'dimensions INTEGER NOT NULL, text_hash BLOB NOT NULL, vector BLOB NOT NULL, '
+                                     'PRIMARY KEY (model, dimensions, text_hash)) WITHOUT ROWID')
+        return self._connection
+
+    def get_many(self, model: str, dimensions: int, texts: List[str]) -> List[Optional[np.ndarray]]:
+        """
+        Looks up the embeddings of texts.
+        :param model: The embedding model.
+        :param dimensions: The size of the embeddings, 0 for the native size of the model.
+        :param texts: The texts.
+        :return: The float16 embedding of every text, None for the texts that are not cached.
+        """
+        hashes: List[bytes] = [text_hash(text) for text in texts]
+        found: Dict[bytes, bytes] = {}
+        with self._lock:
+            connection: Connection = self._connect()
+            for start in range(0, len(hashes), LOOKUP_CHUNK):
+                chunk: List[bytes] = hashes[start:start + LOOKUP_CHUNK]
+                found.update(connection.execute(
+                    f'SELECT text_hash, vector FROM embeddings WHERE model = ? AND dimensions = ? '
+                    f'AND text_hash IN ({", ".join("?" * len(chunk))})', [model, dimensions, *chunk]).fetchall())
+            vectors: List[Optional[np.ndarray]] = [
+                np.frombuffer(found[key], dtype=np.float16) if key in found else None for key in hashes]
+            self.hits += sum(vector is not None for vector in vectors)
+            self.misses += sum(vector is None for vector in vectors)
+        return vectors
+
+    def put_many(self, model: str, dimensions: int, texts: List[str], vectors: np.ndarray) -> None:
+        """
+        Stores the embeddings of texts.
+        :param model: The embedding model.
+        :param dimensions: The size of the embeddings, 0 for the native size of the model.
+        :param texts: The texts.
+        :param vectors: Their embeddings, one row per text.
+        :return: Does not return anything.
+        """
+        rows: list = [(model, dimensions, text_hash(text), np.asarray(vector, dtype=np.float16).tobytes())
+                      for text, vector in zip(texts, vectors)]
+        with self._lock:
+            connection: Connection = self._connect()
+            with connection:
+                connection.executemany('INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)', rows)
+
+    def embed(self, model: str, dimensions: int, texts: List[str],
+              embed_misses: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+        """
+        Embeds texts, only sending the ones that are not cached to the provider, each of them once.
+        :param model: The embedding model.
+        :param dimensions: The size of the embeddings, 0 for the native size of the model.
+        :param texts: The texts.
+        :param embed_misses: Embeds a list of texts, one row per text.
+        :return: The float16 embeddings, one row per text.
+        """
+        vectors: List[Optional[np.ndarray]] = self.get_many(model, dimensions, texts)
+        missing: Dict[bytes, str] = {}  # The first of the texts sharing a hash stands for all of them
+        for text, vector in zip(texts, vectors):
+            if vector is None:
+                missing.setdefault(text_hash(text), text)
+
+        if missing:
+            computed: np.ndarray = np.asarray(embed_misses(list(missing.values())), dtype=np.float16)
+            self.put_many(model, dimensions, list(missing.values()), computed)
+            by_hash: Dict[bytes, np.ndarray] = dict(zip(missing, computed))
+            vectors = [by_hash[text_hash(text)] if vector is None else vector for text, vector in zip(texts, vectors)]
+        return np.stack(vectors) if vectors else np.empty((0, dimensions), dtype=np.float16)
+
+    def stats(self) -> dict:
+        """
+        :return: The hit/miss counters, in texts, and the amount of cached embeddings.
+        """
+        with self._lock:
+            size: int = self._connect().execute('SELECT COUNT(*) FROM embeddings').fetchone()[0]
+        lookups: int = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'embeddings': size,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
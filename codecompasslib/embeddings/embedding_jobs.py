@@ -0,0 +1,219 @@
+"""
+A resumable job that embeds a text column of a dataset with the OpenAI API. The texts are sent in batches, several
+at a time, paced by a tokens-per-minute budget and retried with backoff when the API is rate limited or failing.
+Every finished batch is written to its own Parquet file in the job directory and recorded in a checkpoint, so a job
+that is run again after a crash only embeds the batches that were not finished. The directory is removed once the job
+is done.
+"""
+from concurrent.futures import ALL_COMPLETED, FIRST_COMPLETED, ThreadPoolExecutor, wait
+from hashlib import md5
+from os import makedirs, replace
+from os.path import join
+from random import uniform
+from shutil import rmtree
+from sqlite3 import Connection, connect
+from threading import Lock
+from time import sleep
+from typing import Callable, List, Optional, Set
+import numpy as np
+import openai
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pandas import DataFrame
+from codecompasslib.API.helper_functions import OUTER_PATH
+from codecompasslib.API.rate_limit import TokenBucket
+from codecompasslib.embeddings.embedding_cache import EmbeddingCache
+
+EMBEDDING_JOBS_DIR: str = OUTER_PATH + '/.cache/embeddings'
+EMBEDDING_BATCH_SIZE: int = 2040
+OPENAI_EMBEDDING_MODEL: str = 'text-embedding-3-large'
+OPENAI_EMBEDDING_DIMENSIONS: int = 256
+EMBEDDING_TOKENS_PER_MINUTE: int = 1000000  # The limit of text-embedding-3-large on the first usage tier
+MAX_RETRIES: int = 8
+RETRYABLE_ERRORS: tuple = (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError)
+
+
+def estimate_tokens(texts: List[str]) -> int:
+    """
+    This function estimates how many tokens texts count, at about four characters per token in English.
+    :param texts: The texts.
+    :return: The estimated amount of tokens.
+    """
+    return sum(len(text) // 4 + 1 for text in texts)
+
+
+def retry_after(error: Exception) -> Optional[float]:
+    """
+    This function reads the wait asked for by a rate limited answer of the OpenAI API.
+    :param error: The error raised by the client.
+    :return: The wait in seconds, or None if the answer does not ask for one.
+    """
+    response = getattr(error, 'response', None)
+    if response is None:
+        return None
+    if response.headers.get('retry-after-ms', '').isdigit():
+        return int(response.headers['retry-after-ms']) / 1000
+    if response.headers.get('retry-after', '').isdigit():
+        return float(response.headers['retry-after'])
+    return None
+
+
+class EmbeddingCheckpoint:
+    """
+    The batches of an embedding job that are finished, persisted in a SQLite database. The database also keeps a
+    fingerprint of the input of the job, so a job directory is never resumed with different texts or batches.
+    """
+
+    def __init__(self, path: str, fingerprint: str) -> None:
+        """
+        :param path: The path of the SQLite database.
+        :param fingerprint: Identifies the input of the job, see job_fingerprint.
+        """
+        self._connection: Connection = connect(path, check_same_thread=False)
+        self._connection.executescript('''
+            CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS batches (offset INTEGER PRIMARY KEY, rows INTEGER NOT NULL);
+        ''')
+        self._lock: Lock = Lock()
+        with self._connection:
+            self._connection.execute("INSERT OR IGNORE INTO settings VALUES ('fingerprint', ?)", (fingerprint,))
+        stored: str = self._connection.execute("SELECT value FROM settings WHERE key = 'fingerprint'").fetchone()[0]
+        if stored != fingerprint:
+            self._connection.close()
+            raise ValueError(f"The checkpoint {path} belongs to a job with a different input, remove its directory "
+                             f"to start over")
+
+    def completed(self) -> Set[int]:
+        """
+        :return: The offsets of the finished batches.
+        """
+        with self._lock:
+            return {row[0] for row in self._connection.execute('SELECT offset FROM batches')}
+
+    def record(self, offset: int, rows: int) -> None:
+        """
+        Marks a batch as finished, once its embeddings are written.
+        :param offset: The position of the first text of the batch.
+        :param rows: How many texts the batch has.
+        :return: Does not return anything.
+        """
+        with self._lock, self._connection:
+            self._connection.execute('INSERT OR REPLACE INTO batches VALUES (?, ?)', (offset, rows))
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+
+def job_fingerprint(ids: list, texts: List[str], batch_size: int) -> str:
+    """
+    This function identifies the input of an embedding job.
+    :param ids: The ids of the rows.
+    :param texts: The texts to embed.
+    :param batch_size: How many texts are sent per request.
+    :return: A checksum of the input.
+    """
+    digest = md5(f'{batch_size}:{len(texts)}'.encode())
+    for row_id, text in zip(ids, texts):
+        digest.update(f'{row_id}\0{text}\0'.encode())
+    return digest.hexdigest()
+
+
+def run_embedding_job(embed: Callable[[List[str]], List[List[float]]], df: DataFrame, column_to_embed: str,
+                      job_dir: str, batch_size: int = EMBEDDING_BATCH_SIZE, max_in_flight: int = 4,
+                      tokens_per_minute: int = EMBEDDING_TOKENS_PER_MINUTE, max_retries: int = MAX_RETRIES,
+                      cache: Optional[EmbeddingCache] = None, model: str = OPENAI_EMBEDDING_MODEL,
+                      dimensions: int = OPENAI_EMBEDDING_DIMENSIONS, keep_job: bool = False) -> DataFrame:
+    """
+    This function embeds a text column of a dataset, resuming the job stored in job_dir if there is one.
+    :param embed: Embeds a batch of texts, e.g. with generate_openAI_embeddings. It should not retry by itself.
+    :param df: The dataset, with the id and owner_user columns.
+    :param column_to_embed: The column with the texts.
+    :param job_dir: The directory the batches and the checkpoint are stored in.
+    :param batch_size: How many texts are sent per request.
+    :param max_in_flight: How many requests are sent at the same time.
+    :param tokens_per_minute: The budget of tokens sent per minute.
+    :param max_retries: How many times a batch is retried before the job fails.
+    :param cache: The cache consulted before sending texts to embed, if any.
+    :param model: The model embed uses, the embeddings are cached under it.
+    :param dimensions: The size of the embeddings embed returns.
+    :param keep_job: Whether job_dir is kept once the job is done, it is removed by default.
+    :return: A DataFrame with the id, owner_user and embedding_0 to embedding_n columns, as float16.
+    """
+    texts: List[str] = df[column_to_embed].tolist()
+    ids: list = df['id'].tolist()
+    owner_users: list = df['owner_user'].tolist()
+    makedirs(job_dir, exist_ok=True)
+    checkpoint: EmbeddingCheckpoint = EmbeddingCheckpoint(join(job_dir, 'checkpoint.sqlite'),
+                                                          job_fingerprint(ids, texts, batch_size))
+    offsets: List[int] = list(range(0, len(texts), batch_size))
+    completed: Set[int] = checkpoint.completed()
+    print(f"{len(completed)} of {len(offsets)} batches already embedded.")
+    budget: TokenBucket = TokenBucket(tokens_per_minute)
+
+    def part_path(offset: int) -> str:
+        return join(job_dir, f'part-{offset:010d}.parquet')
+
+    def embed_with_retries(offset: int, batch: List[str]) -> np.ndarray:
+        attempt: int = 0
+        while True:
+            budget.acquire(estimate_tokens(batch))
+            try:
+                return np.asarray(embed(batch), dtype=np.float16)
+            except RETRYABLE_ERRORS as error:
+                if attempt >= max_retries:
+                    raise
+                delay: float = retry_after(error) or uniform(0, min(60.0, 2.0 ** attempt))
+                print(f"Batch starting at index {offset} failed ({type(error).__name__}), retrying in {delay:.1f}s.")
+                if isinstance(error, openai.RateLimitError):
+                    budget.pause(delay)  # Every worker waits, the limit is shared
+                else:
+                    sleep(delay)
+                attempt += 1
+
+    def embed_batch(offset: int) -> None:
+        batch: List[str] = texts[offset:offset + batch_size]
+        if cache is None:
+            embeddings: np.ndarray = embed_with_retries(offset, batch)
+        else:
+            # Only the texts not embedded by a previous run are sent, and only they count against the budget
+            embeddings = cache.embed(model, dimensions, batch, lambda misses: embed_with_retries(offset, misses))
+
+        columns: dict = {'id': ids[offset:offset + batch_size], 'owner_user': owner_users[offset:offset + batch_size]}
+        columns.update({f'embedding_{i}': embeddings[:, i] for i in range(embeddings.shape[1])})
+        # Written next to its final name and moved in place, so a crash never leaves half a batch behind
+        pq.write_table(pa.table(columns), part_path(offset) + '.tmp', compression='zstd')
+        replace(part_path(offset) + '.tmp', part_path(offset))
+        checkpoint.record(offset, len(batch))
+
+    pending: set = set()
+
+    def drain(return_when: str) -> set:
+        done, not_done = wait(pending, return_when=return_when)
+        for future in done:
+            future.result()
+        return not_done
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+            for offset in offsets:
+                if offset in completed:
+                    continue
+                if offset % (batch_size * 10) == 0:
+                    print(f"Processing batch starting at index: {offset}")
+                pending.add(executor.submit(embed_batch, offset))
+                if len(pending) >= max_in_flight:
+                    pending = drain(FIRST_COMPLETED)
+            drain(ALL_COMPLETED)
+    finally:
+        checkpoint.close()
+    if cache is not None:
+        print(f"Embedding cache: {cache.stats()}")
+
+    if not offsets:
+        df_embedded: DataFrame = DataFrame(columns=['id', 'owner_user'])
+    else:
+        df_embedded = pa.concat_tables([pq.read_table(part_path(offset)) for offset in offsets]).to_pandas()
+    if not keep_job:
+        rmtree(job_dir, ignore_errors=True)
+    return df_embedded
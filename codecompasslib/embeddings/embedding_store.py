@@ -0,0 +1,333 @@
+"""
+An on-disk store of the embedded dataset: the embeddings as one contiguous float16 (or float32) .npy matrix, the
+repository ids with a sorted index of them, and the other columns (owner_user) in a small Parquet file. The matrix
+and the index are opened with np.memmap, so opening a store does not read it, processes opening the same store
+share its pages through the OS page cache, and rows are gathered by id with a vectorized binary search.
+
+A store also keeps a hash of the text every embedding was computed from. It can be updated in place: the embeddings
+of the texts that changed are overwritten, and new repositories are appended to the end of the files, so updating a
+store writes about as much as the update itself rather than the whole dataset.
+"""
+from io import BytesIO
+from json import dump, load
+from os import getpid, makedirs, rename, replace
+from os.path import exists, join
+from shutil import rmtree
+from typing import Callable, List, Optional
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pandas import DataFrame, concat
+from codecompasslib.API.helper_functions import OUTER_PATH
+from codecompasslib.API.storage import Storage
+from codecompasslib.embeddings.embedding_cache import text_hash
+
+EMBEDDING_STORES_DIR: str = OUTER_PATH + '/.cache/embedding_stores'
+EMBEDDING_PREFIX: str = 'embedding_'
+WRITE_CHUNK_ROWS: int = 65536  # Rows copied into the matrix at a time when a store is written
+HASH_SIZE: int = 16  # The size of text_hash digests
+
+
+def embedding_columns(df: DataFrame) -> List[str]:
+    """
+    This function gets the embedding columns of a dataset, in the order of their index.
+    :param df: The dataset.
+    :return: The embedding_0 to embedding_n columns.
+    """
+    columns: List[str] = [column for column in df.columns
+                          if column.startswith(EMBEDDING_PREFIX) and column[len(EMBEDDING_PREFIX):].isdigit()]
+    return sorted(columns, key=lambda column: int(column[len(EMBEDDING_PREFIX):]))
+
+
+def text_hashes(texts) -> np.ndarray:
+    """
+    This function hashes the texts embeddings are computed from, as the embedding cache does.
+    :param texts: The texts.
+    :return: A uint8 matrix with one text_hash digest per row.
+    """
+    digests: bytes = b''.join(text_hash(text) for text in texts)
+    return np.frombuffer(digests, dtype=np.uint8).reshape(-1, HASH_SIZE)
+
+
+def append_rows(path: str, rows: np.ndarray, at: int) -> None:
+    """
+    This function writes rows at a position of the array of a .npy file, in place, and makes them its last rows.
+    np.save pads the header of the file so its first dimension can grow without moving the data.
+    :param path: The path of the .npy file.
+    :param rows: The rows, with the shape of the other rows.
+    :param at: The row the first of them is written at, usually the amount of rows of the array.
+    :return: Does not return anything.
+    """
+    with open(path, 'r+b') as file:
+        version: tuple = np.lib.format.read_magic(file)
+        shape, fortran_order, dtype = (np.lib.format.read_array_header_1_0(file) if version == (1, 0)
+                                       else np.lib.format.read_array_header_2_0(file))
+        data_offset: int = file.tell()
+        header: BytesIO = BytesIO()
+        header_data: dict = {'descr': np.lib.format.dtype_to_descr(dtype), 'fortran_order': fortran_order,
+                             'shape': (at + len(rows),) + tuple(shape[1:])}
+        if version == (1, 0):
+            np.lib.format.write_array_header_1_0(header, header_data)
+        else:
+            np.lib.format.write_array_header_2_0(header, header_data)
+        if len(header.getvalue()) != data_offset:
+            raise ValueError(f"The header of {path} can not grow in place")
+
+        row_size: int = int(np.prod(shape[1:], dtype=np.int64)) * dtype.itemsize
+        file.seek(data_offset + at * row_size)
+        file.write(np.ascontiguousarray(rows, dtype=dtype).tobytes())
+        file.truncate()
+        # The data is written before the header that makes it part of the array
+        file.flush()
+        file.seek(0)
+        file.write(header.getvalue())
+
+
+def _save_array(path: str, array: np.ndarray) -> None:
+    # Written next to the file and moved in place, so readers see either the previous array or the new one
+    with open(path + '.tmp', 'wb') as file:
+        np.save(file, array)
+    replace(path + '.tmp', path)
+
+
+class EmbeddingStore:
+    """
+    A read-only embedding store, see save to write one.
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        :param path: The directory of the store.
+        """
+        self.path: str = path
+        with open(join(path, 'store.json')) as file:
+            self.info: dict = load(file)
+        # store.json is written last by upsert, rows past its count belong to an update that did not finish
+        rows: int = self.info['rows']
+        self.matrix: np.ndarray = np.load(join(path, 'embeddings.npy'), mmap_mode='r')[:rows]
+        self.ids: np.ndarray = np.load(join(path, 'ids.npy'), mmap_mode='r')[:rows]
+        self.hashes: np.ndarray = (np.load(join(path, 'hashes.npy'), mmap_mode='r')[:rows]
+                                   if exists(join(path, 'hashes.npy')) else np.zeros((rows, HASH_SIZE), np.uint8))
+        self._sorted_ids: np.ndarray = np.load(join(path, 'index_ids.npy'), mmap_mode='r')
+        self._sorted_rows: np.ndarray = np.load(join(path, 'index_rows.npy'), mmap_mode='r')
+        if len(self._sorted_ids) != rows:
+            self._sorted_rows = np.argsort(self.ids, kind='stable')
+            self._sorted_ids = self.ids[self._sorted_rows]
+        self._columns: Optional[DataFrame] = None
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        return exists(join(path, 'store.json'))
+
+    @staticmethod
+    def save(df: DataFrame, path: str, dtype: type = np.float16, source_version: str = '',
+             texts: Optional[list] = None) -> 'EmbeddingStore':
+        """
+        Writes a dataset with embedding_0 to embedding_n columns as a store, replacing the store at path if any.
+        The store is written next to path and moved in place, so the processes reading the previous one keep their
+        pages until they open it again.
+        :param df: The dataset, with an id column.
+        :param path: The directory of the store.
+        :param dtype: The type of the matrix, np.float16 or np.float32.
+        :param source_version: Identifies the dataset the store was built from, see Storage.version.
+        :param texts: The text each row was embedded from, if known, see refresh.
+        :return: The new store.
+        """
+        columns: List[str] = embedding_columns(df)
+        ids: np.ndarray = df['id'].to_numpy(dtype=np.int64)
+        temp_path: str = f'{path}.{getpid()}.tmp'
+        rmtree(temp_path, ignore_errors=True)
+        makedirs(temp_path)
+
+        matrix = np.lib.format.open_memmap(join(temp_path, 'embeddings.npy'), mode='w+', dtype=dtype,
+                                           shape=(len(df), len(columns)))
+        for start in range(0, len(df), WRITE_CHUNK_ROWS):
+            matrix[start:start + WRITE_CHUNK_ROWS] = df.iloc[start:start + WRITE_CHUNK_ROWS][columns].to_numpy(dtype)
+        matrix.flush()
+        del matrix
+
+        order: np.ndarray = np.argsort(ids, kind='stable')
+        np.save(join(temp_path, 'ids.npy'), ids)
+        np.save(join(temp_path, 'hashes.npy'),
+                text_hashes(texts) if texts is not None else np.zeros((len(df), HASH_SIZE), np.uint8))
+        np.save(join(temp_path, 'index_ids.npy'), ids[order])
+        np.save(join(temp_path, 'index_rows.npy'), order.astype(np.int64))
+        other_columns: List[str] = [column for column in df.columns if column not in columns and column != 'id']
+        pq.write_table(pa.Table.from_pandas(df[other_columns], preserve_index=False),
+                       join(temp_path, 'columns.parquet'))
+        with open(join(temp_path, 'store.json'), 'w') as file:
+            dump({'rows': len(df), 'dimensions': len(columns), 'dtype': np.dtype(dtype).name,
+                  'source_version': source_version}, file)
+
+        if exists(path):
+            rename(path, temp_path + '.old')
+        rename(temp_path, path)
+        rmtree(temp_path + '.old', ignore_errors=True)
+        return EmbeddingStore(path)
+
+    def __len__(self) -> int:
+        return self.matrix.shape[0]
+
+    @property
+    def dimensions(self) -> int:
+        return self.matrix.shape[1]
+
+    @property
+    def columns(self) -> DataFrame:
+        """
+        :return: The columns other than id and the embeddings (e.g. owner_user), in the order of the rows.
+        """
+        if self._columns is None:
+            # An upsert cut off before store.json was replaced leaves more rows in the file than in the store
+            self._columns = pq.read_table(join(self.path, 'columns.parquet')).slice(0, self.info['rows']).to_pandas()
+        return self._columns
+
+    def rows(self, ids) -> np.ndarray:
+        """
+        Finds the rows of repositories.
+        :param ids: The repository ids.
+        :return: The row of every id, -1 for the ids that are not in the store.
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        if not len(self._sorted_ids):
+            return np.full(ids.shape, -1, dtype=np.int64)
+        positions: np.ndarray = np.minimum(np.searchsorted(self._sorted_ids, ids), len(self._sorted_ids) - 1)
+        found: np.ndarray = self._sorted_ids[positions] == ids
+        return np.where(found, self._sorted_rows[positions], -1)
+
+    def gather(self, ids, dtype: Optional[type] = None) -> np.ndarray:
+        """
+        Gets the embeddings of repositories.
+        :param ids: The repository ids, all in the store.
+        :param dtype: The type of the result, the type of the store by default.
+        :return: One embedding per id, in the order of ids.
+        """
+        rows: np.ndarray = self.rows(ids)
+        if (rows < 0).any():
+            missing: np.ndarray = np.asarray(ids)[rows < 0]
+            raise KeyError(f"{len(missing)} ids are not in the store, e.g. {missing[0]}")
+        embeddings: np.ndarray = self.matrix[rows]
+        return embeddings if dtype is None else embeddings.astype(dtype, copy=False)
+
+    def to_dataframe(self, dtype: Optional[type] = None) -> DataFrame:
+        """
+        Builds the embedded dataset, as a DataFrame with the id, the other columns and embedding_0 to embedding_n.
+        With the type of the store, the embedding columns are backed by the memory-mapped matrix, they are not copied.
+        :param dtype: The type of the embedding columns, the type of the store by default.
+        :return: The DataFrame.
+        """
+        matrix: np.ndarray = self.matrix if dtype is None else self.matrix.astype(dtype, copy=False)
+        df: DataFrame = DataFrame(matrix, columns=[f'{EMBEDDING_PREFIX}{i}' for i in range(self.dimensions)],
+                                  copy=False)
+        for position, column in enumerate(self.columns.columns):
+            df.insert(position, column, self.columns[column].to_numpy())
+        df.insert(0, 'id', np.asarray(self.ids))
+        return df
+
+    def changed(self, ids, texts) -> np.ndarray:
+        """
+        Finds the repositories whose embedding is missing or was computed from another text.
+        :param ids: The repository ids.
+        :param texts: Their current texts.
+        :return: A boolean per id, True if it has to be embedded.
+        """
+        rows: np.ndarray = self.rows(ids)
+        changed: np.ndarray = rows < 0
+        known: np.ndarray = np.flatnonzero(~changed)
+        changed[known] = (self.hashes[rows[known]] != text_hashes(texts)[known]).any(axis=1)
+        return changed
+
+    def upsert(self, df: DataFrame, texts: Optional[list] = None) -> 'EmbeddingStore':
+        """
+        Updates the store in place: the rows of the ids already in the store are overwritten, the others are appended.
+        Only one process should update a store at a time. A crash during an update leaves the store as it was before,
+        apart from the rows that were overwritten.
+        :param df: The updated rows, with an id column, the other columns of the store and embedding_0 to embedding_n.
+        :param texts: The text each row was embedded from, if known.
+        :return: The updated store. This one keeps the rows it had, with the overwritten embeddings.
+        """
+        columns: List[str] = embedding_columns(df)
+        ids: np.ndarray = df['id'].to_numpy(dtype=np.int64)
+        if len(columns) != self.dimensions:
+            raise ValueError(f"The store has {self.dimensions} dimensions, the update has {len(columns)}")
+        if len(np.unique(ids)) != len(ids):
+            raise ValueError("The update has duplicate ids")
+        embeddings: np.ndarray = df[columns].to_numpy(self.matrix.dtype)
+        hashes: np.ndarray = text_hashes(texts) if texts is not None else np.zeros((len(df), HASH_SIZE), np.uint8)
+        rows: np.ndarray = self.rows(ids)
+        existing: np.ndarray = rows >= 0
+        new: np.ndarray = ~existing
+        size: int = len(self)
+        if not exists(join(self.path, 'hashes.npy')):
+            _save_array(join(self.path, 'hashes.npy'), np.asarray(self.hashes))
+
+        if existing.any():
+            for name, values in (('embeddings.npy', embeddings), ('hashes.npy', hashes)):
+                array: np.memmap = np.load(join(self.path, name), mmap_mode='r+')
+                array[rows[existing]] = values[existing]
+                array.flush()
+                del array
+        if new.any():
+            append_rows(join(self.path, 'embeddings.npy'), embeddings[new], size)
+            append_rows(join(self.path, 'hashes.npy'), hashes[new], size)
+            append_rows(join(self.path, 'ids.npy'), ids[new], size)
+
+            # The new ids are merged into the sorted index rather than sorting all of them again
+            order: np.ndarray = np.argsort(ids[new], kind='stable')
+            positions: np.ndarray = np.searchsorted(self._sorted_ids, ids[new][order])
+            _save_array(join(self.path, 'index_ids.npy'), np.insert(self._sorted_ids, positions, ids[new][order]))
+            _save_array(join(self.path, 'index_rows.npy'), np.insert(self._sorted_rows, positions,
+                                                                      size + order.astype(np.int64)))
+
+        other_columns: List[str] = list(self.columns.columns)
+        if other_columns:
+            # The other columns are small next to the embeddings, they are written again as a whole
+            updated: DataFrame = self.columns.copy()
+            updated.iloc[rows[existing]] = df.loc[existing, other_columns].to_numpy()
+            updated = concat([updated, df.loc[new, other_columns]], ignore_index=True)
+            pq.write_table(pa.Table.from_pandas(updated, preserve_index=False), join(self.path, 'columns.parquet.tmp'))
+            replace(join(self.path, 'columns.parquet.tmp'), join(self.path, 'columns.parquet'))
+
+        with open(join(self.path, 'store.json.tmp'), 'w') as file:
+            dump(dict(self.info, rows=size + int(new.sum())), file)
+        replace(join(self.path, 'store.json.tmp'), join(self.path, 'store.json'))
+        return EmbeddingStore(self.path)
+
+    def refresh(self, df: DataFrame, column_to_embed: str,
+                embed_rows: Callable[[DataFrame], DataFrame]) -> 'EmbeddingStore':
+        """
+        Embeds the repositories that are new or whose text changed since they were embedded, and upserts them.
+        :param df: The repositories, with an id column and the other columns of the store.
+        :param column_to_embed: The column with the texts.
+        :param embed_rows: Embeds some of the repositories, e.g. with generate_openAI_embedded_csv. It may leave rows
+        out, e.g. the ones without text.
+        :return: The updated store, or this one if nothing changed.
+        """
+        texts: list = df[column_to_embed].fillna('').astype(str).tolist()
+        changed: np.ndarray = self.changed(df['id'].to_numpy(dtype=np.int64), texts)
+        print(f"{int(changed.sum())} of {len(df)} repositories to embed.")
+        if not changed.any():
+            return self
+        embedded: DataFrame = embed_rows(df[changed])
+        if not len(embedded):
+            return self
+        text_by_id: dict = dict(zip(df['id'][changed], np.asarray(texts, dtype=object)[changed]))
+        return self.upsert(embedded, [text_by_id[row_id] for row_id in embedded['id']])
+
+
+def load_embeddings(storage: Storage, file_id: str, dtype: type = np.float16) -> EmbeddingStore:
+    """
+    This function loads an embedded dataset as a memory-mapped EmbeddingStore. The store is built from the file the
+    first time, and built again once the file changes; until then, loading it does not read or download the file.
+    :param storage: The storage of the file.
+    :param file_id: The ID of the file, with id and embedding_0 to embedding_n columns.
+    :param dtype: The type of the embeddings in the store, np.float16 or np.float32.
+    :return: The store.
+    """
+    path: str = join(EMBEDDING_STORES_DIR, storage.store_name(file_id))
+    version: str = storage.version(file_id)
+    if EmbeddingStore.exists(path):
+        store: EmbeddingStore = EmbeddingStore(path)
+        if store.info['source_version'] == version and store.info['dtype'] == np.dtype(dtype).name:
+            return store
+    return EmbeddingStore.save(storage.load(file_id), path, dtype, version)
@@ -1,14 +1,22 @@
 import numpy as np
 import pandas as pd
-from gensim.models.keyedvectors import KeyedVectors
-from sentence_transformers import SentenceTransformer
 from langchain_community.embeddings import OllamaEmbeddings
-from gensim.models import KeyedVectors
 import openai
+from typing import Optional
+from codecompasslib.embeddings.embedding_cache import EmbeddingCache
+from codecompasslib.embeddings.embedding_jobs import OPENAI_EMBEDDING_DIMENSIONS, OPENAI_EMBEDDING_MODEL
+from codecompasslib.embeddings.sentence_encoder import get_sentence_encoder
+from codecompasslib.embeddings import word2vec_vectorizer
+from codecompasslib.embeddings.word2vec_vectorizer import get_word2vec_vectorizer
+
+# Consulted before computing an embedding, so unchanged texts are not embedded again. Set to None to disable it
+EMBEDDING_CACHE: Optional[EmbeddingCache] = EmbeddingCache()
 
 def add_embeddings_to_existing_dataset(df1, df2):
     """
-    Combines two DataFrames containing embeddings into a single DataFrame.
+    Combines two DataFrames containing embeddings into a single DataFrame. The rows of df1 are kept, and only the
+    ids of df2 that are not in df1 are added. To update an embedded dataset in place, e.g. after re-embedding the
+    descriptions that changed, use EmbeddingStore.upsert or EmbeddingStore.refresh instead.
 
     Args:
         df1 (pandas.DataFrame): The first DataFrame containing embeddings.
@@ -18,8 +26,11 @@ def add_embeddings_to_existing_dataset(df1, df2):
         pandas.DataFrame: A DataFrame containing the combined embeddings.
 
     """
-    df_combined = pd.concat([df1, df2], axis=0)
-    df_combined = df_combined.drop_duplicates(subset='id', keep='first') # Remove duplicates
+    if not df1['id'].is_unique:
+        df1 = df1.drop_duplicates(subset='id', keep='first')
+    # Only the ids column is compared, rather than deduplicating the combined DataFrame
+    new_rows = ~df2['id'].isin(df1['id']) & ~df2['id'].duplicated(keep='first')
+    df_combined = pd.concat([df1, df2[new_rows]], axis=0)
     return df_combined
 
 def load_word2vec_model():
@@ -27,7 +38,8 @@ def load_word2vec_model():
     Load pre-trained Word2Vec model for the Software Engineering Domain.
 
     This function loads a pre-trained Word2Vec model that has been trained on 15GB of Stack Overflow posts.
-    The model is stored in the file 'SO_vectors_200.bin' in the 'codecompasslib/PretrainedModels' directory.
+    The model is stored in the file 'SO_vectors_200.bin' in the 'codecompasslib/PretrainedModels' directory. It is
+    converted to the native gensim format on first use, and its vectors are memory-mapped from then on.
 
     Returns:
         word_vect (gensim.models.keyedvectors.Word2VecKeyedVectors): The loaded Word2Vec model.
@@ -35,13 +47,14 @@ def load_word2vec_model():
     Citation:
         Efstathiou Vasiliki, Chatzilenas Christos, & Spinellis Diomidis. (2018). Word Embeddings for the Software Engineering Domain [Data set]. Zenodo. https://doi.org/10.5281/zenodo.1199620
     """
-    word_vect = KeyedVectors.load_word2vec_format("./codecompasslib/PretrainedModels/SO_vectors_200.bin", binary=True)
+    word_vect = word2vec_vectorizer.load_word2vec_model()
     return word_vect
 
 # Vectorizing text using domain specific word2vec model
 def vectorize_text(text, word_vect):
     """
-    Vectorizes the given text by computing the average of word vectors.
+    Vectorizes the given text by computing the average of word vectors. Use vectorize_texts to vectorize a whole
+    corpus at once.
 
     Parameters:
         text (str): The input text to be vectorized.
@@ -51,16 +64,7 @@ def vectorize_text(text, word_vect):
         numpy.ndarray: The vector representation of the input text.
 
     """
-    vector_sum = np.zeros(word_vect.vector_size)  # Initialize an array to store the sum of word vectors
-    count = 0  # Initialize a count to keep track of the number of words found in the vocabulary
-    for word in text.split():
-        if word in word_vect.key_to_index:  # Check if the word is in the vocabulary
-            vector_sum += word_vect[word]  # Add the word vector to the sum
-            count += 1  # Increment the count
-    if count > 0:
-        return vector_sum / count  # Return the average of word vectors
-    else:
-        return vector_sum  # Return the zero vector if no words are found in the vocabulary
+    return get_word2vec_vectorizer(word_vect).vectorize(text)
 
 def generate_openAI_embeddings(strings_to_embed, client):
     """
@@ -75,14 +79,16 @@ def generate_openAI_embeddings(strings_to_embed, client):
     """
     response = client.embeddings.create(
         input=strings_to_embed,
-        model="text-embedding-3-large",  # You can choose the model you prefer
-        dimensions=256  # You can choose the number of dimensions you prefer
+        model=OPENAI_EMBEDDING_MODEL,  # You can choose the model you prefer
+        dimensions=OPENAI_EMBEDDING_DIMENSIONS  # You can choose the number of dimensions you prefer
     )
     return response
 
 def generate_sentence_transformer_embeddings(text):
     """
-    Generates Sentence Transformer embeddings for the given text.
+    Generates Sentence Transformer embeddings for the given text, from EMBEDDING_CACHE if it was embedded before.
+    The model is loaded once per process, see sentence_encoder.get_sentence_encoder. To embed many texts, use its
+    encode_many, which encodes them in batches.
 
     Parameters:
     text (str): The input text to generate embeddings for.
@@ -92,9 +98,8 @@ def generate_sentence_transformer_embeddings(text):
     """
     # Load a pre-trained Sentence Transformer model
     model_name = 'stsb-roberta-base'
-    model = SentenceTransformer(model_name)
-    embedding = model.encode(text)
-    return embedding
+    embedding = get_sentence_encoder(model_name).encode_many([text], cache=EMBEDDING_CACHE)
+    return embedding[0]
 
 def generate_codellama_embeddings(text):
     """
@@ -107,6 +112,9 @@ def generate_codellama_embeddings(text):
         query_result (list): A list of embeddings for the input text.
     """
     embeddings_model = OllamaEmbeddings(model='codellama:7b', device='gpu') # select the model you have installed on your machine
-    query_result = embeddings_model.embed_query(text)
-    return query_result
+    if EMBEDDING_CACHE is None:
+        return embeddings_model.embed_query(text)
+    query_result = EMBEDDING_CACHE.embed('codellama:7b', 0, [text],
+                                         lambda texts: [embeddings_model.embed_query(texts[0])])
+    return query_result[0].astype(np.float32).tolist()
 
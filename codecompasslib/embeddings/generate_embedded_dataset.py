@@ -8,21 +8,75 @@ real_project_dir = os.path.dirname(project_dir)
 
 # Add the project directory to the Python path
 sys.path.insert(0, real_project_dir)
-from codecompasslib.API.drive_operations import get_creds_drive, list_shared_drive_contents, download_csv_as_pd_dataframe, upload_df_to_drive_as_csv
-from codecompasslib.embeddings.embeddings_helper_functions import generate_openAI_embeddings
+from datetime import date
+from codecompasslib.API.drive_operations import DATA_FOLDER, EMBEDDED_DATASET_ID
+from codecompasslib.API.storage import get_storage
+from codecompasslib.embeddings.embeddings_helper_functions import EMBEDDING_CACHE, generate_openAI_embeddings
+from codecompasslib.embeddings.embedding_jobs import EMBEDDING_BATCH_SIZE, EMBEDDING_JOBS_DIR, \
+    OPENAI_EMBEDDING_DIMENSIONS, job_fingerprint, run_embedding_job
+from codecompasslib.embeddings.embedding_store import EMBEDDING_STORES_DIR, EmbeddingStore, embedding_columns
 from codecompasslib.models.secrets_manager import load_openai_key
 import openai
 import pandas as pd
 
 
+def clean_texts(df, column_to_embed):
+    """
+    Keeps the rows of a DataFrame that can be embedded, with their texts cut to the length the OpenAI API accepts.
+
+    Args:
+        df (pandas.DataFrame): The DataFrame containing the data.
+        column_to_embed (str): The name of the column to generate embeddings for.
+
+    Returns:
+        pandas.DataFrame: The rows to embed.
+    """
+    # remove rows with missing values (We still have a very big dataset after removing the missing values anyway)
+    df_clean = df.dropna()
+    
+    # turn description to lowercase and remove row if description="no description" or empty string
+    df_clean = df_clean[df_clean[column_to_embed].str.lower() != 'no description']
+    
+    # cut text if it's size exceeds 8000 tokens
+    df_clean[column_to_embed] = df_clean[column_to_embed].apply(lambda x: x[:8190]) # due to openAI API limit
+    return df_clean
+
+
+def check_embedded_dataset(df_embedded, df_clean, dimensions=OPENAI_EMBEDDING_DIMENSIONS):
+    """
+    Checks that an embedded dataset is complete before it is saved, so a bad run is never served.
+
+    Args:
+        df_embedded (pandas.DataFrame): The embedded dataset.
+        df_clean (pandas.DataFrame): The rows that were embedded, see clean_texts.
+        dimensions (int): The number of dimensions of the embeddings.
+
+    Returns:
+        None
+
+    Raises:
+        ValueError: If rows or dimensions are missing, or some embeddings are not numbers.
+    """
+    columns = embedding_columns(df_embedded)
+    if len(df_embedded) != len(df_clean) or set(df_embedded['id']) != set(df_clean['id']):
+        raise ValueError(f"The embedded dataset has {len(df_embedded)} rows, {len(df_clean)} were embedded")
+    if len(columns) != dimensions:
+        raise ValueError(f"The embedded dataset has {len(columns)} dimensions, expected {dimensions}")
+    if df_embedded[columns].isna().any().any():
+        raise ValueError("The embedded dataset has missing embeddings")
+
+
 # generate embedded dataset using OpenAI embeddings
-def generate_openAI_embedded_csv(df, column_to_embed):
+def generate_openAI_embedded_csv(df, column_to_embed, job_name=None):
     """
-    Generates embeddings for a given textual column in a DataFrame and saves the embeddings to a CSV file.
+    Generates embeddings for a given textual column in a DataFrame, keeping the finished batches in a resumable job
+    directory (see embedding_jobs.run_embedding_job) until the whole column is embedded.
 
     Args:
         df (pandas.DataFrame): The DataFrame containing the data.
         column_to_embed (str): The name of the column to generate embeddings for.
+        job_name (str): The name of the job directory, under EMBEDDING_JOBS_DIR. By default it is named after the rows
+            to embed, so a crashed run is resumed with the same rows, and a run on another dataset starts its own job.
 
     Returns:
         pandas.DataFrame: The DataFrame with the embeddings.
@@ -34,80 +88,56 @@ def generate_openAI_embedded_csv(df, column_to_embed):
         df = pd.DataFrame({'id': [1, 2, 3], 'text': ['Hello', 'World', 'GitHub']})
         df_with_embeddings = generate_openAI_embedded_csv(df, 'text')
     """
-    # remove rows with missing values (We still have a very big dataset after removing the missing values anyway)
-    df_clean = df.dropna()
-    
-    # turn description to lowercase and remove row if description="no description" or empty string
-    df_clean = df_clean[df_clean[column_to_embed].str.lower() != 'no description']
-    
-    # cut text if it's size exceeds 8000 tokens
-    df_clean[column_to_embed] = df_clean[column_to_embed].apply(lambda x: x[:8190]) # due to openAI API limit
-    
+    df_clean = clean_texts(df, column_to_embed)
+
     # grab api key from secrets
+    # The job runner retries rate limited and failed batches itself, with a backoff shared by all its workers
     api_key = load_openai_key()
-    client = openai.Client(api_key=api_key)
-    
-    # extract textual column as list of strings
-    textual_column = df_clean[column_to_embed].values.tolist()
-    
-    # extract id
-    ids = df_clean['id'].values.tolist()
-    owner_users = df_clean['owner_user'].values.tolist()
+    client = openai.Client(api_key=api_key, max_retries=0)
 
-    # create an emptry dataframe to store the embeddings
-    embedding_size = len(generate_openAI_embeddings('Test textual column', client).data[0].embedding)
-    
-    embeddings_columns = ['embedding_' + str(i) for i in range(embedding_size)]
-    df_with_embeddings = pd.DataFrame(columns=['id', 'owner_user'] + embeddings_columns)
-
-    batch_size = 2040 # You can adjust this value based on the API limits and your requirements
-
-    # Iterate over every batch of textual column
-    for i in range(0, len(textual_column), batch_size):
-        if i % (batch_size*10) == 0:
-            print(f"Processing batch starting at index: {i}")
-        
-        # Get the current batch of textual column
-        descriptions_batch = textual_column[i:i+batch_size]
-        
-        # Get the embeddings for the current batch
+    def embed(descriptions_batch):
         embeddings_response = generate_openAI_embeddings(descriptions_batch, client)
-            
-        # Create a DataFrame for the current batch
-        batch_df = pd.DataFrame(columns=['id', 'owner_user'] + embeddings_columns)
-        batch_df['id'] = ids[i:i+batch_size]
-        batch_df['owner_user'] = owner_users[i:i+batch_size]
-        
-        # Extract the embeddings and convert them into a list of lists
-        embeddings_list = [embedding.embedding for embedding in embeddings_response.data]
-
-        # Convert the list of lists into a DataFrame
-        embeddings_df = pd.DataFrame(embeddings_list, dtype='float16')
-
-        # Assuming 'batch_df' is your original DataFrame and you want to add the embeddings to it
-        # Make sure 'batch_df' has the same number of rows as 'embeddings_df'
-        batch_df[embeddings_columns] = embeddings_df
-        
-        # Save the current batch DataFrame to a CSV file
-        # Mode 'a' is for append, header=False to avoid writing headers multiple times
-        batch_df.to_csv('df_embedded_0504_batch.csv', mode='a', header=not i, index=False)
-        
-        # Optional: Free up memory by deleting the batch DataFrame if no longer needed
-        del batch_df
-    
-    # Load the CSV file with the embeddings
-    df_with_embeddings = pd.read_csv('df_embedded_0504_batch.csv')
+        return [embedding.embedding for embedding in embeddings_response.data]
+
+    # Several batches are embedded at the same time, and a rerun after a crash only embeds the unfinished ones
+    # Descriptions that did not change since the dataset was last generated are taken from the embedding cache
+    # The float16 embeddings are stored as binary instead of text, which keeps the batches several times smaller
+    if job_name is None:
+        job_name = 'df_embedded_' + job_fingerprint(df_clean['id'].tolist(), df_clean[column_to_embed].tolist(),
+                                                    EMBEDDING_BATCH_SIZE)
+    job_dir = os.path.join(EMBEDDING_JOBS_DIR, job_name)
+    df_with_embeddings = run_embedding_job(embed, df_clean, column_to_embed, job_dir, cache=EMBEDDING_CACHE)
     return df_with_embeddings
-    
-def main():
-    # Load the dataset
-    DRIVE_ID = "0AL1DtB4TdEWdUk9PVA"
-    DATA_FOLDER = "13JitBJQLNgMvFwx4QJcvrmDwKOYAShVx"
 
-    creds = get_creds_drive()
-    list_shared_drive_contents(creds=creds, folder_id=DATA_FOLDER, drive_id=DRIVE_ID)
-    
-    df = download_csv_as_pd_dataframe(creds,"1WSgwAhzNbSqC6e_RRBDHpgpQCnGZvVcc")
+
+def refresh_embedded_store(df, column_to_embed, store_path=os.path.join(EMBEDDING_STORES_DIR, 'df_embedded_0504')):
+    """
+    Brings a local EmbeddingStore of the dataset up to date, only embedding the repositories that are new or whose
+    text changed since they were embedded. The store is built from the whole dataset if it does not exist yet.
+
+    Args:
+        df (pandas.DataFrame): The DataFrame containing the data.
+        column_to_embed (str): The name of the column to generate embeddings for.
+        store_path (str): The directory of the store.
+
+    Returns:
+        EmbeddingStore: The updated store.
+    """
+    def embed_rows(rows):
+        # Every set of rows gets its own resumable job, named after its input
+        return generate_openAI_embedded_csv(rows, column_to_embed)
+
+    if not EmbeddingStore.exists(store_path):
+        df_embedded = embed_rows(df)
+        texts = df.set_index('id')[column_to_embed].reindex(df_embedded['id']).tolist()
+        return EmbeddingStore.save(df_embedded, store_path, texts=texts)
+    return EmbeddingStore(store_path).refresh(df, column_to_embed, embed_rows)
+
+
+def main():
+    # Load the dataset, from Google Drive unless CODECOMPASS_STORAGE says otherwise
+    storage = get_storage()
+    df = storage.load("1WSgwAhzNbSqC6e_RRBDHpgpQCnGZvVcc")
     
     columns_to_retrieve = ['id', 'name', 'owner_user', 'description', 'stars', 'language']
     
@@ -120,8 +150,12 @@ def main():
     # Generate the embedded dataset
     df_embedded = generate_openAI_embedded_csv(df, column_to_embed)
     
-    # save the dataframe with embeddings to drive
-    upload_df_to_drive_as_csv(creds, df_embedded, "df_embedded_0504.csv", DATA_FOLDER)
+    # save the dataframe with embeddings as a new file, once checked: the frontend keeps serving the file of
+    # EMBEDDED_DATASET_ID until it is switched to the new one
+    check_embedded_dataset(df_embedded, clean_texts(df, column_to_embed))
+    filename = f"df_embedded_{date.today():%m%d}.parquet"
+    if storage.save(df_embedded, filename, DATA_FOLDER):
+        print(f"Set EMBEDDED_DATASET_ID (now {EMBEDDED_DATASET_ID}) to the ID of {filename} to serve it")
 
 if __name__ == "__main__":
     main()
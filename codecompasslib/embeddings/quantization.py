@@ -0,0 +1,321 @@
+"""
+Compressed embeddings for similarity search. The embeddings are compared by cosine similarity, so they are
+normalized first, then either scaled to int8 per dimension (4 times smaller than float32) or product quantized: every
+slice of a vector is replaced by the index of the closest of 256 centroids, one byte per slice (32 times smaller for
+256 dimensions and 32 slices). Searches are asymmetric: the queries stay in float32 and are compared with the codes
+directly, without decoding the embeddings. The best candidates can then be scored again with the full precision
+embeddings, memory-mapped, which only reads their rows.
+"""
+from abc import ABC, abstractmethod
+from json import dump, load
+from os import makedirs
+from os.path import join
+from typing import Callable, Dict, Optional, Tuple
+import numpy as np
+from scipy.sparse import csr_matrix
+
+QUANTIZATION_METHODS: tuple = ('int8', 'pq')
+SEARCH_CHUNK_ROWS: int = 16384  # Codes compared with the queries at a time, so the scores stay small
+PQ_TRAINING_ROWS: int = 20000  # Rows the centroids are fitted on
+PQ_ITERATIONS: int = 20  # Iterations of k-means
+RERANK_CANDIDATES: int = 100  # Candidates per query scored again at full precision, when the embeddings are given
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """
+    This function scales vectors to unit length, so their inner product is their cosine similarity.
+    :param vectors: A matrix with one vector per row.
+    :return: The float32 normalized vectors, zero vectors are left as they are.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms: np.ndarray = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def top_k(score_chunk: Callable[[int, int], np.ndarray], rows: int, queries: int,
+          k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    This function finds the rows with the highest scores for every query, scoring the rows chunk by chunk.
+    :param score_chunk: Scores the rows from start to stop for every query, as a (queries, stop - start) matrix.
+    :param rows: How many rows there are.
+    :param queries: How many queries there are.
+    :param k: How many rows are kept per query.
+    :return: The rows, best first, and their scores, both (queries, k) matrices.
+    """
+    k = min(k, rows)
+    best_rows: np.ndarray = np.empty((queries, 0), dtype=np.int64)
+    best_scores: np.ndarray = np.empty((queries, 0), dtype=np.float32)
+    for start in range(0, rows, SEARCH_CHUNK_ROWS):
+        stop: int = min(start + SEARCH_CHUNK_ROWS, rows)
+        candidate_scores: np.ndarray = np.hstack([best_scores, score_chunk(start, stop)])
+        chunk_rows: np.ndarray = np.broadcast_to(np.arange(start, stop), (queries, stop - start))
+        candidate_rows: np.ndarray = np.hstack([best_rows, chunk_rows])
+        kept: np.ndarray = np.argpartition(-candidate_scores, k - 1, axis=1)[:, :k]
+        best_scores = np.take_along_axis(candidate_scores, kept, axis=1)
+        best_rows = np.take_along_axis(candidate_rows, kept, axis=1)
+    order: np.ndarray = np.argsort(-best_scores, axis=1, kind='stable')
+    return np.take_along_axis(best_rows, order, axis=1), np.take_along_axis(best_scores, order, axis=1)
+
+
+def exact_search(vectors: np.ndarray, queries: np.ndarray, k: int = 10) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    This function finds the most similar vectors to queries with the full precision embeddings, as the reference the
+    quantized searches are measured against.
+    :param vectors: The embeddings, one per row, e.g. EmbeddingStore.matrix.
+    :param queries: The query embeddings.
+    :param k: How many vectors are returned per query.
+    :return: The rows of the most similar vectors, best first, and their cosine similarities.
+    """
+    queries = normalize_rows(queries)
+    return top_k(lambda start, stop: queries @ normalize_rows(vectors[start:stop]).T,
+                 len(vectors), len(queries), k)
+
+
+class Quantizer(ABC):
+    """
+    Compresses normalized embeddings into codes, and scores float32 queries against the codes.
+    """
+    method: str = ''
+
+    @abstractmethod
+    def fit(self, vectors: np.ndarray) -> 'Quantizer':
+        """
+        Fits the quantizer to embeddings.
+        :param vectors: Normalized float32 embeddings.
+        :return: The quantizer itself.
+        """
+
+    @abstractmethod
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        """
+        :param vectors: Normalized float32 embeddings.
+        :return: Their codes, one row per embedding.
+        """
+
+    @abstractmethod
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        """
+        :param codes: The codes of some embeddings.
+        :return: The float32 embeddings the codes stand for.
+        """
+
+    @abstractmethod
+    def scores(self, codes: np.ndarray, queries: np.ndarray) -> np.ndarray:
+        """
+        Computes the inner products of queries with the embeddings the codes stand for.
+        :param codes: The codes of some embeddings.
+        :param queries: Normalized float32 queries.
+        :return: A (queries, codes) matrix.
+        """
+
+    @abstractmethod
+    def parameters(self) -> Dict[str, np.ndarray]:
+        """
+        :return: The arrays the quantizer is rebuilt from, see create_quantizer.
+        """
+
+
+class Int8Quantizer(Quantizer):
+    """
+    Maps every dimension linearly from its range over the embeddings to the 256 values of an int8.
+    """
+    method: str = 'int8'
+
+    def __init__(self, low: np.ndarray = None, scale: np.ndarray = None) -> None:
+        self.low: np.ndarray = low
+        self.scale: np.ndarray = scale
+
+    def fit(self, vectors: np.ndarray) -> 'Int8Quantizer':
+        vectors = normalize_rows(vectors)
+        self.low = vectors.min(axis=0)
+        self.scale = np.maximum(vectors.max(axis=0) - self.low, 1e-12) / 255
+        return self
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        levels: np.ndarray = np.rint((normalize_rows(vectors) - self.low) / self.scale)
+        return (np.clip(levels, 0, 255) - 128).astype(np.int8)
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        return (codes.astype(np.float32) + 128) * self.scale + self.low
+
+    def scores(self, codes: np.ndarray, queries: np.ndarray) -> np.ndarray:
+        # q . ((c + 128) * scale + low) = (q * scale) . c + q . (128 * scale + low), without decoding the codes
+        return (queries * self.scale) @ codes.T.astype(np.float32) + (queries @ (128 * self.scale + self.low))[:, None]
+
+    def parameters(self) -> Dict[str, np.ndarray]:
+        return {'low': self.low, 'scale': self.scale}
+
+
+class ProductQuantizer(Quantizer):
+    """
+    Splits the embeddings in slices and replaces every slice by the closest of 256 centroids fitted with k-means.
+    """
+    method: str = 'pq'
+
+    def __init__(self, subspaces: int = 32, centroids: np.ndarray = None) -> None:
+        """
+        :param subspaces: How many slices the embeddings are split in, it has to divide their dimensions.
+        :param centroids: The fitted (subspaces, 256, slice dimensions) centroids, if any.
+        """
+        self.subspaces: int = subspaces if centroids is None else len(centroids)
+        self.centroids: np.ndarray = centroids
+
+    def _slices(self, vectors: np.ndarray) -> np.ndarray:
+        if vectors.shape[1] % self.subspaces:
+            raise ValueError(f"{vectors.shape[1]} dimensions can not be split in {self.subspaces} subspaces")
+        return vectors.reshape(len(vectors), self.subspaces, -1)
+
+    @staticmethod
+    def _assign(slices: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+        codes: np.ndarray = np.empty(slices.shape[:2], dtype=np.uint8)
+        for j in range(slices.shape[1]):
+            # |x - c|^2 = |x|^2 - 2 x.c + |c|^2, and |x|^2 does not change which centroid is the closest
+            distances: np.ndarray = np.sum(centroids[j] ** 2, axis=1) - 2 * slices[:, j] @ centroids[j].T
+            codes[:, j] = np.argmin(distances, axis=1)
+        return codes
+
+    def fit(self, vectors: np.ndarray, iterations: int = PQ_ITERATIONS, seed: int = 0) -> 'ProductQuantizer':
+        rng: np.random.Generator = np.random.default_rng(seed)
+        sample: np.ndarray = np.asarray(vectors)[np.sort(rng.permutation(len(vectors))[:PQ_TRAINING_ROWS])]
+        slices: np.ndarray = self._slices(normalize_rows(sample))
+        clusters: int = min(256, len(sample))
+        # k-means on every subspace at once, the centroids start as random rows of the sample
+        centroids: np.ndarray = slices[rng.choice(len(slices), clusters, replace=False)].transpose(1, 0, 2).copy()
+        for _ in range(iterations):
+            codes: np.ndarray = self._assign(slices, centroids)
+            for j in range(self.subspaces):
+                counts: np.ndarray = np.bincount(codes[:, j], minlength=clusters)
+                sums: np.ndarray = np.stack([np.bincount(codes[:, j], weights=slices[:, j, d], minlength=clusters)
+                                             for d in range(slices.shape[2])], axis=1)
+                # A centroid no row is closest to keeps its place
+                used: np.ndarray = counts > 0
+                centroids[j, used] = sums[used] / counts[used, None]
+        self.centroids = centroids
+        return self
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        codes: np.ndarray = np.empty((len(vectors), self.subspaces), dtype=np.uint8)
+        for start in range(0, len(vectors), SEARCH_CHUNK_ROWS):
+            slices: np.ndarray = self._slices(normalize_rows(vectors[start:start + SEARCH_CHUNK_ROWS]))
+            codes[start:start + SEARCH_CHUNK_ROWS] = self._assign(slices, self.centroids)
+        return codes
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        return self.centroids[np.arange(self.subspaces), codes].reshape(len(codes), -1)
+
+    def scores(self, codes: np.ndarray, queries: np.ndarray) -> np.ndarray:
+        # A table of the inner products of every slice of the queries with every centroid of its subspace, the score
+        # of a code is then the sum of one entry of the table per subspace: the product of the codes, one-hot encoded,
+        # with the tables
+        tables: np.ndarray = np.einsum('qsd,scd->qsc', self._slices(queries), self.centroids).reshape(len(queries), -1)
+        flat_codes: np.ndarray = codes.astype(np.intp) + np.arange(self.subspaces) * self.centroids.shape[1]
+        one_hot: csr_matrix = csr_matrix((np.ones(flat_codes.size, dtype=np.float32), flat_codes.ravel(),
+                                          np.arange(0, flat_codes.size + 1, self.subspaces)),
+                                         shape=(len(codes), tables.shape[1]))
+        return np.asarray((one_hot @ tables.T).T)
+
+    def parameters(self) -> Dict[str, np.ndarray]:
+        return {'centroids': self.centroids}
+
+
+def create_quantizer(method: str, **kwargs) -> Quantizer:
+    """
+    This function creates a quantizer.
+    :param method: 'int8' or 'pq'.
+    :param kwargs: The arguments of the quantizer class, e.g. subspaces for 'pq'.
+    :return: The new Quantizer, to fit unless its parameters are given.
+    """
+    if method not in QUANTIZATION_METHODS:
+        raise ValueError(f"Unknown quantization method {method}, expected one of {', '.join(QUANTIZATION_METHODS)}")
+    return Int8Quantizer(**kwargs) if method == 'int8' else ProductQuantizer(**kwargs)
+
+
+class QuantizedEmbeddings:
+    """
+    Embeddings compressed with a quantizer, searchable by cosine similarity.
+    """
+
+    def __init__(self, quantizer: Quantizer, codes: np.ndarray) -> None:
+        self.quantizer: Quantizer = quantizer
+        self.codes: np.ndarray = codes
+
+    @staticmethod
+    def build(vectors: np.ndarray, method: str = 'int8', **kwargs) -> 'QuantizedEmbeddings':
+        """
+        Fits a quantizer on embeddings and compresses them.
+        :param vectors: The embeddings, one per row, e.g. EmbeddingStore.matrix.
+        :param method: 'int8' or 'pq'.
+        :param kwargs: The arguments of the quantizer class.
+        :return: The compressed embeddings, in the order of vectors.
+        """
+        quantizer: Quantizer = create_quantizer(method, **kwargs).fit(vectors)
+        return QuantizedEmbeddings(quantizer, quantizer.encode(vectors))
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    @property
+    def nbytes(self) -> int:
+        """
+        :return: The size of the codes and of the parameters of the quantizer.
+        """
+        return self.codes.nbytes + sum(array.nbytes for array in self.quantizer.parameters().values())
+
+    def search(self, queries: np.ndarray, k: int = 10, vectors: Optional[np.ndarray] = None,
+               candidates: int = RERANK_CANDIDATES) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Finds the most similar embeddings to queries, comparing the queries with the codes.
+        :param queries: The query embeddings, at full precision.
+        :param k: How many embeddings are returned per query.
+        :param vectors: The embeddings at full precision, e.g. the memory-mapped EmbeddingStore.matrix, if the best
+        candidates found with the codes should be scored again with them. Only the rows of the candidates are read.
+        :param candidates: How many candidates are scored again per query.
+        :return: The rows of the most similar embeddings, best first, and their cosine similarities, approximate unless
+        vectors are given.
+        """
+        queries = normalize_rows(np.atleast_2d(queries))
+        rows, scores = top_k(lambda start, stop: self.quantizer.scores(self.codes[start:stop], queries),
+                             len(self), len(queries), k if vectors is None else max(k, candidates))
+        if vectors is None:
+            return rows, scores
+        candidate_vectors: np.ndarray = normalize_rows(vectors[rows.ravel()]).reshape(rows.shape + (-1,))
+        scores = np.einsum('qd,qcd->qc', queries, candidate_vectors)
+        order: np.ndarray = np.argsort(-scores, axis=1, kind='stable')[:, :k]
+        return np.take_along_axis(rows, order, axis=1), np.take_along_axis(scores, order, axis=1)
+
+    def save(self, path: str) -> None:
+        """
+        Writes the codes and the quantizer to a directory.
+        :param path: The directory.
+        :return: Does not return anything.
+        """
+        makedirs(path, exist_ok=True)
+        np.savez(join(path, 'quantizer.npz'), **self.quantizer.parameters())
+        np.save(join(path, 'codes.npy'), self.codes)
+        with open(join(path, 'quantized.json'), 'w') as file:
+            dump({'method': self.quantizer.method, 'rows': len(self)}, file)
+
+    @staticmethod
+    def load(path: str) -> 'QuantizedEmbeddings':
+        """
+        Opens compressed embeddings written by save, with the codes memory-mapped.
+        :param path: The directory.
+        :return: The compressed embeddings.
+        """
+        with open(join(path, 'quantized.json')) as file:
+            method: str = load(file)['method']
+        with np.load(join(path, 'quantizer.npz')) as parameters:
+            quantizer: Quantizer = create_quantizer(method, **{name: parameters[name] for name in parameters.files})
+        return QuantizedEmbeddings(quantizer, np.load(join(path, 'codes.npy'), mmap_mode='r'))
+
+
+def recall_at_k(exact_rows: np.ndarray, approximate_rows: np.ndarray) -> float:
+    """
+    This function measures how many of the true nearest neighbours an approximate search finds.
+    :param exact_rows: The (queries, k) rows found with the full precision embeddings.
+    :param approximate_rows: The (queries, k) rows found with the compressed embeddings.
+    :return: The average share of the exact rows of a query that the approximate search also returned.
+    """
+    found: list = [len(np.intersect1d(exact, approximate)) / len(exact)
+                   for exact, approximate in zip(exact_rows, approximate_rows)]
+    return float(np.mean(found)) if found else 0.0
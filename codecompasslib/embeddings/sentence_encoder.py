@@ -0,0 +1,114 @@
+"""
+A process wide SentenceTransformer encoder. The model is loaded once, on first use, and texts are encoded in batches
+sorted by length, so the texts padded together have about the same length. A whole corpus can also be spread over
+several CPU processes. The embeddings come out as one contiguous matrix, in the order of the texts.
+"""
+from threading import Lock
+from typing import Callable, Dict, List, Optional, Tuple
+import numpy as np
+from pandas import DataFrame
+from sentence_transformers import SentenceTransformer
+from codecompasslib.embeddings.embedding_cache import EmbeddingCache
+
+SENTENCE_TRANSFORMER_MODEL: str = 'stsb-roberta-base'
+ENCODE_BATCH_SIZE: int = 64
+CHUNK_BATCHES: int = 16  # Batches handed to the model at a time, so its intermediate results stay small
+
+
+class SentenceEncoder:
+    """
+    A lazily loaded SentenceTransformer model. It is thread safe.
+    """
+
+    def __init__(self, model_name: str = SENTENCE_TRANSFORMER_MODEL, device: Optional[str] = None,
+                 factory: Callable[..., SentenceTransformer] = SentenceTransformer) -> None:
+        """
+        :param model_name: The name or path of the model.
+        :param device: The device to run the model on, e.g. 'cpu' or 'cuda', chosen by sentence_transformers by default.
+        :param factory: Loads the model from its name and device.
+        """
+        self.model_name: str = model_name
+        self.device: Optional[str] = device
+        self._factory: Callable[..., SentenceTransformer] = factory
+        self._model: Optional[SentenceTransformer] = None
+        self._lock: Lock = Lock()
+
+    @property
+    def model(self) -> SentenceTransformer:
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    self._model = self._factory(self.model_name, device=self.device)
+        return self._model
+
+    def encode_many(self, texts: List[str], batch_size: int = ENCODE_BATCH_SIZE, dtype: type = np.float32,
+                    processes: int = 0, cache: Optional[EmbeddingCache] = None) -> np.ndarray:
+        """
+        Encodes texts, longest first, in batches of about the same length.
+        :param texts: The texts.
+        :param batch_size: How many texts are encoded together.
+        :param dtype: The type of the embeddings, np.float32 or np.float16.
+        :param processes: How many CPU processes share the work, 0 to encode in this process. Worth it for a whole
+        corpus only, as every process loads its own copy of the model.
+        :param cache: The cache consulted before encoding, if any.
+        :return: A contiguous matrix with one embedding per text, in the order of texts.
+        """
+        def encode(misses: List[str]) -> np.ndarray:
+            return self._encode_sorted(misses, batch_size, processes)
+
+        embeddings: np.ndarray = encode(texts) if cache is None else cache.embed(self.model_name, 0, texts, encode)
+        return np.ascontiguousarray(embeddings, dtype=dtype)
+
+    def _encode_sorted(self, texts: List[str], batch_size: int, processes: int) -> np.ndarray:
+        # Longest first, so running out of memory happens on the first batch rather than the last
+        order: np.ndarray = np.argsort([-len(text) for text in texts], kind='stable')
+        sorted_texts: List[str] = [texts[index] for index in order]
+        embeddings: Optional[np.ndarray] = None
+
+        if processes > 1:
+            pool: dict = self.model.start_multi_process_pool(['cpu'] * processes)
+            try:
+                sorted_embeddings: np.ndarray = self.model.encode_multi_process(sorted_texts, pool,
+                                                                                batch_size=batch_size)
+            finally:
+                self.model.stop_multi_process_pool(pool)
+            embeddings = np.empty_like(sorted_embeddings)
+            embeddings[order] = sorted_embeddings
+            return embeddings
+
+        chunk: int = batch_size * CHUNK_BATCHES
+        for start in range(0, len(sorted_texts), chunk):
+            vectors: np.ndarray = np.asarray(self.model.encode(sorted_texts[start:start + chunk], batch_size=batch_size,
+                                                               convert_to_numpy=True, show_progress_bar=False))
+            if embeddings is None:
+                embeddings = np.empty((len(texts), vectors.shape[1]), dtype=vectors.dtype)
+            embeddings[order[start:start + chunk]] = vectors
+        return embeddings if embeddings is not None else np.empty((0, 0), dtype=np.float32)
+
+    def encode_repos(self, df: DataFrame, column_to_embed: str, **kwargs) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Encodes a text column of the repositories.
+        :param df: The repositories, with an id column.
+        :param column_to_embed: The column with the texts, missing texts are encoded as empty strings.
+        :param kwargs: The arguments of encode_many.
+        :return: The ids of the repositories and their embeddings, row by row.
+        """
+        texts: List[str] = df[column_to_embed].fillna('').astype(str).tolist()
+        return df['id'].to_numpy(dtype=np.int64), self.encode_many(texts, **kwargs)
+
+
+_encoders: Dict[str, SentenceEncoder] = {}
+_encoders_lock: Lock = Lock()
+
+
+def get_sentence_encoder(model_name: str = SENTENCE_TRANSFORMER_MODEL) -> SentenceEncoder:
+    """
+    This function gets the process wide encoder of a model, creating it on first use. The model itself is only
+    loaded when the first text is encoded.
+    :param model_name: The name or path of the model.
+    :return: The shared SentenceEncoder.
+    """
+    with _encoders_lock:
+        if model_name not in _encoders:
+            _encoders[model_name] = SentenceEncoder(model_name)
+        return _encoders[model_name]
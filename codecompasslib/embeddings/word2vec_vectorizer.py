@@ -0,0 +1,187 @@
+"""
+Averages word2vec vectors over whole corpora at once. The texts are tokenized once, their tokens are mapped to the
+indices of the vocabulary in bulk with a hash index, and the mean vectors are computed with a single sparse product of
+the texts and the word vectors, into one float32 matrix. The token ids of the texts already seen can be kept, so texts
+that come back are not tokenized again.
+
+The pretrained model is converted once from the word2vec binary format to the native gensim format, with the vectors
+in their own .npy file. They are then memory-mapped rather than parsed, so loading the model takes a fraction of a
+second and the processes using it share one copy through the OS page cache.
+"""
+from itertools import chain
+from os import getpid, makedirs, replace
+from os.path import dirname, exists, getmtime
+from threading import Lock
+from typing import Dict, List, Optional, Tuple
+from weakref import WeakKeyDictionary
+import numpy as np
+from gensim.models.keyedvectors import KeyedVectors
+from pandas import Index
+from scipy.sparse import csr_matrix
+from codecompasslib.API.helper_functions import PARENT_PATH
+
+# Word Embeddings for the Software Engineering Domain, pre-trained on 15GB of Stack Overflow posts
+WORD2VEC_MODEL_PATH: str = PARENT_PATH + '/PretrainedModels/SO_vectors_200.bin'
+WORD2VEC_NATIVE_PATH: str = PARENT_PATH + '/PretrainedModels/SO_vectors_200.kv'  # With SO_vectors_200.kv.vectors.npy
+CHUNK_TEXTS: int = 4096  # Texts averaged at a time, so the intermediate arrays stay small
+TOKEN_CACHE_SIZE: int = 100000  # Texts whose token ids are kept, 0 to keep none
+
+
+class Word2VecVectorizer:
+    """
+    Turns texts into the average of the vectors of their words, skipping the words that are not in the vocabulary.
+    """
+
+    def __init__(self, word_vect: KeyedVectors, token_cache_size: int = TOKEN_CACHE_SIZE) -> None:
+        """
+        :param word_vect: The word vectors, e.g. from load_word2vec_model.
+        :param token_cache_size: How many texts have their token ids kept, 0 to tokenize every text every time.
+        """
+        self.word_vect: KeyedVectors = word_vect
+        self.token_cache_size: int = token_cache_size
+        self._vocabulary: Optional[Index] = None
+        self._token_ids: Dict[str, np.ndarray] = {}
+        self._lock: Lock = Lock()
+
+    @property
+    def vocabulary(self) -> Index:
+        # A hash index of the words, built on first use, so a whole list of tokens is looked up in one call
+        if self._vocabulary is None:
+            with self._lock:
+                if self._vocabulary is None:
+                    self._vocabulary = Index(self.word_vect.index_to_key)
+        return self._vocabulary
+
+    def _lookup(self, texts: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        tokens: List[List[str]] = [text.split() for text in texts]
+        lengths: np.ndarray = np.fromiter(map(len, tokens), dtype=np.int64, count=len(tokens))
+        indices: np.ndarray = self.vocabulary.get_indexer(list(chain.from_iterable(tokens)))
+        known: np.ndarray = indices >= 0
+        owners: np.ndarray = np.repeat(np.arange(len(texts)), lengths)
+        return indices[known].astype(np.int32), np.bincount(owners[known], minlength=len(texts))
+
+    def token_ids(self, texts: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Maps the words of texts to their index in the vocabulary.
+        :param texts: The texts.
+        :return: The indices of the known words of all texts, one text after the other, and how many each text has.
+        """
+        if not self.token_cache_size:
+            return self._lookup(texts)
+
+        with self._lock:
+            misses: List[str] = [text for text in dict.fromkeys(texts) if text not in self._token_ids]
+        if misses:
+            indices, lengths = self._lookup(misses)
+            with self._lock:
+                if len(self._token_ids) + len(misses) > self.token_cache_size:
+                    self._token_ids.clear()
+                self._token_ids.update(zip(misses, np.split(indices, np.cumsum(lengths)[:-1])))
+                found: List[np.ndarray] = [self._token_ids.get(text) for text in texts]
+            # Texts that did not fit in the cache are looked up again, on their own
+            if any(text_ids is None for text_ids in found):
+                return self._lookup(texts)
+        else:
+            with self._lock:
+                found = [self._token_ids[text] for text in texts]
+        lengths = np.fromiter(map(len, found), dtype=np.int64, count=len(found))
+        return (np.concatenate(found) if found else np.empty(0, dtype=np.int32)), lengths
+
+    def vectorize_many(self, texts: List[str]) -> np.ndarray:
+        """
+        Vectorizes texts, each of the distinct texts once.
+        :param texts: The texts.
+        :return: A float32 matrix with the average of the word vectors of every text, in the order of texts. Texts
+        without any known word get a zero vector.
+        """
+        distinct: Dict[str, int] = {}
+        inverse: np.ndarray = np.fromiter((distinct.setdefault(text, len(distinct)) for text in texts),
+                                          dtype=np.int64, count=len(texts))
+        distinct_texts: List[str] = list(distinct)
+        vectors: np.ndarray = np.zeros((len(distinct_texts), self.word_vect.vector_size), dtype=np.float32)
+
+        for start in range(0, len(distinct_texts), CHUNK_TEXTS):
+            indices, lengths = self.token_ids(distinct_texts[start:start + CHUNK_TEXTS])
+            if not len(indices):
+                continue
+            # One row per text, with a 1 for each of its known words: its product with the word vectors gathers and
+            # sums the vectors of every text in one pass, without materializing them as np.add.reduceat would
+            counts: csr_matrix = csr_matrix((np.ones(len(indices), dtype=np.float32), indices,
+                                             np.concatenate(([0], np.cumsum(lengths)))),
+                                            shape=(len(lengths), len(self.word_vect.index_to_key)))
+            sums: np.ndarray = np.asarray(counts @ self.word_vect.vectors, dtype=np.float32)
+            vectors[start:start + len(lengths)] = sums / np.maximum(lengths, 1)[:, None]
+        return vectors[inverse]
+
+    def vectorize(self, text: str) -> np.ndarray:
+        """
+        Vectorizes a single text, see vectorize_many to vectorize a corpus.
+        :param text: The text.
+        :return: The float32 average of its word vectors.
+        """
+        return self.vectorize_many([text])[0]
+
+
+_vectorizers: 'WeakKeyDictionary[KeyedVectors, Word2VecVectorizer]' = WeakKeyDictionary()
+_vectorizers_lock: Lock = Lock()
+
+
+def get_word2vec_vectorizer(word_vect: KeyedVectors) -> Word2VecVectorizer:
+    """
+    This function gets the vectorizer of word vectors, creating it on first use, so its vocabulary index and token
+    ids are shared by every caller for as long as the word vectors are loaded.
+    :param word_vect: The word vectors.
+    :return: The shared Word2VecVectorizer.
+    """
+    with _vectorizers_lock:
+        if word_vect not in _vectorizers:
+            _vectorizers[word_vect] = Word2VecVectorizer(word_vect)
+        return _vectorizers[word_vect]
+
+
+def vectorize_texts(texts, word_vect: KeyedVectors) -> np.ndarray:
+    """
+    This function vectorizes a corpus with word vectors, as vectorize_text does for a single text.
+    :param texts: The texts, e.g. a column of a DataFrame, with missing texts filled in.
+    :param word_vect: The word vectors.
+    :return: A float32 matrix with one row per text.
+    """
+    return get_word2vec_vectorizer(word_vect).vectorize_many(list(texts))
+
+
+def convert_word2vec_model(model_path: str = WORD2VEC_MODEL_PATH, native_path: str = WORD2VEC_NATIVE_PATH) -> None:
+    """
+    This function converts a model in the binary word2vec format to the native gensim format, with its vectors in a
+    separate .npy file, so they can be memory-mapped.
+    :param model_path: The path of the binary word2vec model.
+    :param native_path: The path of the converted model, its vectors are written next to it.
+    :return: Does not return anything.
+    """
+    word_vect: KeyedVectors = KeyedVectors.load_word2vec_format(model_path, binary=True)
+    makedirs(dirname(native_path) or '.', exist_ok=True)
+    # Written next to their final names and moved in place, the vectors first, so a model is never half converted
+    temp_path: str = f'{native_path}.{getpid()}.tmp'
+    word_vect.save(temp_path, separately=['vectors'])
+    replace(temp_path + '.vectors.npy', native_path + '.vectors.npy')
+    replace(temp_path, native_path)
+
+
+_models: Dict[str, KeyedVectors] = {}
+_models_lock: Lock = Lock()
+
+
+def load_word2vec_model(model_path: str = WORD2VEC_MODEL_PATH,
+                        native_path: str = WORD2VEC_NATIVE_PATH) -> KeyedVectors:
+    """
+    This function loads the word vectors, memory-mapped and read-only. The model is converted on first use, and
+    again when the binary model is newer than the conversion. It is loaded once per process.
+    :param model_path: The path of the binary word2vec model, only read to convert it.
+    :param native_path: The path of the converted model.
+    :return: The word vectors.
+    """
+    with _models_lock:
+        if native_path not in _models:
+            if not exists(native_path) or (exists(model_path) and getmtime(model_path) > getmtime(native_path)):
+                convert_word2vec_model(model_path, native_path)
+            _models[native_path] = KeyedVectors.load(native_path, mmap='r')
+        return _models[native_path]
@@ -25,20 +25,19 @@ real_project_dir = os.path.dirname(project_dir)
 # Add the project directory to the Python path
 sys.path.insert(0, real_project_dir)
 
-from codecompasslib.API.drive_operations import download_csv_as_pd_dataframe, get_creds_drive
+from codecompasslib.API.storage import get_storage
 
 def load_data(full_data_folder_id: str) -> DataFrame:
     """
     Load the dataset from a specified filepath.
     
     Args:
-        full_data_folder_id (str): data folder id of the dataframe on drive.
+        full_data_folder_id (str): data folder id of the dataframe in the configured storage (Drive by default).
 
     Returns:
         pandas.DataFrame: The loaded DataFrame.
     """
-    creds = get_creds_drive()
-    df: DataFrame = download_csv_as_pd_dataframe(creds=creds, file_id=full_data_folder_id)
+    df: DataFrame = get_storage().load(full_data_folder_id)
     return df
 
 def clean_data(df: DataFrame) -> DataFrame:
@@ -10,15 +10,19 @@ real_project_dir = os.path.dirname(project_dir)
 sys.path.insert(0, real_project_dir)
 
 import pandas as pd
+from concurrent.futures import Future, ThreadPoolExecutor
 from typing import Tuple, List
 from pandas import DataFrame, concat
-from numpy import ndarray, argsort
+from numpy import ndarray, argsort, float32
 import lightgbm as lgb
 from sklearn.model_selection import train_test_split
 from category_encoders import ordinal
 
-from codecompasslib.API.drive_operations import download_csv_as_pd_dataframe, get_creds_drive
-from codecompasslib.API.get_bulk_data import get_stared_repos, get_user_repos
+from codecompasslib.API.storage import Storage, get_storage
+from codecompasslib.API.get_bulk_data import collect, iter_stared_repos, iter_user_repos
+from codecompasslib.embeddings.embedding_store import load_embeddings
+
+EMBEDDING_DTYPE: type = float32  # The type of the embedding features the model is trained on
 
 
 def encode_csv(df: DataFrame, encoder, label_col: str, typ: str = "fit") -> Tuple[DataFrame, ndarray]:
@@ -124,17 +128,19 @@ def train_lightGBM_model(df_merged: DataFrame, label_col: str) -> Tuple[lgb.Boos
 
 def load_data(full_data_folder_id: str, full_data_embedded_folder_id: str) -> Tuple[DataFrame, DataFrame]:
     """
-    Load the data from the Google Drive
+    Load the data from the configured storage, Google Drive by default (see codecompasslib.API.storage).
+    Set CODECOMPASS_STORAGE=local to load the datasets from a local directory instead.
+    The embedded dataset is kept as a memory-mapped EmbeddingStore of EMBEDDING_DTYPE, only built again when the file
+    changes, so its embedding columns are not parsed again. They are copied once, when preprocess_data merges the
+    datasets.
     :return: The non-embedded and embedded datasets
     """
-
-    creds = get_creds_drive()
-    df_non_embedded: DataFrame = download_csv_as_pd_dataframe(creds=creds, file_id=full_data_folder_id)
-    df_embedded: DataFrame = download_csv_as_pd_dataframe(creds=creds, file_id=full_data_embedded_folder_id)
-
-    # Having data locally works much faster than retrieving from drive. Uncomment the following lines to use local data
-    # df_non_embedded = pd.read_csv('codecompasslib/models/data_full.csv')
-    # df_embedded = pd.read_csv('codecompasslib/models/df_embedded_combined.csv')
+    storage: Storage = get_storage()
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        non_embedded: Future = executor.submit(storage.load, full_data_folder_id)
+        embedded: Future = executor.submit(load_embeddings, storage, full_data_embedded_folder_id, EMBEDDING_DTYPE)
+        df_non_embedded: DataFrame = non_embedded.result()
+        df_embedded: DataFrame = embedded.result().to_dataframe(EMBEDDING_DTYPE)
 
     print("Data loaded")
     return df_non_embedded, df_embedded
@@ -164,10 +170,11 @@ def preprocess_data(df_embedded: DataFrame, df_non_embedded: DataFrame,
     df_merged['stars'] = df_merged['stars'].astype(int)
 
     # Add target column: 1 if the repo is starred or owned by the user, else 0
-    owned_by_target_repo_ids: List = [item['id'] for item in get_user_repos(target_user)[0]]
-    starred_repo_ids: List = [item['id'] for item in get_stared_repos(target_user)[0]]
+    # The repos are streamed page by page, only their ids are kept
+    owned_by_target_repo_ids: List = collect(item['id'] for item in iter_user_repos(target_user))[0]
+    starred_repo_ids: List = collect(item['id'] for item in iter_stared_repos(target_user))[0]
     starred_or_owned_by_user:List = starred_repo_ids + owned_by_target_repo_ids
-    df_merged[label_col] = df_merged['id'].apply(lambda x: 1 if x in starred_or_owned_by_user else 0)
+    df_merged[label_col] = df_merged['id'].isin(starred_or_owned_by_user).astype(int)
 
     return df_merged, starred_or_owned_by_user
 
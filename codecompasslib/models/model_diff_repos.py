@@ -1,8 +1,9 @@
 import pandas as pd
 import numpy as np
-from gensim.models.keyedvectors import KeyedVectors
 from sklearn.neighbors import NearestNeighbors
 from scipy.spatial.distance import cosine
+from codecompasslib.embeddings import word2vec_vectorizer
+from codecompasslib.embeddings.word2vec_vectorizer import get_word2vec_vectorizer, vectorize_texts
 
 def load_data():
     try:
@@ -49,7 +50,8 @@ def load_word2vec_model():
     try:
         # Load pre-trained Word2Vec model. Word Embeddings for the Software Engineering Domain, pre-trained on 15GB of Stack Overflow posts
         # Citation: Efstathiou Vasiliki, Chatzilenas Christos, & Spinellis Diomidis. (2018). Word Embeddings for the Software Engineering Domain [Data set]. Zenodo. https://doi.org/10.5281/zenodo.1199620
-        word_vect = KeyedVectors.load_word2vec_format("./codecompasslib/PretrainedModels/SO_vectors_200.bin", binary=True)
+        # Converted to the native gensim format on first use, then memory-mapped and shared with the other processes
+        word_vect = word2vec_vectorizer.load_word2vec_model()
         return word_vect
     except FileNotFoundError:
         print("File not found.")
@@ -57,16 +59,7 @@ def load_word2vec_model():
 
 def vectorize_text(text, word_vect):
     try:
-        vector_sum = np.zeros(word_vect.vector_size)  # Initialize an array to store the sum of word vectors
-        count = 0  # Initialize a count to keep track of the number of words found in the vocabulary
-        for word in text.split():
-            if word in word_vect.key_to_index:  # Check if the word is in the vocabulary
-                vector_sum += word_vect[word]  # Add the word vector to the sum
-                count += 1  # Increment the count
-        if count > 0:
-            return vector_sum / count  # Return the average of word vectors
-        else:
-            return vector_sum  # Return the zero vector if no words are found in the vocabulary
+        return get_word2vec_vectorizer(word_vect).vectorize(text)  # The average of the word vectors
     except KeyError:
         print("KeyError occurred.")
         return None
@@ -76,8 +69,9 @@ def preprocess_user_df(user_df, word_vect):
         embedded_user_df = user_df.copy()
         embedded_user_df['name'] = user_df['name'].fillna('')  
         embedded_user_df['description'] = user_df['description'].fillna('')
-        embedded_user_df['name_vector'] = embedded_user_df['name'].apply(lambda x: vectorize_text(x, word_vect))
-        embedded_user_df['description_vector'] = embedded_user_df['description'].apply(lambda x: vectorize_text(x, word_vect))
+        # Every column is vectorized at once rather than row by row, and each row gets its vector as an array
+        embedded_user_df['name_vector'] = list(vectorize_texts(embedded_user_df['name'], word_vect))
+        embedded_user_df['description_vector'] = list(vectorize_texts(embedded_user_df['description'], word_vect))
         return embedded_user_df
     except KeyError:
         print("KeyError occurred.")
@@ -88,8 +82,8 @@ def preprocess_repos(neighbors_and_target_repos, word_vect):
         neighbors_and_target_repos_Copy = neighbors_and_target_repos.copy()
         neighbors_and_target_repos_Copy['name'] = neighbors_and_target_repos['name'].fillna('')
         neighbors_and_target_repos_Copy['description'] = neighbors_and_target_repos['description'].fillna('')
-        neighbors_and_target_repos_Copy.loc[:, 'name_vector'] = neighbors_and_target_repos['name'].apply(lambda x: vectorize_text(x, word_vect))
-        neighbors_and_target_repos_Copy.loc[:, 'description_vector'] = neighbors_and_target_repos['description'].apply(lambda x: vectorize_text(x, word_vect))
+        neighbors_and_target_repos_Copy['name_vector'] = pd.Series(list(vectorize_texts(neighbors_and_target_repos_Copy['name'], word_vect)), index=neighbors_and_target_repos_Copy.index)
+        neighbors_and_target_repos_Copy['description_vector'] = pd.Series(list(vectorize_texts(neighbors_and_target_repos_Copy['description'], word_vect)), index=neighbors_and_target_repos_Copy.index)
         neighbors_and_target_repos_Copy.drop(['name','description'], axis=1, inplace=True)
         return neighbors_and_target_repos_Copy * 1  # Multiply by 1 to convert booleans to int
     except KeyError:
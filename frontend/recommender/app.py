@@ -12,6 +12,7 @@ real_project_dir = os.path.dirname(project_dir)
 sys.path.insert(0, real_project_dir)
 
 # Import necessary functions from codecompasslib
+from codecompasslib.API.drive_operations import EMBEDDED_DATASET_ID
 from codecompasslib.models.lightgbm_model import generate_lightGBM_recommendations, load_data
 
 # Function to load cached data
@@ -21,7 +22,7 @@ def load_cached_data():
         with st.spinner('Fetching data from the server...'):
             # Load data
             full_data_folder_id = '1Qiy9u03hUthqaoBDr4VQqhKwtLJ2O3Yd'
-            full_data_embedded_folder_id = '139wi78iRzhwGZwxmI5WALoYocR-Rk9By'
+            full_data_embedded_folder_id = EMBEDDED_DATASET_ID
             st.session_state.cached_data = load_data(full_data_folder_id, full_data_embedded_folder_id)
     return st.session_state.cached_data
 
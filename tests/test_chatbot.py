@@ -48,9 +48,9 @@ def test_make_api_request_success(mock_github_token) -> None:
     :param mock_github_token: Fixture to mock the loading of the GitHub token.
     :return: None
     """
-    with patch('codecompasslib.chatbot.api_utilities.requests.post') as mocked_post:
-        mocked_post.return_value = Mock(status_code=200,
-                                        json=lambda: {"data": "some data", "usefulUrls": ["http://example.com"]})
+    with patch('codecompasslib.chatbot.api_utilities.get_http_client') as mocked_client:
+        mocked_client.return_value.post.return_value = Mock(
+            status_code=200, json=lambda: {"data": "some data", "usefulUrls": ["http://example.com"]})
         response = make_api_request("https://fakeurl.com/api/test", {})
         assert "usefulUrls" not in response
         assert response == {"data": "some data"}
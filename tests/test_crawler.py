@@ -0,0 +1,474 @@
+"""
+These tests run the crawler against a local mock of the GitHub API, so they do not need a token or network access.
+"""
+import pytest
+from json import loads
+from requests import Response
+import codecompasslib.API.get_bulk_data as bulk
+from benchmarks.mock_github import MockGitHubServer
+from codecompasslib.API.rate_limit import RateLimiter
+from codecompasslib.API.token_pool import TokenPool
+from codecompasslib.API.paginator import next_page_url
+from codecompasslib.API.http_cache import ResponseCache, cache_key
+from codecompasslib.API.http_session import HttpClient
+from codecompasslib.API.incremental_refresh import refresh_dataset
+from pandas import DataFrame
+from codecompasslib.API.parquet_sink import ParquetSink, read_repos_parquet
+from codecompasslib.API.repo_records import RepoBatch
+from codecompasslib.API.helper_functions import get_repo_fields
+from codecompasslib.API.search_harvester import harvest_search
+from codecompasslib.API.metrics import METRICS
+
+
+@pytest.fixture
+def response_cache(tmp_path) -> ResponseCache:
+    """
+    Returns an empty response cache stored in a temporary directory
+    :return: A ResponseCache
+    """
+    cache: ResponseCache = ResponseCache(str(tmp_path / 'responses.sqlite'))
+    yield cache
+    cache.close()
+
+
+@pytest.fixture
+def github_server(monkeypatch, response_cache) -> MockGitHubServer:
+    """
+    Starts a local mock GitHub API and points get_bulk_data at it
+    :return: The running mock server
+    """
+    with MockGitHubServer() as server:
+        monkeypatch.setattr(bulk, 'API_URL', server.url)
+        monkeypatch.setattr(bulk, 'RESPONSE_CACHE', response_cache)
+        yield server
+
+
+@pytest.mark.parametrize("max_in_flight", [1, 8])
+def test_get_bulk_data_matches_serial_crawl(github_server, max_in_flight) -> None:
+    """
+    The concurrent crawl must return the seed users with all their followers and following, whatever the concurrency.
+    :param github_server: The mock GitHub API
+    :param max_in_flight: The maximum amount of requests in flight
+    :return: None
+    """
+    users: list = bulk.get_bulk_data(3, max_in_flight=max_in_flight)
+    assert set(users) == github_server.expected_users(['seed-0', 'seed-1', 'seed-2'])
+    assert len(users) == len(set(users))
+
+
+def test_get_bulk_data_resumes_where_it_stopped(github_server, monkeypatch, tmp_path) -> None:
+    """
+    A crawl that failed in the middle of a list resumes from the page it stopped at, without redoing the rest.
+    :param github_server: The mock GitHub API
+    :return: None
+    """
+    monkeypatch.setattr(bulk, 'get_http_client', lambda: HttpClient(max_retries=0))
+    state_path: str = str(tmp_path / 'crawl.sqlite')
+    failing_page: str = '/users/seed-1/followers?per_page=100&page=2'
+    github_server.fail_paths = [failing_page]
+
+    first_users: list = bulk.get_bulk_data(3, state_path=state_path)
+    assert 'seed-1-follower-99' in first_users
+    assert 'seed-1-follower-100' not in first_users
+
+    github_server.fail_paths = []
+    github_server.paths.clear()
+    second_users: list = bulk.get_bulk_data(3, state_path=state_path)
+    assert set(second_users) == github_server.expected_users(['seed-0', 'seed-1', 'seed-2'])
+    assert github_server.paths[0] == failing_page
+    assert all(path.startswith('/users/seed-1/followers') for path in github_server.paths)
+
+
+def test_get_bulk_data_multi_hop(monkeypatch, response_cache) -> None:
+    """
+    With max_depth=2, the followers and following of the seed users are expanded too.
+    :return: None
+    """
+    with MockGitHubServer(followers_per_user=3, following_per_user=2) as server:
+        monkeypatch.setattr(bulk, 'API_URL', server.url)
+        monkeypatch.setattr(bulk, 'RESPONSE_CACHE', response_cache)
+        users: list = bulk.get_bulk_data(2, max_depth=2)
+        first_hop: set = server.expected_users(['seed-0', 'seed-1'])
+        assert set(users) == server.expected_users(sorted(first_hop))
+
+
+def test_get_bulk_data_streams_repos_to_sink(github_server, tmp_path) -> None:
+    """
+    With a sink, the repositories of every crawled user are written to the Parquet dataset.
+    :param github_server: The mock GitHub API
+    :return: None
+    """
+    with ParquetSink(str(tmp_path / 'repos'), batch_size=500) as sink:
+        users: list = bulk.get_bulk_data(1, sink=sink)
+
+    df: DataFrame = read_repos_parquet(str(tmp_path / 'repos'))
+    assert len(df) == sink.written == len(users) * github_server.repos_per_user
+    assert set(df['owner_user']) == set(users)
+
+
+def test_get_followers_paginates(github_server) -> None:
+    """
+    The followers are read page by page following the Link header.
+    :param github_server: The mock GitHub API
+    :return: None
+    """
+    followers_list, followers_flag = bulk.get_followers('someone')
+    assert followers_flag
+    assert followers_list == github_server.followers('someone')
+
+
+def test_get_following_respects_item_cap(github_server) -> None:
+    """
+    The item cap is honoured exactly, and no page is requested past it.
+    :param github_server: The mock GitHub API
+    :return: None
+    """
+    following_list, following_flag = bulk.get_following('someone', max_items=150)
+    assert following_flag
+    assert following_list == github_server.following('someone')[:150]
+    assert github_server.request_count == 2
+
+
+def test_iter_user_repos_streams_records(github_server) -> None:
+    """
+    The repositories are streamed as get_repo_fields records.
+    :param github_server: The mock GitHub API
+    :return: None
+    """
+    repos = bulk.iter_user_repos('someone')
+    first: dict = next(repos)
+    assert first['owner_user'] == 'someone'
+    assert len(list(repos)) == github_server.repos_per_user - 1
+
+
+def test_get_user_repos_fail(github_server) -> None:
+    """
+    A failing request ends the stream with the flag set to False.
+    :param github_server: The mock GitHub API
+    :return: None
+    """
+    user_repos, user_repos_flag = bulk.get_user_repos('missing-user')
+    assert user_repos == []
+    assert user_repos_flag is False
+
+
+def test_response_cache_revalidates_with_etag(github_server, response_cache) -> None:
+    """
+    A second crawl of the same repositories is answered with 304s and served from the cache.
+    :param github_server: The mock GitHub API
+    :param response_cache: The cache used by get_bulk_data
+    :return: None
+    """
+    first_repos, _ = bulk.get_user_repos('someone')
+    remaining: int = github_server.remaining
+    second_repos, second_flag = bulk.get_user_repos('someone')
+
+    assert second_flag
+    assert second_repos == first_repos
+    assert github_server.not_modified_count == 1
+    assert github_server.remaining == remaining  # 304 answers do not count against the quota
+    assert response_cache.stats()['hits'] == 1
+    assert response_cache.stats()['misses'] == 1
+
+
+def test_response_cache_evicts_least_recently_used(tmp_path) -> None:
+    """
+    Once the stored bodies exceed max_bytes, the least recently used responses are evicted.
+    :return: None
+    """
+    cache: ResponseCache = ResponseCache(str(tmp_path / 'responses.sqlite'), max_bytes=250)
+    for index in range(3):
+        response: Response = Response()
+        response.status_code = 200
+        response.headers['ETag'] = f'"{index}"'
+        response._content = b'x' * 100
+        cache.store(cache_key('https://api.github.com/users/someone/repos', {'page': index}), response)
+
+    assert cache.lookup(cache_key('https://api.github.com/users/someone/repos', {'page': 0})) is None
+    assert cache.lookup(cache_key('https://api.github.com/users/someone/repos', {'page': 2})).etag == '"2"'
+    assert cache.stats()['evictions'] == 1
+    assert cache.stats()['size_bytes'] == 200
+    cache.close()
+
+
+def test_response_cache_hits_count_as_uses(tmp_path) -> None:
+    """
+    A response served from the cache is kept over the ones stored after it but not used since.
+    :return: None
+    """
+    cache: ResponseCache = ResponseCache(str(tmp_path / 'responses.sqlite'), max_bytes=250)
+    keys: list = [cache_key('https://api.github.com/users/someone/repos', {'page': index}) for index in range(3)]
+    for index, key in enumerate(keys):
+        response: Response = Response()
+        response.status_code = 200
+        response.headers['ETag'] = f'"{index}"'
+        response._content = b'x' * 100
+        cache.store(key, response)
+        if index == 1:
+            assert cache.lookup(keys[0]).etag == '"0"'
+
+    assert cache.lookup(keys[1]) is None
+    assert cache.lookup(keys[0]).etag == '"0"'
+    cache.close()
+
+
+def test_refresh_dataset_fetches_only_pushed_repos(github_server) -> None:
+    """
+    An incremental refresh requests a single page per owner and upserts only the repositories pushed since.
+    :param github_server: The mock GitHub API
+    :return: None
+    """
+    df: DataFrame = DataFrame(bulk.get_user_repos('alice')[0] + bulk.get_user_repos('bob')[0])
+    github_server.push('alice', 3, '2025-06-01T00:00:00Z')
+    github_server.push('alice', 99, '2025-06-02T00:00:00Z')  # A new repository
+    github_server.paths.clear()
+
+    refreshed: DataFrame = refresh_dataset(df)
+
+    assert len(github_server.paths) == 2
+    assert len(refreshed) == len(df) + 1
+    assert refreshed['id'].is_unique
+    pushed: DataFrame = refreshed[refreshed['date_pushed'] >= '2025']
+    assert sorted(pushed['name']) == ['alice-repo-3', 'alice-repo-99']
+
+
+def test_refresh_dataset_keeps_typed_columns(github_server) -> None:
+    """
+    A dataset with typed dates, as read from Parquet, is refreshed the same way, and its columns keep their types.
+    :param github_server: The mock GitHub API
+    :return: None
+    """
+    df: DataFrame = RepoBatch(bulk.get_user_repos('alice')[0] + bulk.get_user_repos('bob')[0]).to_dataframe()
+    github_server.push('alice', 3, '2025-06-01T00:00:00Z')
+    github_server.push('alice', 99, '2025-06-02T00:00:00Z')
+
+    refreshed: DataFrame = refresh_dataset(df)
+
+    assert len(refreshed) == len(df) + 1
+    assert refreshed.dtypes.equals(df.dtypes)
+    pushed: DataFrame = refreshed[refreshed['date_pushed'] >= '2025']
+    assert sorted(pushed['name']) == ['alice-repo-3', 'alice-repo-99']
+
+
+def test_get_misc_data_splits_queries_past_result_cap(github_server) -> None:
+    """
+    Queries matching more than 1000 repositories are split by creation date until every repository is reached,
+    and the repositories matched by several queries are returned once.
+    :param github_server: The mock GitHub API
+    :return: None
+    """
+    github_server.search_results = 1100
+    misc_data_list: list = bulk.get_misc_data(['in:name'], max_results=None)
+
+    assert len(misc_data_list) == github_server.search_results
+    assert len({repo['id'] for repo in misc_data_list}) == github_server.search_results
+    assert all('created%3A' in path for path in github_server.paths)
+
+
+def test_harvest_search_skips_failing_queries(github_server) -> None:
+    """
+    A failing query does not stop the other ones.
+    :param github_server: The mock GitHub API
+    :return: None
+    """
+    url: str = f'{bulk.API_URL}/search/repositories'
+    repos: list = list(harvest_search(bulk.fetch_github, url, ['missing', 'language:Python'], max_results=None))
+
+    assert len(repos) == github_server.search_results
+
+
+def test_get_misc_data_reads_first_results_by_default(github_server) -> None:
+    """
+    By default, only the first page of every query is read, with a single request per query.
+    :param github_server: The mock GitHub API
+    :return: None
+    """
+    misc_data_list: list = bulk.get_misc_data(['language'])
+
+    assert len(github_server.paths) == 16
+    assert isinstance(misc_data_list, list) and len(misc_data_list) == 100
+    assert sorted(bulk.get_misc_batch(['language']), key=repr) == sorted(misc_data_list, key=repr)
+
+
+def test_repo_batch_round_trips_records(github_server) -> None:
+    """
+    A RepoBatch gives back the records it was built from, interns the repeated strings, and converts to a typed
+    DataFrame.
+    :param github_server: The mock GitHub API
+    :return: None
+    """
+    records: list = [get_repo_fields(github_server.repo(owner, i)) for owner in ('alice', 'bob') for i in range(10)]
+    records[0]['date_pushed'] = None
+    batch: RepoBatch = RepoBatch(records)
+
+    assert len(batch) == len(records)
+    assert list(batch) == records
+    assert batch[3]['language'] is batch[6]['language']
+
+    df: DataFrame = batch.to_dataframe()
+    assert df['id'].tolist() == [record['id'] for record in records]
+    assert df['has_issues'].dtype == bool
+    assert str(df['date_created'].dt.tz) == 'UTC'
+    assert df['date_pushed'].isna().sum() == 1
+
+
+def test_write_user_repos_streams_to_parquet(github_server, tmp_path) -> None:
+    """
+    The repositories are written in fixed-size batches to a dataset partitioned by crawl date and language,
+    with typed columns.
+    :param github_server: The mock GitHub API
+    :return: None
+    """
+    root: str = str(tmp_path / 'repos')
+    with ParquetSink(root, batch_size=40, crawl_date='2024-05-01') as sink:
+        failed: int = bulk.write_user_repos(['alice', 'bob', 'missing-user'], sink, max_in_flight=2)
+
+    assert failed == 1
+    assert sink.written == 2 * github_server.repos_per_user
+    assert sink.files == len(list((tmp_path / 'repos').glob('*/*/*.parquet')))
+    assert sink.files > 2  # Every flush writes a file per language
+    assert (tmp_path / 'repos' / 'crawl_date=2024-05-01' / 'language=Python').is_dir()
+
+    df: DataFrame = read_repos_parquet(root)
+    assert len(df) == sink.written
+    assert df['is_fork'].dtype == bool
+    assert str(df['date_pushed'].dt.tz) == 'UTC'
+    assert list(df['topics'].iloc[0])[0] == 'mock'
+
+
+def test_transient_errors_are_retried(github_server, monkeypatch) -> None:
+    """
+    A 502 in the middle of a pagination chain is retried instead of aborting the whole list.
+    :param github_server: The mock GitHub API
+    :return: None
+    """
+    client: HttpClient = HttpClient(backoff_base=0.01)
+    monkeypatch.setattr(bulk, 'get_http_client', lambda: client)
+    github_server.fail_next = 2
+
+    followers_list, followers_flag = bulk.get_followers('someone')
+    assert followers_flag
+    assert followers_list == github_server.followers('someone')
+    assert client.retries == 2
+
+
+def test_metrics_record_every_request(github_server, monkeypatch) -> None:
+    """
+    The fetchers report their latency, bytes, pages, retries and quota to METRICS, exported as JSON and Prometheus.
+    :param github_server: The mock GitHub API
+    :return: None
+    """
+    monkeypatch.setattr(bulk, 'get_http_client', lambda: HttpClient(backoff_base=0.01))
+    METRICS.reset()
+    github_server.fail_next = 1
+
+    bulk.get_followers('someone')
+    snapshot: dict = METRICS.snapshot()
+    endpoint: str = '/users/{user}/followers'
+    pages: int = -(-github_server.followers_per_user // 100)
+
+    assert snapshot['latency_seconds'][endpoint]['count'] == pages + 1
+    assert snapshot['requests'][f'{endpoint} 502'] == 1
+    assert snapshot['counters']['pages'][endpoint] == pages
+    assert snapshot['counters']['retries'][endpoint] == 1
+    assert snapshot['counters']['response_bytes'][endpoint] > 0
+    assert all(quota['remaining'] < github_server.rate_limit for quota in snapshot['quota'].values())
+
+    prometheus: str = METRICS.to_prometheus()
+    assert f'codecompass_http_request_duration_seconds_count{{endpoint="{endpoint}"}} {pages + 1}' in prometheus
+    assert f'codecompass_pages_total{{endpoint="{endpoint}"}} {pages}' in prometheus
+    assert 'codecompass_rate_limit_remaining{token="0:...' in prometheus
+    assert loads(METRICS.to_json())['counters']['pages'][endpoint] == pages
+
+
+def test_retries_are_bounded(github_server) -> None:
+    """
+    Once the retries are exhausted, the last error response is returned.
+    :param github_server: The mock GitHub API
+    :return: None
+    """
+    client: HttpClient = HttpClient(max_retries=1, backoff_base=0.01)
+    github_server.fail_next = 5
+    response: Response = client.get(f'{github_server.url}/users/someone/followers')
+    assert response.status_code == 502
+    assert github_server.request_count == 2
+
+
+@pytest.mark.parametrize("link_header, expected", [
+    (None, ''),
+    ('<https://api.github.com/user/1/followers?page=2>; rel="next", '
+     '<https://api.github.com/user/1/followers?page=5>; rel="last"', 'https://api.github.com/user/1/followers?page=2'),
+    ('<https://api.github.com/user/1/followers?page=4>; rel="prev"', ''),
+])
+def test_next_page_url(link_header, expected) -> None:
+    """
+    Only the rel="next" link is followed, and a Link header without one ends the pagination.
+    :return: None
+    """
+    assert next_page_url(link_header) == expected
+
+
+def test_rate_limiter_waits_for_reset(monkeypatch) -> None:
+    """
+    Once the quota is exhausted, the limiter sleeps until the reset time instead of sending the request.
+    :return: None
+    """
+    now: list = [1000.0]
+    slept: list = []
+
+    def fake_sleep(seconds: float) -> None:
+        slept.append(seconds)
+        now[0] += seconds
+
+    monkeypatch.setattr('codecompasslib.API.rate_limit.time', lambda: now[0])
+    monkeypatch.setattr('codecompasslib.API.rate_limit.sleep', fake_sleep)
+
+    limiter: RateLimiter = RateLimiter()
+    limiter.update({'X-RateLimit-Remaining': '1', 'X-RateLimit-Reset': '1030'})
+    limiter.acquire()
+    assert slept == []
+
+    limiter.acquire()
+    assert slept == [31.0]
+
+
+def test_token_pool_routes_to_most_remaining_quota(github_server, monkeypatch) -> None:
+    """
+    Every request goes to the token with the most quota left, so the requests are spread over the pool.
+    :param github_server: The mock GitHub API
+    :return: None
+    """
+    pool: TokenPool = TokenPool(['token-aaaa', 'token-bbbb'])
+    monkeypatch.setattr(bulk, 'TOKEN_POOL', pool)
+    github_server.rate_limit = 2
+
+    followers_list, followers_flag = bulk.get_followers('someone')
+    assert followers_flag
+    assert github_server.requests_by_token == {'token token-aaaa': 2, 'token token-bbbb': 1}
+    assert pool.metrics()['0:...aaaa']['requests'] == 2
+    assert pool.metrics()['1:...bbbb']['core']['remaining'] == 1
+
+
+def test_token_pool_parks_exhausted_tokens(monkeypatch) -> None:
+    """
+    An exhausted token is skipped until its reset, and the pool only waits when every token is exhausted.
+    :return: None
+    """
+    now: list = [1000.0]
+    slept: list = []
+
+    def fake_sleep(seconds: float) -> None:
+        slept.append(seconds)
+        now[0] += seconds
+
+    monkeypatch.setattr('codecompasslib.API.rate_limit.time', lambda: now[0])
+    monkeypatch.setattr('codecompasslib.API.token_pool.sleep', fake_sleep)
+
+    pool: TokenPool = TokenPool(['token-aaaa', 'token-bbbb'])
+    pool.update('token-aaaa', 'core', {'X-RateLimit-Remaining': '0', 'X-RateLimit-Reset': '1100'})
+    pool.update('token-bbbb', 'core', {'X-RateLimit-Remaining': '1', 'X-RateLimit-Reset': '1050'})
+
+    assert pool.acquire() == 'token-bbbb'
+    assert slept == []
+    assert pool.acquire() == 'token-bbbb'  # Both are exhausted, bbbb resets first
+    assert slept == [51.0]
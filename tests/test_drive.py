@@ -1,6 +1,19 @@
 import pytest
+from hashlib import md5
+from typing import Tuple
+from unittest.mock import Mock
+from datetime import datetime, timedelta
+from google.oauth2.credentials import Credentials
+import codecompasslib.API.drive_operations as drive
 from codecompasslib.API.drive_operations import (list_shared_drive_contents, download_csv_as_pd_dataframe,
                                                  upload_df_to_drive_as_csv)
+from codecompasslib.API.drive_cache import DriveCache
+from codecompasslib.API.http_session import HttpClient
+import codecompasslib.API.storage as storage
+from codecompasslib.models import cosine_similarity_model
+from benchmarks.mock_drive import MockDriveServer
+from pandas import DataFrame
+from io import BytesIO
 
 
 def test_list_shared_drive_contents(creds, folder_id, drive_id) -> None:
@@ -37,3 +50,289 @@ def test_upload_df_to_drive_as_csv(creds, df, filename, folder_id) -> None:
     """
     flag: bool = upload_df_to_drive_as_csv(creds, df, filename, folder_id)
     assert flag
+
+
+@pytest.fixture
+def drive_server(monkeypatch, tmp_path) -> MockDriveServer:
+    """
+    Starts a local mock of the Drive API and points drive_operations to it, with an empty download cache.
+    :return: The mock Drive API
+    """
+    with MockDriveServer(page_size=2) as server:
+        monkeypatch.setattr(drive, 'DRIVE_API_URL', server.url)
+        monkeypatch.setattr(drive, 'DRIVE_CACHE', DriveCache(str(tmp_path / 'drive')))
+        yield server
+        drive.DRIVE_CACHE.close()
+
+
+def test_download_csv_in_parallel_ranges(drive_server, monkeypatch) -> None:
+    """
+    Files larger than the chunk size are downloaded in several Range requests, and put back together in order.
+    :param drive_server: The mock Drive API
+    :return: None
+    """
+    df: DataFrame = DataFrame({'id': range(2000), 'name': [f'repo-{i}' for i in range(2000)]})
+    content: bytes = df.to_csv(index=False).encode()
+    drive_server.add_file('large', 'large.csv', content)
+    monkeypatch.setattr(drive, 'DOWNLOAD_CHUNK_SIZE', 4096)
+
+    downloaded: DataFrame = download_csv_as_pd_dataframe(Credentials(token='token'), 'large')
+    assert downloaded.equals(df)
+    assert drive_server.range_requests == -(-len(content) // 4096)
+    assert drive_server.bytes_sent == len(content)
+
+
+def test_download_csvs_concurrently(drive_server, df) -> None:
+    """
+    Several files are downloaded at the same time, and returned in the order they were asked for.
+    :param drive_server: The mock Drive API
+    :param df: A Pandas DataFrame
+    :return: None
+    """
+    drive_server.add_file('first', 'first.csv', df.to_csv(index=False).encode())
+    drive_server.add_file('second', 'second.csv', (df * 10).to_csv(index=False).encode())
+
+    first, second = drive.download_pd_dataframes(Credentials(token='token'), ['first', 'second'])
+    assert first.equals(df)
+    assert second.equals(df * 10)
+
+
+@pytest.mark.parametrize("name, mime_type, file_format", [
+    ('repos.parquet', 'application/octet-stream', 'parquet'),
+    ('repos', 'application/vnd.apache.arrow.file', 'feather'),
+    ('repos.csv', 'text/csv', 'csv'),
+])
+def test_download_detects_dataset_format(drive_server, name, mime_type, file_format) -> None:
+    """
+    The format of a dataset is detected from its name or MIME type, and the column types survive the round trip.
+    :param drive_server: The mock Drive API
+    :return: None
+    """
+    df: DataFrame = DataFrame({'id': [1, 2, 3], 'owner_user': ['a', 'b', 'c'], 'embedding_0': [0.5, 0.25, 1.0]})
+    df['embedding_0'] = df['embedding_0'].astype('float16')
+    fh: BytesIO = BytesIO()
+    drive.write_dataset(df, fh, file_format)
+    drive_server.add_file('dataset', name, fh.getvalue(), mime_type=mime_type)
+
+    assert drive.dataset_format(name, mime_type) == file_format
+    downloaded: DataFrame = drive.download_pd_dataframe(Credentials(token='token'), 'dataset')
+    assert downloaded[['id', 'owner_user']].equals(df[['id', 'owner_user']])
+    assert downloaded['embedding_0'].tolist() == df['embedding_0'].tolist()
+    if file_format != 'csv':
+        assert downloaded['embedding_0'].dtype == 'float16'
+
+
+@pytest.mark.parametrize("file_format", ['csv', 'parquet', 'feather'])
+def test_upload_streams_in_resumable_chunks(drive_server, monkeypatch, file_format) -> None:
+    """
+    A DataFrame is uploaded in chunks of bounded size, then uploading it again replaces the contents of the same file.
+    :param drive_server: The mock Drive API
+    :param file_format: The format of the uploaded file
+    :return: None
+    """
+    df: DataFrame = DataFrame({'id': range(20000), 'name': [f'repo-{i}' for i in range(20000)]})
+    monkeypatch.setattr(drive, 'UPLOAD_CHUNK_SIZE', 16384)
+    monkeypatch.setattr(drive, 'UPLOAD_ROWS_PER_BATCH', 3000)
+    creds: Credentials = Credentials(token='token')
+
+    assert drive.upload_df_to_drive(creds, df, f'repos.{file_format}', 'folder')
+    assert list(drive_server.files) == ['uploaded-0']
+    assert drive_server.files['uploaded-0']['mimeType'] == drive.DATASET_FORMATS[file_format]
+    assert drive_server.upload_requests > 1
+    assert drive_server.largest_upload_request <= 16384
+    assert drive.download_pd_dataframe(creds, 'uploaded-0').equals(df)
+
+    assert drive.upload_df_to_drive(creds, df.head(10), f'repos.{file_format}', 'folder')
+    assert list(drive_server.files) == ['uploaded-0']
+    assert drive.read_dataset(BytesIO(drive_server.files['uploaded-0']['content']), file_format).equals(df.head(10))
+
+
+def test_upload_resumes_from_acknowledged_byte(drive_server, monkeypatch) -> None:
+    """
+    An upload cut off mid-chunk, or only partly persisted by Drive, carries on from the last byte Drive acknowledged.
+    :param drive_server: The mock Drive API
+    :return: None
+    """
+    df: DataFrame = DataFrame({'id': range(5000), 'name': [f'repo-{i}' for i in range(5000)]})
+    content: bytes = df.to_csv(index=False).encode()
+    # Without retries in the client, the dropped connection reaches the upload
+    monkeypatch.setattr(drive, 'get_http_client', lambda client=HttpClient(max_retries=0): client)
+    drive_server.drop_uploads = 2
+    drive_server.persist_limit = 10000
+
+    uploaded: dict = drive.upload_stream(Credentials(token='token'), iter([content[:30000], content[30000:]]),
+                                         {'name': 'repos.csv', 'mimeType': 'text/csv'}, chunk_size=16384)
+    assert drive_server.files[uploaded['id']]['content'] == content
+    assert drive_server.drop_uploads == 0
+
+
+def test_upload_fails_when_acknowledged_bytes_are_lost(drive_server) -> None:
+    """
+    An upload fails, rather than sending the wrong bytes, when Drive no longer has bytes it acknowledged before.
+    :param drive_server: The mock Drive API
+    :return: None
+    """
+    def chunks():
+        yield b'x' * 30000
+        drive_server.uploads['0']['data'].clear()
+        yield b'y' * 30000
+
+    with pytest.raises(IOError, match='Upload lost bytes 0-16383'):
+        drive.upload_stream(Credentials(token='token'), chunks(), {'name': 'repos.csv', 'mimeType': 'text/csv'},
+                            chunk_size=16384)
+    assert drive_server.files == {}
+
+
+def test_listing_follows_next_page_token(drive_server) -> None:
+    """
+    Every page of a folder listing is read, not only the first one.
+    :param drive_server: The mock Drive API
+    :return: None
+    """
+    for i in range(5):
+        drive_server.add_file(f'file-{i}', f'file-{i}.csv', b'a,b\n1,2\n')
+
+    service = drive.get_drive_service(Credentials(token='token'))
+    files: list = list(drive.iter_drive_files(service, q="'folder' in parents",
+                                              fields="nextPageToken, files(id, name)"))
+    assert [file['id'] for file in files] == [f'file-{i}' for i in range(5)]
+    assert drive_server.request_count == 3
+
+
+def test_local_storage_round_trips_datasets(tmp_path) -> None:
+    """
+    The local storage saves datasets by name in folders, and loads them by path with or without their extension.
+    :return: None
+    """
+    df: DataFrame = DataFrame({'id': [1, 2, 3], 'owner_user': ['a', 'b', 'c']})
+    local: storage.LocalStorage = storage.LocalStorage(str(tmp_path))
+
+    assert local.save(df, 'repos.parquet', 'folder')
+    assert local.save(df.head(2), 'repos.feather', 'folder')
+    assert local.save(df.head(1), 'repos.csv', 'other')
+    assert sorted(path.name for path in (tmp_path / 'folder').iterdir()) == ['repos.feather', 'repos.parquet']
+
+    parquet, feather, csv = local.load_many(['folder/repos.parquet', 'folder/repos.feather', 'other/repos'])
+    assert parquet.equals(df) and feather.equals(df.head(2)) and csv.equals(df.head(1))
+    with pytest.raises(FileNotFoundError):
+        local.load('folder/missing')
+
+
+def test_storage_is_selected_by_environment(tmp_path, monkeypatch) -> None:
+    """
+    With CODECOMPASS_STORAGE=local, the models load their datasets from CODECOMPASS_DATA_DIR instead of Drive.
+    :return: None
+    """
+    monkeypatch.setattr(storage, '_storage', None)
+    monkeypatch.setenv('CODECOMPASS_STORAGE', 'local')
+    monkeypatch.setenv('CODECOMPASS_DATA_DIR', str(tmp_path))
+    df: DataFrame = DataFrame({'id': [1, 2], 'name': ['first', 'second']})
+    df.to_parquet(tmp_path / '1WSgwAhzNbSqC6e_RRBDHpgpQCnGZvVcc.parquet', index=False)
+
+    assert isinstance(storage.get_storage(), storage.LocalStorage)
+    assert storage.get_storage() is storage.get_storage()
+    assert cosine_similarity_model.load_data('1WSgwAhzNbSqC6e_RRBDHpgpQCnGZvVcc').equals(df)
+
+    assert isinstance(storage.configure_storage('drive'), storage.DriveStorage)
+    with pytest.raises(ValueError):
+        storage.configure_storage('s3')
+
+
+def test_drive_cache_evicts_least_recently_used(tmp_path) -> None:
+    """
+    Files are stored once per content, invalidated when Drive reports new metadata, and evicted least recently used
+    first.
+    :param tmp_path: A temporary directory
+    :return: None
+    """
+    cache: DriveCache = DriveCache(str(tmp_path), max_bytes=25)
+
+    def download(content: bytes) -> Tuple[dict, str]:
+        path: str = cache.staging_path()
+        with open(path, 'wb') as fh:
+            fh.write(content)
+        return {'md5Checksum': md5(content).hexdigest(), 'modifiedTime': '2024-01-01T00:00:00.000Z'}, path
+
+    first, path = download(b'a' * 10)
+    assert cache.store('first', first, path)
+    second, path = download(b'a' * 10)
+    assert cache.store('second', second, path)  # Same content, stored once
+    assert cache.stats()['size_bytes'] == 10
+
+    assert cache.lookup('first', first) == cache.path(first['md5Checksum'])
+    assert cache.lookup('first', {**first, 'modifiedTime': '2024-02-01T00:00:00.000Z'}) is None
+
+    third, path = download(b'b' * 20)
+    assert cache.store('third', third, path)
+    assert cache.lookup('first', first) is None
+    assert cache.lookup('third', third) is not None
+    assert cache.stats()['evictions'] == 2
+    cache.close()
+
+
+def test_download_csv_is_served_from_cache(tmp_path, monkeypatch, df) -> None:
+    """
+    A warm start reads the file from the local cache, without downloading it again.
+    :param tmp_path: A temporary directory
+    :param df: A Pandas DataFrame
+    :return: None
+    """
+    content: bytes = df.to_csv(index=False).encode()
+    metadata: dict = {'md5Checksum': md5(content).hexdigest(), 'modifiedTime': '2024-01-01T00:00:00.000Z'}
+    service: Mock = Mock()
+    service.files.return_value.get.return_value.execute.side_effect = lambda: metadata
+    downloads: list = []
+
+    def download_file(creds, file_id, size, fh, *args) -> None:
+        downloads.append(file_id)
+        fh.write(content)
+
+    monkeypatch.setattr(drive, 'get_drive_service', lambda creds: service)
+    monkeypatch.setattr(drive, 'download_file', download_file)
+    monkeypatch.setattr(drive, 'DRIVE_CACHE', DriveCache(str(tmp_path)))
+
+    assert download_csv_as_pd_dataframe(None, 'file').equals(df)
+    assert download_csv_as_pd_dataframe(None, 'file').equals(df)
+    assert downloads == ['file']
+
+    metadata['modifiedTime'] = '2024-02-01T00:00:00.000Z'
+    download_csv_as_pd_dataframe(None, 'file')
+    assert downloads == ['file', 'file']
+    drive.DRIVE_CACHE.close()
+
+
+def test_drive_service_and_creds_are_memoized(tmp_path, monkeypatch) -> None:
+    """
+    token.json is read once per process and the service is built once per thread, while credentials about to expire
+    are refreshed ahead of time.
+    :param tmp_path: A temporary directory
+    :return: None
+    """
+    (tmp_path / 'secrets').mkdir()
+    loads: list = []
+    refreshes: list = []
+    stored: Credentials = Credentials(token='token', refresh_token='refresh',
+                                      expiry=datetime.utcnow() + timedelta(hours=1))
+
+    def refresh(request) -> None:
+        refreshes.append(request)
+        stored.expiry = datetime.utcnow() + timedelta(hours=1)
+
+    def from_authorized_user_file(path: str, scopes: list) -> Credentials:
+        loads.append(path)
+        return stored
+
+    monkeypatch.setattr(stored, 'refresh', refresh)
+    monkeypatch.setattr(drive, 'OUTER_PATH', str(tmp_path))
+    monkeypatch.setattr(drive, '_creds', None)
+    monkeypatch.setattr(drive.Credentials, 'from_authorized_user_file', from_authorized_user_file)
+
+    creds: Credentials = drive.get_creds_drive()
+    assert drive.get_creds_drive() is creds
+    assert drive.get_drive_service(creds) is drive.get_drive_service(creds)
+    assert len(loads) == 1 and refreshes == []
+
+    creds.expiry = datetime.utcnow() + timedelta(minutes=1)
+    assert drive.get_creds_drive() is creds
+    assert len(refreshes) == 1
+    assert (tmp_path / 'secrets' / 'token.json').exists()
@@ -0,0 +1,419 @@
+"""
+These tests run the embedding jobs against a local mock of the OpenAI API, so they do not need a key or network access.
+"""
+import os
+import pytest
+import numpy as np
+import openai
+from typing import List
+from gensim.models.keyedvectors import KeyedVectors
+from pandas import DataFrame
+from benchmarks.mock_openai import MockOpenAIServer
+from codecompasslib.API.rate_limit import TokenBucket
+from codecompasslib.embeddings.embedding_cache import EmbeddingCache
+from codecompasslib.embeddings.embedding_jobs import run_embedding_job
+from codecompasslib.embeddings.embedding_store import EmbeddingStore, load_embeddings
+from codecompasslib.embeddings.sentence_encoder import SentenceEncoder, get_sentence_encoder
+from codecompasslib.embeddings import embedding_store, quantization, word2vec_vectorizer
+from codecompasslib.embeddings.word2vec_vectorizer import Word2VecVectorizer, get_word2vec_vectorizer, vectorize_texts
+import codecompasslib.API.storage as storage
+
+
+@pytest.fixture
+def openai_server() -> MockOpenAIServer:
+    """
+    Starts a local mock of the OpenAI API.
+    :return: The mock OpenAI API
+    """
+    with MockOpenAIServer() as server:
+        yield server
+
+
+@pytest.fixture
+def repos() -> DataFrame:
+    """
+    Returns repositories with a description to embed
+    :return: A DataFrame with id, owner_user and description columns
+    """
+    return DataFrame({'id': range(100), 'owner_user': [f'owner-{i % 7}' for i in range(100)],
+                      'description': [f'A tool number {i} for developers' for i in range(100)]})
+
+
+def embedder(server: MockOpenAIServer, dimensions: int = 16):
+    """
+    Returns a function embedding a batch of texts with the mock OpenAI API, as generate_embedded_dataset does
+    """
+    client: openai.Client = openai.Client(api_key='key', base_url=server.url, max_retries=0)
+
+    def embed(texts: List[str]) -> List[List[float]]:
+        response = client.embeddings.create(input=texts, model='text-embedding-3-large', dimensions=dimensions)
+        return [embedding.embedding for embedding in response.data]
+
+    return embed
+
+
+def test_embedding_job_embeds_batches_concurrently(openai_server, repos, tmp_path) -> None:
+    """
+    The batches are sent at the same time, and put back together in the order of the dataset.
+    :return: None
+    """
+    openai_server.latency = 0.05
+    df: DataFrame = run_embedding_job(embedder(openai_server), repos, 'description', str(tmp_path), batch_size=10,
+                                      max_in_flight=4)
+
+    assert openai_server.request_count == 10
+    assert openai_server.max_in_flight > 1
+    assert df['id'].tolist() == list(range(100)) and df['owner_user'].equals(repos['owner_user'])
+    expected: np.ndarray = np.stack([MockOpenAIServer.embedding(text, 16) for text in repos['description']])
+    assert df[[f'embedding_{i}' for i in range(16)]].dtypes.eq(np.float16).all()
+    assert np.allclose(df[[f'embedding_{i}' for i in range(16)]].to_numpy(np.float32), expected, atol=1e-3)
+
+
+def test_embedding_job_retries_rate_limits_and_errors(openai_server, repos, tmp_path) -> None:
+    """
+    Rate limited and failed requests are retried, after the wait asked for by the API.
+    :return: None
+    """
+    openai_server.rate_limited = 2
+    openai_server.failing = 1
+    df: DataFrame = run_embedding_job(embedder(openai_server), repos, 'description', str(tmp_path), batch_size=25)
+
+    assert len(df) == 100
+    assert openai_server.request_count == 4 + 3
+    assert openai_server.texts_embedded == 100
+
+
+def test_embedding_job_resumes_after_a_crash(openai_server, repos, tmp_path) -> None:
+    """
+    A job run again after a crash only embeds the batches that were not finished, without duplicates, and its
+    directory is removed once it is done.
+    :return: None
+    """
+    embed = embedder(openai_server)
+
+    def crashing_embed(texts: List[str]) -> List[List[float]]:
+        if texts[0] == repos['description'][50]:
+            raise RuntimeError("Crash")
+        return embed(texts)
+
+    job_dir: str = str(tmp_path / 'job')
+    with pytest.raises(RuntimeError):
+        run_embedding_job(crashing_embed, repos, 'description', job_dir, batch_size=10, max_in_flight=1)
+    assert openai_server.texts_embedded == 50
+    with pytest.raises(ValueError):
+        run_embedding_job(embed, repos.head(50), 'description', job_dir, batch_size=10)
+
+    df: DataFrame = run_embedding_job(embed, repos, 'description', job_dir, batch_size=10)
+    assert openai_server.texts_embedded == 100
+    assert df['id'].tolist() == list(range(100))
+    assert not (tmp_path / 'job').exists()  # Removed once done, so the next job on the directory starts over
+
+    assert len(run_embedding_job(embed, repos.head(50), 'description', job_dir, batch_size=10, keep_job=True)) == 50
+    assert (tmp_path / 'job' / 'checkpoint.sqlite').exists()
+
+
+def test_embedding_cache_only_embeds_misses_once(tmp_path) -> None:
+    """
+    Texts are keyed by model, dimensions and normalized text, and the texts sharing a key are embedded once.
+    :return: None
+    """
+    cache: EmbeddingCache = EmbeddingCache(str(tmp_path / 'cache.sqlite'))
+    calls: List[List[str]] = []
+
+    def embed(texts: List[str]) -> np.ndarray:
+        calls.append(texts)
+        return np.stack([MockOpenAIServer.embedding(text, 8) for text in texts])
+
+    first: np.ndarray = cache.embed('model', 8, ['A  tool', 'A tool', 'Another\ttool '], embed)
+    assert calls == [['A  tool', 'Another\ttool ']]
+    assert first.dtype == np.float16 and np.array_equal(first[0], first[1])
+
+    second: np.ndarray = cache.embed('model', 8, ['Another tool', 'A tool'], embed)
+    assert len(calls) == 1 and np.array_equal(second, first[[2, 0]])
+    cache.embed('model', 4, ['A tool'], lambda texts: np.ones((len(texts), 4)))
+    assert cache.stats() == {'hits': 2, 'misses': 4, 'hit_rate': pytest.approx(1 / 3), 'embeddings': 3}
+    cache.close()
+
+
+def test_embedding_job_skips_cached_descriptions(openai_server, repos, tmp_path) -> None:
+    """
+    Regenerating the dataset only sends the descriptions that changed since the last run.
+    :return: None
+    """
+    cache: EmbeddingCache = EmbeddingCache(str(tmp_path / 'cache.sqlite'))
+    first: DataFrame = run_embedding_job(embedder(openai_server), repos, 'description', str(tmp_path / 'first'),
+                                         batch_size=30, cache=cache, model='text-embedding-3-large', dimensions=16)
+    assert openai_server.texts_embedded == 100
+
+    repos.loc[42, 'description'] = 'A description that changed'
+    second: DataFrame = run_embedding_job(embedder(openai_server), repos, 'description', str(tmp_path / 'second'),
+                                          batch_size=30, cache=cache, model='text-embedding-3-large', dimensions=16)
+    assert openai_server.texts_embedded == 101 and openai_server.batches[-1] == ['A description that changed']
+    assert second.drop(index=42).equals(first.drop(index=42))
+    assert not second.loc[42].equals(first.loc[42])
+    cache.close()
+
+
+def embedded_dataset(rows: int, dimensions: int = 8, seed: int = 0) -> DataFrame:
+    """
+    Returns an embedded dataset shaped like the output of generate_embedded_dataset, with shuffled ids
+    """
+    rng: np.random.Generator = np.random.default_rng(seed)
+    df: DataFrame = DataFrame(rng.standard_normal((rows, dimensions)).astype(np.float16),
+                              columns=[f'embedding_{i}' for i in range(dimensions)])
+    df.insert(0, 'owner_user', [f'owner-{i % 7}' for i in range(rows)])
+    df.insert(0, 'id', rng.permutation(rows * 10)[:rows])
+    return df
+
+
+def test_embedding_store_gathers_rows_by_id(tmp_path) -> None:
+    """
+    The store is memory-mapped, gives the embeddings of any ids in order, and rebuilds the embedded dataset.
+    :return: None
+    """
+    df: DataFrame = embedded_dataset(500)
+    store: EmbeddingStore = EmbeddingStore.save(df, str(tmp_path / 'store'))
+
+    assert isinstance(store.matrix, np.memmap) and store.matrix.mode == 'r'
+    assert len(store) == 500 and store.dimensions == 8
+    wanted: list = [df['id'][42], df['id'][7], df['id'][42]]
+    assert np.array_equal(store.gather(wanted), df.iloc[[42, 7, 42], 2:].to_numpy())
+    assert store.gather(wanted, np.float32).dtype == np.float32
+    assert store.rows([df['id'][3], -1]).tolist() == [3, -1]
+    with pytest.raises(KeyError):
+        store.gather([-1])
+
+    rebuilt: DataFrame = store.to_dataframe()
+    assert rebuilt.equals(df)
+    assert np.shares_memory(rebuilt['embedding_0'].to_numpy(), store.matrix)
+    assert (store.to_dataframe(np.float32).dtypes.iloc[2:] == np.float32).all()
+
+
+def test_storage_rebuilds_embedding_store_when_file_changes(tmp_path, monkeypatch) -> None:
+    """
+    The store of a dataset is built on first load, reused while the dataset does not change, and built again after.
+    :return: None
+    """
+    monkeypatch.setattr(embedding_store, 'EMBEDDING_STORES_DIR', str(tmp_path / 'stores'))
+    local: storage.LocalStorage = storage.LocalStorage(str(tmp_path / 'data'))
+    loads: List[str] = []
+    original_load = local.load
+    monkeypatch.setattr(local, 'load', lambda file_id: loads.append(file_id) or original_load(file_id))
+
+    assert local.save(embedded_dataset(100), 'embedded.parquet', 'folder')
+    first: EmbeddingStore = load_embeddings(local, 'folder/embedded')
+    assert load_embeddings(local, 'folder/embedded').path == first.path and loads == ['folder/embedded']
+
+    assert local.save(embedded_dataset(50, seed=1), 'embedded.parquet', 'folder')
+    second: EmbeddingStore = load_embeddings(local, 'folder/embedded')
+    assert len(loads) == 2 and len(second) == 50
+    assert second.to_dataframe().equals(embedded_dataset(50, seed=1))
+    assert len(first) == 100  # Opened stores keep the pages of the version they mapped
+
+
+class FakeSentenceTransformer:
+    """
+    Stands in for a SentenceTransformer model, embedding a text as its length and a checksum of it
+    """
+    loaded: int = 0
+
+    def __init__(self, model_name: str, device=None) -> None:
+        FakeSentenceTransformer.loaded += 1
+        self.calls: List[List[str]] = []
+
+    def encode(self, texts: List[str], batch_size: int, convert_to_numpy: bool, show_progress_bar: bool) -> np.ndarray:
+        self.calls.append(texts)
+        return np.array([[len(text), sum(map(ord, text)) % 97] for text in texts], dtype=np.float32)
+
+
+def test_sentence_encoder_batches_texts_by_length(tmp_path) -> None:
+    """
+    The model is loaded once, texts are encoded longest first in chunks, and the embeddings are put back in order.
+    :return: None
+    """
+    FakeSentenceTransformer.loaded = 0
+    encoder: SentenceEncoder = SentenceEncoder('fake', factory=FakeSentenceTransformer)
+    repos: DataFrame = DataFrame({'id': [10, 11, 12, 13, 14], 'description': ['ab', 'abcdef', None, 'abcd', 'a']})
+
+    ids, embeddings = encoder.encode_repos(repos, 'description', batch_size=1, dtype=np.float16)
+    assert ids.tolist() == [10, 11, 12, 13, 14]
+    assert embeddings.dtype == np.float16 and embeddings.flags['C_CONTIGUOUS']
+    assert embeddings[:, 0].tolist() == [2, 6, 0, 4, 1]
+    assert [len(text) for call in encoder.model.calls for text in call] == [6, 4, 2, 1, 0]
+
+    cache: EmbeddingCache = EmbeddingCache(str(tmp_path / 'cache.sqlite'))
+    encoder.encode_many(['ab'], cache=cache)
+    assert encoder.encode_many(['abc', 'ab'], cache=cache)[:, 0].tolist() == [3, 2]
+    assert encoder.model.calls[-1] == ['abc']
+    assert FakeSentenceTransformer.loaded == 1
+    assert get_sentence_encoder('fake') is get_sentence_encoder('fake')
+    cache.close()
+
+
+def test_token_bucket_paces_and_pauses() -> None:
+    """
+    The budget refills over a minute, and a pause stops every request.
+    :return: None
+    """
+    bucket: TokenBucket = TokenBucket(600)
+    assert bucket.try_acquire(500) == 0
+    assert bucket.try_acquire(200) == pytest.approx(10, abs=0.1)  # 100 tokens short, at 10 tokens per second
+    assert bucket.try_acquire(2000) == pytest.approx(50, abs=0.1)  # Capped to the capacity
+    bucket.pause(3)
+    assert bucket.try_acquire(1) == pytest.approx(3, abs=0.1)
+
+
+def test_word2vec_vectorizer_matches_the_word_loop() -> None:
+    """
+    The corpus vectorizer averages the known words of every text like vectorize_text did word by word.
+    :return: None
+    """
+    word_vect: KeyedVectors = KeyedVectors(4)
+    word_vect.add_vectors(['python', 'web', 'tool', 'rust'],
+                          np.random.default_rng(0).standard_normal((4, 4)).astype(np.float32))
+    texts: List[str] = ['python web tool', '', 'unknown words', 'rust', 'python web tool', 'web web unknown']
+
+    def word_loop(text: str) -> np.ndarray:
+        known: List[np.ndarray] = [word_vect[word] for word in text.split() if word in word_vect.key_to_index]
+        return np.mean(known, axis=0) if known else np.zeros(4)
+
+    vectorizer: Word2VecVectorizer = Word2VecVectorizer(word_vect, token_cache_size=3)
+    vectors: np.ndarray = vectorizer.vectorize_many(texts)
+    assert vectors.dtype == np.float32 and vectors.shape == (6, 4)
+    assert np.allclose(vectors, np.stack([word_loop(text) for text in texts]), atol=1e-6)
+    assert np.array_equal(vectorizer.vectorize_many(texts[::-1]), vectors[::-1])  # Partly from the token cache
+    assert np.array_equal(vectorize_texts(texts, word_vect), vectors)
+    assert get_word2vec_vectorizer(word_vect) is get_word2vec_vectorizer(word_vect)
+
+
+def test_word2vec_model_is_converted_once_and_memory_mapped(tmp_path, monkeypatch) -> None:
+    """
+    The binary model is converted to the native format on first load, then its vectors are memory-mapped.
+    :return: None
+    """
+    word_vect: KeyedVectors = KeyedVectors(4)
+    word_vect.add_vectors(['python', 'web', 'tool'], np.arange(12, dtype=np.float32).reshape(3, 4))
+    model_path: str = str(tmp_path / 'vectors.bin')
+    native_path: str = str(tmp_path / 'native' / 'vectors.kv')
+    word_vect.save_word2vec_format(model_path, binary=True)
+    conversions: List[str] = []
+    convert = word2vec_vectorizer.convert_word2vec_model
+    monkeypatch.setattr(word2vec_vectorizer, 'convert_word2vec_model',
+                        lambda *paths: conversions.append(paths[0]) or convert(*paths))
+
+    loaded: KeyedVectors = word2vec_vectorizer.load_word2vec_model(model_path, native_path)
+    assert conversions == [model_path]
+    assert isinstance(loaded.vectors, np.memmap) and loaded.vectors.mode == 'r'
+    assert loaded.index_to_key == ['python', 'web', 'tool'] and np.array_equal(loaded.vectors, word_vect.vectors)
+    assert word2vec_vectorizer.load_word2vec_model(model_path, native_path) is loaded
+
+    monkeypatch.setattr(word2vec_vectorizer, '_models', {})
+    assert isinstance(word2vec_vectorizer.load_word2vec_model(model_path, native_path).vectors, np.memmap)
+    assert len(conversions) == 1
+
+
+def test_embedding_store_upserts_rows_in_place(tmp_path) -> None:
+    """
+    Upserting overwrites the rows of known ids and appends the others, without rewriting the embeddings.
+    :return: None
+    """
+    df: DataFrame = embedded_dataset(100)
+    store: EmbeddingStore = EmbeddingStore.save(df, str(tmp_path / 'store'), texts=[f'text {i}' for i in range(100)])
+    update: DataFrame = embedded_dataset(10, seed=1)
+    update['id'] = list(df['id'][:5]) + [-1, -2, -3, -4, -5]
+    update['owner_user'] = 'updated'
+
+    updated: EmbeddingStore = store.upsert(update, texts=[f'new text {i}' for i in range(10)])
+    assert len(updated) == 105 and len(store) == 100
+    assert np.array_equal(updated.gather(update['id']), update.iloc[:, 2:].to_numpy())
+    assert np.array_equal(store.matrix[:5], update.iloc[:5, 2:].to_numpy())  # Overwritten in place
+    assert np.array_equal(updated.gather(df['id'][5:]), df.iloc[5:, 2:].to_numpy())
+    assert updated.to_dataframe()['owner_user'].tolist() == ['updated'] * 5 + df['owner_user'][5:].tolist() + \
+        ['updated'] * 5
+    assert EmbeddingStore(str(tmp_path / 'store')).to_dataframe().equals(updated.to_dataframe())
+
+    texts: List[str] = ['new text 0', 'text 1', 'text 5', 'new text 5', 'another text']
+    assert updated.changed([df['id'][0], df['id'][1], df['id'][5], -1, -6], texts).tolist() == \
+        [False, True, False, False, True]
+    with pytest.raises(ValueError):
+        updated.upsert(update.iloc[[0, 0]])
+
+
+def test_embedding_store_upsert_cut_off_keeps_the_store(tmp_path, monkeypatch) -> None:
+    """
+    An upsert cut off before its metadata is written leaves a store with the rows it had before.
+    :return: None
+    """
+    df: DataFrame = embedded_dataset(100)
+    store: EmbeddingStore = EmbeddingStore.save(df, str(tmp_path / 'store'))
+    update: DataFrame = embedded_dataset(10, seed=1)
+    update['id'] = range(-10, 0)
+
+    def replace(source: str, destination: str) -> None:
+        if destination.endswith('store.json'):
+            raise OSError('Crash')
+        os.replace(source, destination)
+
+    monkeypatch.setattr(embedding_store, 'replace', replace)
+    with pytest.raises(OSError):
+        store.upsert(update)
+    assert EmbeddingStore(str(tmp_path / 'store')).to_dataframe().equals(df)
+
+
+def test_embedding_store_refresh_only_embeds_changed_texts(tmp_path) -> None:
+    """
+    Refreshing a store only embeds the repositories that are new or whose description changed.
+    :return: None
+    """
+    repos: DataFrame = DataFrame({'id': range(20), 'owner_user': [f'owner-{i % 3}' for i in range(20)],
+                                  'description': [f'A tool number {i}' for i in range(20)]})
+    embedded: List[List[int]] = []
+
+    def embed_rows(rows: DataFrame) -> DataFrame:
+        embedded.append(rows['id'].tolist())
+        df: DataFrame = rows[['id', 'owner_user']].reset_index(drop=True)
+        vectors: np.ndarray = np.stack([MockOpenAIServer.embedding(text, 4) for text in rows['description']])
+        return df.join(DataFrame(vectors, columns=[f'embedding_{i}' for i in range(4)]))
+
+    store: EmbeddingStore = EmbeddingStore.save(embed_rows(repos.head(15)), str(tmp_path / 'store'),
+                                                texts=repos['description'][:15].tolist())
+    repos.loc[3, 'description'] = 'A tool that changed'
+    store = store.refresh(repos, 'description', embed_rows)
+    assert embedded[-1] == [3, 15, 16, 17, 18, 19] and len(store) == 20
+    assert store.refresh(repos, 'description', embed_rows) is store and len(embedded) == 2
+    assert np.allclose(store.gather([3]), MockOpenAIServer.embedding('A tool that changed', 4), atol=1e-3)
+
+
+def test_quantized_embeddings_search_the_codes(tmp_path) -> None:
+    """
+    The int8 and product quantized codes find about the same neighbours as the full precision embeddings, all of them
+    once the candidates are scored again at full precision, and they are written and memory-mapped back.
+    :return: None
+    """
+    rng: np.random.Generator = np.random.default_rng(0)
+    vectors: np.ndarray = (rng.standard_normal((3000, 8)) @ rng.standard_normal((8, 32))
+                           + 0.1 * rng.standard_normal((3000, 32))).astype(np.float16)
+    queries: np.ndarray = vectors[:20].astype(np.float32) + 0.05 * rng.standard_normal((20, 32)).astype(np.float32)
+    exact_rows, exact_scores = quantization.exact_search(vectors, queries, 10)
+    assert np.allclose(exact_scores[:, 0], np.max(quantization.normalize_rows(queries) @
+                                                   quantization.normalize_rows(vectors).T, axis=1), atol=1e-5)
+
+    int8: quantization.QuantizedEmbeddings = quantization.QuantizedEmbeddings.build(vectors, 'int8')
+    assert int8.codes.dtype == np.int8 and int8.nbytes < vectors.nbytes
+    rows, scores = int8.search(queries, 10)
+    assert quantization.recall_at_k(exact_rows, rows) > 0.9
+    assert np.allclose(scores[:, 0], exact_scores[:, 0], atol=0.01)
+
+    pq: quantization.QuantizedEmbeddings = quantization.QuantizedEmbeddings.build(vectors, 'pq', subspaces=8)
+    assert pq.codes.shape == (3000, 8) and pq.codes.dtype == np.uint8
+    assert quantization.recall_at_k(exact_rows, pq.search(queries, 10)[0]) > 0.3
+    reranked_rows, reranked_scores = pq.search(queries, 10, vectors=vectors, candidates=50)
+    assert quantization.recall_at_k(exact_rows, reranked_rows) > 0.95
+    assert np.allclose(reranked_scores[:, 0], exact_scores[:, 0], atol=1e-5)
+
+    pq.save(str(tmp_path / 'pq'))
+    loaded: quantization.QuantizedEmbeddings = quantization.QuantizedEmbeddings.load(str(tmp_path / 'pq'))
+    assert isinstance(loaded.codes, np.memmap) and isinstance(loaded.quantizer, quantization.ProductQuantizer)
+    assert np.array_equal(loaded.search(queries, 10)[0], pq.search(queries, 10)[0])
+    with pytest.raises(ValueError):
+        quantization.create_quantizer('binary')
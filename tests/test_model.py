@@ -35,16 +35,16 @@ def test_preprocess_data(sample_data, monkeypatch):
     label_col = 'target'
 
     # Mock the API calls
-    def mock_get_user_repos(username):
-        print("Mock get_user_repos called with username:", username)
-        return [[{'id': 1}, {'id': 6}, {'id': 11}, {'id': 16}, {'id': 21}]]  # Simulate 5 repos owned by user1
+    def mock_iter_user_repos(username):
+        print("Mock iter_user_repos called with username:", username)
+        return iter([{'id': 1}, {'id': 6}, {'id': 11}, {'id': 16}, {'id': 21}])  # Simulate 5 repos owned by user1
 
-    def mock_get_stared_repos(username):
-        return [[{'id': 3}]]  # Simulate 1 starred repo
+    def mock_iter_stared_repos(username):
+        return iter([{'id': 3}])  # Simulate 1 starred repo
     
     # Apply the mock functions
-    monkeypatch.setattr('codecompasslib.models.lightgbm_model.get_user_repos', mock_get_user_repos)
-    monkeypatch.setattr('codecompasslib.models.lightgbm_model.get_stared_repos', mock_get_stared_repos)
+    monkeypatch.setattr('codecompasslib.models.lightgbm_model.iter_user_repos', mock_iter_user_repos)
+    monkeypatch.setattr('codecompasslib.models.lightgbm_model.iter_stared_repos', mock_iter_stared_repos)
     
     # Call the function
     df_merged, starred_or_owned_by_user = preprocess_data(df_embedded, df_non_embedded, label_col, target_user)
@@ -57,15 +57,15 @@ def test_preprocess_data(sample_data, monkeypatch):
 
 def test_generate_lightGBM_recommendations(sample_data, monkeypatch):
     # Mock the API calls
-    def mock_get_user_repos(username):
-        return [[{'id': 1}, {'id': 2}]]  # Simulate 2 repos owned by user1
+    def mock_iter_user_repos(username):
+        return iter([{'id': 1}, {'id': 2}])  # Simulate 2 repos owned by user1
     
-    def mock_get_stared_repos(username):
-        return [[{'id': 3}]]  # Simulate 1 starred repo
+    def mock_iter_stared_repos(username):
+        return iter([{'id': 3}])  # Simulate 1 starred repo
     
     # Apply the mock functions
-    monkeypatch.setattr('codecompasslib.models.lightgbm_model.get_user_repos', mock_get_user_repos)
-    monkeypatch.setattr('codecompasslib.models.lightgbm_model.get_stared_repos', mock_get_stared_repos)
+    monkeypatch.setattr('codecompasslib.models.lightgbm_model.iter_user_repos', mock_iter_user_repos)
+    monkeypatch.setattr('codecompasslib.models.lightgbm_model.iter_stared_repos', mock_iter_stared_repos)
     
     # Prepare sample data
     df_non_embedded, df_embedded = sample_data